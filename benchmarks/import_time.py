@@ -0,0 +1,101 @@
+"""
+Startup time regression check for the stella CLI.
+
+Measures the cumulative import time of `stellapy.stella` using `python -X importtime` and fails if
+it exceeds the budget, or if any of the heavy dependencies are imported eagerly.
+
+Usage:
+    python benchmarks/import_time.py [--budget MS] [--runs N]
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+MODULE = "stellapy.stella"
+DEFAULT_BUDGET = 150  # milliseconds
+# dependencies which must only be imported once they are actually used
+LAZY_MODULES = (
+    "selenium",
+    "watchdog",
+    "jsonschema",
+    "ruamel.yaml",
+    "rich",
+    "gitignorefile",
+    "asyncio",
+)
+
+
+def import_time(module: str) -> float:
+    """
+    Returns the cumulative import time of `module` in milliseconds, in a fresh interpreter.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        _, cumulative, name = line.rsplit("|", 2)
+        if name.strip() == module:
+            return int(cumulative) / 1000
+    raise RuntimeError(f"{module} missing from the -X importtime output")
+
+
+def eager_imports(module: str) -> list[str]:
+    """
+    Returns the lazy modules which are imported along with `module`.
+    """
+    code = (
+        f"import sys, {module}; "
+        f"print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    return [m for m in result.stdout.strip().split(",") if m]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    timings = [import_time(MODULE) for _ in range(args.runs)]
+    median = statistics.median(timings)
+    eager = eager_imports(MODULE)
+    print(
+        json.dumps(
+            {
+                "benchmark": "cli_import_time",
+                "module": MODULE,
+                "median_ms": round(median, 2),
+                "min_ms": round(min(timings), 2),
+                "budget_ms": args.budget,
+                "eager_imports": eager,
+            }
+        )
+    )
+
+    failed = False
+    if median > args.budget:
+        print(
+            f"importing {MODULE} took {median:.1f} ms, over the budget of {args.budget} ms",
+            file=sys.stderr,
+        )
+        failed = True
+    if eager:
+        print(
+            f"importing {MODULE} eagerly imports {', '.join(eager)}", file=sys.stderr
+        )
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
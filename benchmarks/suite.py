@@ -0,0 +1,469 @@
+"""
+Benchmark suite for the watcher and the restart path of stella.
+
+Generates synthetic project trees, with a `node_modules`-style ignored tree as big as the project
+itself, and measures
+    - watch_startup: walking the tree and registering the watches, per `watch_mode`
+    - polling: the first and the following scans of the polling backend
+    - dispatch: the throughput of `GitignoreMatchingEventHandler.dispatch` under an event storm
+    - event_latency: the time from writing a file until the handler sees it and until the
+      debounced callback runs
+    - restart: the latency of `Executor.re_execute` from the kill until a dummy server accepts
+      connections again
+    - import_time: the import time of the CLI
+
+Every result is printed as a JSON line. With --output, all of them are written to a JSON file as
+well, which a later run (eg. of another version of stella) can be compared against with --compare.
+
+Usage:
+    python benchmarks/suite.py [--sizes 1000,10000,100000] [--only NAME,...] [--output FILE]
+        [--compare FILE] [--threshold PERCENT]
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import socket
+import statistics
+import sys
+import tempfile
+from pathlib import Path
+from threading import Event
+from time import monotonic, perf_counter, sleep
+from typing import Any
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from import_time import MODULE, import_time  # noqa: E402
+
+BENCHMARKS = ("watch_startup", "polling", "dispatch", "event_latency", "restart", "import_time")
+DEFAULT_SIZES = "1000,10000"
+FILES_PER_DIRECTORY = 10
+DIRECTORIES_PER_DIRECTORY = 10
+IGNORED_DEPTH = 6  # of the node_modules tree
+STORM_EVENTS = 20000
+DISPATCH_PASSES = 5
+POLL_SCANS = 5
+LATENCY_RUNS = 20
+RESTART_RUNS = 10
+QUIET_WINDOW = 20  # milliseconds, the debounce window of the latency benchmark
+DUMMY_SERVER = """
+import signal, socket, sys
+signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+server = socket.create_server(("127.0.0.1", int(sys.argv[1])))
+while True:
+    server.accept()[0].close()
+"""
+
+
+@contextlib.contextmanager
+def quiet():
+    """
+    Keeps the log messages of stella out of stdout, where they would be mixed up with the results.
+    The logger writes from its own thread, so it's reconfigured to only write errors, as JSON
+    lines to stderr.
+    """
+    from stellapy import logger
+
+    logger.flush()
+    logger.configure("error", "-")
+    try:
+        yield
+    finally:
+        logger.flush()
+        logger.configure()
+
+
+def summary(values: list[float], name: str) -> dict[str, float]:
+    ordered = sorted(values)
+    p95 = ordered[max(int(len(ordered) * 0.95 + 0.5) - 1, 0)]
+    return {
+        f"{name}_p50_ms": round(statistics.median(ordered) * 1000, 3),
+        f"{name}_p95_ms": round(p95 * 1000, 3),
+    }
+
+
+def generate_tree(root: Path, files: int) -> list[str]:
+    """
+    Writes a project of `files` source files, plus an ignored `node_modules` tree of as many
+    files nested `IGNORED_DEPTH` directories deep. Returns the paths of all files, relative to
+    `root`, the way the observer reports them.
+    """
+    (root / ".gitignore").write_text("node_modules/\n__pycache__/\n*.log\n")
+    paths = []
+
+    def directory(base: str, index: int, depth: int) -> str:
+        # spreads the files over a tree with DIRECTORIES_PER_DIRECTORY children per directory
+        parts = []
+        index //= FILES_PER_DIRECTORY
+        for _ in range(depth):
+            parts.append(f"d{index % DIRECTORIES_PER_DIRECTORY}")
+            index //= DIRECTORIES_PER_DIRECTORY
+        return os.path.join(base, *parts)
+
+    depth = 1
+    while FILES_PER_DIRECTORY * DIRECTORIES_PER_DIRECTORY**depth < files:
+        depth += 1
+    for base, tree_depth, extension in (
+        ("src", depth, "py"),
+        ("node_modules", IGNORED_DEPTH, "js"),
+    ):
+        for index in range(files):
+            path = os.path.join(
+                directory(base, index, tree_depth), f"f{index}.{extension}"
+            )
+            absolute = root / path
+            absolute.parent.mkdir(parents=True, exist_ok=True)
+            absolute.write_text(f"# {index}\n")
+            paths.append(os.path.join(".", path))
+    return paths
+
+
+def bench_watch_startup(files: int, paths: list[str]) -> list[dict[str, Any]]:
+    from watchdog.observers import Observer
+
+    from stellapy.walker import GitignoreMatchingEventHandler
+    from stellapy.watches import WatchManager
+
+    results = []
+    for mode in ("recursive", "ignore_aware"):
+        with quiet():
+            started = perf_counter()
+            observer = Observer()
+            handler = GitignoreMatchingEventHandler([], 1000, 3000, lambda _: None)
+            manager = WatchManager(
+                observer, handler, handler.matcher, ".", mode == "ignore_aware"
+            )
+            manager.schedule()
+            scheduled = perf_counter()
+            try:
+                manager.start()
+                error = ""
+            except OSError as e:  # eg. the inotify watch limit
+                error = str(e)
+            registered = perf_counter()
+            handler.stop()
+            if observer.is_alive():
+                observer.stop()
+                observer.join()
+        result = {
+            "benchmark": "watch_startup",
+            "files": files,
+            "mode": mode,
+            "schedule_ms": round((scheduled - started) * 1000, 3),
+            "register_ms": round((registered - scheduled) * 1000, 3),
+            "total_ms": round((registered - started) * 1000, 3),
+            "watches": manager.watch_count,
+        }
+        if error:
+            result["error"] = error
+        results.append(result)
+    return results
+
+
+def bench_polling(files: int, paths: list[str]) -> list[dict[str, Any]]:
+    from stellapy.poller import ScandirPoller
+    from stellapy.walker import GitignoreMatchingEventHandler
+
+    handler = GitignoreMatchingEventHandler([], 60000, 60000, lambda _: None)
+    poller = ScandirPoller(handler, handler.matcher, ".", 60)
+    with quiet():
+        poller.start()
+    first_scan = poller.scan_time
+    scans = []
+    for _ in range(POLL_SCANS):
+        poller.poll()
+        scans.append(poller.scan_time)
+    poller.stop()
+    handler.stop()
+    return [
+        {
+            "benchmark": "polling",
+            "files": files,
+            "first_scan_ms": round(first_scan * 1000, 3),
+            "scan_ms": round(statistics.median(scans) * 1000, 3),
+            "tracked_files": poller.file_count,
+        }
+    ]
+
+
+def bench_dispatch(files: int, paths: list[str]) -> list[dict[str, Any]]:
+    from watchdog.events import FileModifiedEvent
+
+    from stellapy.walker import GitignoreMatchingEventHandler
+
+    # half of the storm hits the ignored tree, like an `npm install` next to an edit
+    step = max(len(paths) // STORM_EVENTS, 1)
+    events = [FileModifiedEvent(path) for path in paths[::step][:STORM_EVENTS]]
+    handler = GitignoreMatchingEventHandler([], 60000, 60000, lambda _: None)
+    result: dict[str, Any] = {"benchmark": "dispatch", "files": files, "events": len(events)}
+    for run in ("cold", "warm"):
+        # the best of a few passes, the others are mostly noise from other processes
+        elapsed = float("inf")
+        for _ in range(DISPATCH_PASSES):
+            if run == "cold":
+                handler.matcher.clear_cache()
+            started = perf_counter()
+            for event in events:
+                handler.dispatch(event)
+            elapsed = min(elapsed, perf_counter() - started)
+        result[f"{run}_events_per_sec"] = round(len(events) / elapsed)
+        result[f"{run}_us_per_event"] = round(elapsed / len(events) * 1e6, 3)
+    handler.stop()
+    return [result]
+
+
+def bench_event_latency(files: int, paths: list[str]) -> list[dict[str, Any]]:
+    from watchdog.observers import Observer
+
+    from stellapy.walker import GitignoreMatchingEventHandler
+    from stellapy.watches import WatchManager
+
+    fired = Event()
+    batches = []
+
+    def callback(batch):
+        batches.append((batch, monotonic()))
+        fired.set()
+
+    with quiet():
+        observer = Observer()
+        handler = GitignoreMatchingEventHandler([], QUIET_WINDOW, 1000, callback)
+        manager = WatchManager(observer, handler, handler.matcher, ".", True)
+        manager.schedule()
+        manager.start()
+    target = Path(next(path for path in paths if path.endswith(".py")))
+    detected, delivered = [], []
+    try:
+        for run in range(LATENCY_RUNS):
+            fired.clear()
+            batches.clear()
+            written = monotonic()
+            target.write_text(f"# run {run}\n")
+            if not fired.wait(5):
+                continue
+            batch, called = batches[0]
+            detected.append(batch.first_event_at - written)
+            delivered.append(called - written)
+            sleep(QUIET_WINDOW / 1000 * 2)
+    finally:
+        handler.stop()
+        observer.stop()
+        observer.join()
+    result: dict[str, Any] = {
+        "benchmark": "event_latency",
+        "files": files,
+        "runs": len(delivered),
+        "quiet_window_ms": QUIET_WINDOW,
+    }
+    if delivered:
+        result.update(summary(detected, "detect"))
+        result.update(summary(delivered, "callback"))
+    return [result]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for_port(port: int, timeout: float = 10) -> bool:
+    deadline = monotonic() + timeout
+    while monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), 0.1).close()
+            return True
+        except OSError:
+            sleep(0.001)
+    return False
+
+
+def bench_restart(workdir: Path) -> list[dict[str, Any]]:
+    from stellapy.configuration import Script
+    from stellapy.executor import Executor
+    from stellapy.timeline import RestartCycle
+
+    server = workdir / "server.py"
+    server.write_text(DUMMY_SERVER)
+    port = _free_port()
+    script = Script("bench", "", f"{sys.executable} {server} {port}", False)
+    # not quiet, the dummy server inherits the real stdout, which a StringIO can't stand in for
+    executor = Executor(script, grace_interval=5000)
+    executor.start()
+    _wait_for_port(port)
+    stop, spawn, listening = [], [], []
+    try:
+        for _ in range(RESTART_RUNS):
+            cycle = RestartCycle("", "bench", "manual")
+            executor.re_execute(cycle=cycle)
+            if not _wait_for_port(port):
+                continue
+            listening.append(monotonic() - cycle.marks["kill_sent"])
+            stop.append(cycle.marks["exited"] - cycle.marks["kill_sent"])
+            spawn.append(cycle.marks["spawned"] - cycle.marks["exited"])
+    finally:
+        executor.shutdown()
+    result: dict[str, Any] = {"benchmark": "restart", "runs": len(listening)}
+    if listening:
+        result.update(summary(stop, "kill_to_exit"))
+        result.update(summary(spawn, "exit_to_spawn"))
+        result.update(summary(listening, "kill_to_listening"))
+    return [result]
+
+
+def bench_import_time() -> list[dict[str, Any]]:
+    timings = [import_time(MODULE) for _ in range(5)]
+    return [
+        {
+            "benchmark": "import_time",
+            "module": MODULE,
+            "median_ms": round(statistics.median(timings), 3),
+            "min_ms": round(min(timings), 3),
+        }
+    ]
+
+
+def run(sizes: list[int], only: set[str]) -> list[dict[str, Any]]:
+    results: list[dict[str, Any]] = []
+
+    def report(new: list[dict[str, Any]]) -> None:
+        for result in new:
+            print(json.dumps(result), flush=True)
+        results.extend(new)
+
+    cwd = os.getcwd()
+    workdir = Path(tempfile.mkdtemp(prefix="stella-bench-"))
+    try:
+        for files in sizes:
+            if not only & {"watch_startup", "polling", "dispatch", "event_latency"}:
+                break
+            root = workdir / f"tree-{files}"
+            root.mkdir()
+            paths = generate_tree(root, files)
+            # stella resolves the ignore files from the working directory
+            os.chdir(root)
+            try:
+                if "watch_startup" in only:
+                    report(bench_watch_startup(files, paths))
+                if "polling" in only:
+                    report(bench_polling(files, paths))
+                if "dispatch" in only:
+                    report(bench_dispatch(files, paths))
+                if "event_latency" in only:
+                    report(bench_event_latency(files, paths))
+            finally:
+                os.chdir(cwd)
+                shutil.rmtree(root, ignore_errors=True)
+        if "restart" in only and os.name != "nt":
+            report(bench_restart(workdir))
+        if "import_time" in only:
+            report(bench_import_time())
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def _key(result: dict[str, Any]) -> tuple:
+    return (result["benchmark"], result.get("files"), result.get("mode"))
+
+
+def compare(baseline: dict[str, Any], results: list[dict[str, Any]], threshold: float) -> int:
+    """
+    Prints how every metric changed against the baseline, returning the number of regressions
+    beyond `threshold` percent. Durations (`_ms`, `_us_per_event`) regress when they grow,
+    throughputs (`_per_sec`) when they shrink.
+    """
+    previous = {_key(result): result for result in baseline.get("results", [])}
+    regressions = 0
+    for result in results:
+        old = previous.get(_key(result))
+        if not old:
+            continue
+        for metric, value in result.items():
+            old_value = old.get(metric)
+            if not isinstance(value, (int, float)) or not isinstance(old_value, (int, float)):
+                continue
+            if metric.endswith(("_ms", "_us_per_event")):
+                lower_is_better = True
+            elif metric.endswith("_per_sec"):
+                lower_is_better = False
+            else:
+                continue
+            if metric == "quiet_window_ms" or not old_value:
+                continue
+            change = (value - old_value) / old_value * 100
+            regressed = change > threshold if lower_is_better else change < -threshold
+            regressions += regressed
+            print(
+                json.dumps(
+                    {
+                        "compare": result["benchmark"],
+                        "files": result.get("files"),
+                        "mode": result.get("mode"),
+                        "metric": metric,
+                        "baseline": old_value,
+                        "current": value,
+                        "change_percent": round(change, 1),
+                        "regressed": regressed,
+                    }
+                )
+            )
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--sizes",
+        default=DEFAULT_SIZES,
+        help=f"comma separated numbers of project files, defaults to {DEFAULT_SIZES}",
+    )
+    parser.add_argument(
+        "--only",
+        default=",".join(BENCHMARKS),
+        help=f"comma separated benchmarks to run, out of {', '.join(BENCHMARKS)}",
+    )
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="compare the results with this JSON file")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=20,
+        help="the change in percent beyond which --compare reports a regression",
+    )
+    args = parser.parse_args()
+
+    only = set(args.only.split(","))
+    unknown = only - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+
+    from stellapy.stella import VERSION
+
+    meta = {
+        "stella": VERSION,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+    print(json.dumps({"meta": meta}), flush=True)
+    results = run(sizes, only)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(json.load(f), results, args.threshold)
+        if regressions:
+            print(f"{regressions} metric(s) regressed by more than {args.threshold}%", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,52 @@
+import json
+import os
+from pathlib import Path
+from typing import Any
+
+
+def cache_dir(*parts: str) -> Path:
+    """
+    Returns the directory stella keeps its on-disk caches in, joined with `parts`. It can be
+    overridden using the `STELLA_CACHE_DIR` environment variable. The directory is not created.
+    """
+    base = os.environ.get("STELLA_CACHE_DIR")
+    if not base:
+        if os.name == "nt":
+            base = os.path.join(
+                os.environ.get("LOCALAPPDATA", os.path.expanduser("~")), "stella"
+            )
+        else:
+            base = os.path.join(
+                os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+                "stella",
+            )
+    return Path(base, *parts)
+
+
+def read_json(path: Path) -> Any | None:
+    """
+    Returns the contents of a JSON cache file, or `None` if it doesn't exist or is corrupted.
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_json(path: Path, data: Any) -> None:
+    """
+    Atomically writes a JSON cache file. Failures are ignored, since caches are only an
+    optimization.
+    """
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
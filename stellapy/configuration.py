@@ -1,25 +1,47 @@
 import json
 import os
-from dataclasses import asdict, dataclass
+from dataclasses import asdict, dataclass, field
+from functools import lru_cache
+from hashlib import sha256
 from io import StringIO
 from logging import exception
 from typing import Any
 
 import importlib.resources
-from jsonschema import Draft6Validator, ValidationError, validate
-from ruamel.yaml import YAML
 
+from stellapy.cache import cache_dir, read_json, write_json
 from stellapy.logger import log
-from stellapy.walker import find_config_file
 
 YAML_SCHEMA_TEXT = "# yaml-language-server: $schema=https://raw.githubusercontent.com/shravanasati/stellapy/master/schema.json \n"
 
 
-def get_json_schema() -> dict[str, Any]:
+@lru_cache(maxsize=None)
+def _get_json_schema_text() -> bytes:
     ref = importlib.resources.files("stellapy").parent / "schema.json"
     with importlib.resources.as_file(ref) as jsonschema_path:
-        with open(str(jsonschema_path)) as f:
-            return json.load(f)
+        with open(str(jsonschema_path), "rb") as f:
+            return f.read()
+
+
+def get_json_schema() -> dict[str, Any]:
+    return json.loads(_get_json_schema_text())
+
+
+@lru_cache(maxsize=None)
+def get_validator():
+    """
+    Returns the validator for the stella configuration, compiled once per process.
+    """
+    from jsonschema import Draft6Validator
+
+    return Draft6Validator(get_json_schema())
+
+
+@lru_cache(maxsize=None)
+def _get_yaml():
+    from ruamel.yaml import YAML
+
+    return YAML()
 
 
 class ConfigFileNotFound(Exception):
@@ -30,6 +52,41 @@ class ConfigFileNotFound(Exception):
     pass
 
 
+class InvalidConfiguration(Exception):
+    """
+    This exception is raised when the configuration doesn't conform to the schema.
+    """
+
+    pass
+
+
+@dataclass(slots=True, frozen=True)
+class ActionRule:
+    """
+    Maps the changed paths matching a gitignore-style pattern to an action.
+    """
+
+    pattern: str
+    action: str  # restart, reload_browser, command or ignore
+    command: str = ""  # for the command action
+
+
+@dataclass(slots=True, frozen=True)
+class Step:
+    """
+    A one-shot command which has to succeed before the script's command is started.
+
+    A step with `inputs` is skipped while none of its input files changed since its last
+    successful run and all of its `outputs` exist.
+    """
+
+    name: str
+    command: str
+    depends_on: list[str] = field(default_factory=list)  # names of other steps
+    inputs: list[str] = field(default_factory=list)  # glob patterns
+    outputs: list[str] = field(default_factory=list)  # glob patterns
+
+
 @dataclass(slots=True, frozen=True)
 class Script:
     """
@@ -40,6 +97,23 @@ class Script:
     url: str
     command: str | list[str]
     shell: bool
+    socket_activation: bool = False
+    readiness: str = "delay"
+    ready_pattern: str = ""
+    readiness_timeout: float = 30000  # milliseconds
+    hot_reload: bool = False
+    preload: list[str] = field(default_factory=list)
+    actions: list[ActionRule] = field(default_factory=list)
+    steps: list[Step] = field(default_factory=list)
+    max_parallel: int = 0  # steps run at a time, 0 means the number of CPUs
+    auto_restart: str = "never"  # or on_failure, always
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]):
+        data = dict(data)
+        data["actions"] = [ActionRule(**rule) for rule in data.get("actions", [])]
+        data["steps"] = [Step(**step) for step in data.get("steps", [])]
+        return cls(**data)
 
 
 @dataclass(slots=True, frozen=True)
@@ -53,6 +127,24 @@ class Configuration:
     poll_interval: float  # milliseconds
     browser_wait_interval: float
     scripts: list[Script]
+    max_wait_interval: float = 3000  # milliseconds
+    watch_mode: str = "recursive"
+    watch_backend: str = "auto"  # or native, polling
+    storm_threshold: int = 1000  # events per second, 0 disables
+    storm_max_paths: int = 1000
+    grace_interval: float = 5000  # milliseconds
+    livereload_port: int = 35729
+    livereload_proxy_port: int = 0  # disabled
+    content_hash: bool = True
+    output: str = "inherit"  # or pipe
+    output_timestamps: bool = False
+    output_history: int = 1000  # lines
+    log_dir: str = ""  # disabled
+    log_max_bytes: int = 10485760
+    log_backups: int = 3
+    timeline: str = ""  # disabled
+    monitor_interval: float = 2000  # milliseconds, 0 disables
+    memory_growth_warning: float = 50  # percent, 0 disables
 
     @classmethod
     def default(cls):
@@ -62,10 +154,28 @@ class Configuration:
             scripts=[Script("default", "", "echo 'hello'", True)],
             poll_interval=500,
             browser_wait_interval=1000,
+            max_wait_interval=3000,
+            watch_mode="recursive",
+            watch_backend="auto",
+            storm_threshold=1000,
+            storm_max_paths=1000,
+            grace_interval=5000,
+            livereload_port=35729,
+            livereload_proxy_port=0,
+            content_hash=True,
+            output="inherit",
+            output_timestamps=False,
+            output_history=1000,
+            log_dir="",
+            log_max_bytes=10485760,
+            log_backups=3,
+            timeline="",
+            monitor_interval=2000,
+            memory_growth_warning=50,
         )
 
     def to_yaml(self):
-        yaml = YAML()
+        yaml = _get_yaml()
         s = StringIO()
         yaml.dump(data=asdict(self), stream=s)
         s.seek(0)
@@ -75,10 +185,13 @@ class Configuration:
 
     @classmethod
     def from_yaml(cls, s: str):
-        yaml = YAML()
-        data = yaml.load(s)
+        return cls.from_dict(_get_yaml().load(s))
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]):
+        data = dict(data)
         # load all scripts as Script (instead of a dictionary) in data
-        scripts = [Script(**script) for script in data.get("scripts", [])]
+        scripts = [Script.from_dict(script) for script in data.get("scripts", [])]
         data["scripts"] = scripts
         return cls(**data)
 
@@ -91,6 +204,53 @@ class Configuration:
         return None
 
 
+@dataclass(slots=True, frozen=True)
+class ConfigCacheKey:
+    """
+    Identifies a particular version of a config file, for the configuration cache.
+    """
+
+    path: str
+    mtime_ns: int
+    digest: str  # of the config file's contents and the schema
+
+    @classmethod
+    def of(cls, path: str, content: bytes):
+        path = os.path.abspath(path)
+        digest = sha256(content)
+        digest.update(_get_json_schema_text())
+        return cls(path, os.stat(path).st_mtime_ns, digest.hexdigest())
+
+    @property
+    def cache_file(self):
+        name = sha256(self.path.encode()).hexdigest()[:32]
+        return cache_dir("config", f"{name}.json")
+
+
+# validated configurations of this process, so that `rc` doesn't even have to hit the disk
+_config_cache: dict[ConfigCacheKey, Configuration] = {}
+
+
+def _load_cached_configuration(key: ConfigCacheKey) -> Configuration | None:
+    config = _config_cache.get(key)
+    if config:
+        return config
+    entry = read_json(key.cache_file)
+    if not entry or entry.get("key") != asdict(key):
+        return None
+    try:
+        config = Configuration.from_dict(entry["config"])
+    except (KeyError, TypeError):
+        return None
+    _config_cache[key] = config
+    return config
+
+
+def _store_cached_configuration(key: ConfigCacheKey, config: Configuration) -> None:
+    _config_cache[key] = config
+    write_json(key.cache_file, {"key": asdict(key), "config": asdict(config)})
+
+
 class ConfigurationManager:
     """
     Base class for stella'a configuration related tasks.
@@ -100,6 +260,8 @@ class ConfigurationManager:
         """
         Constructs the `Configuration` class.
         """
+        from stellapy.walker import find_config_file
+
         self.config_file: str | None = None
 
         # * if a config file is given use it
@@ -125,16 +287,23 @@ class ConfigurationManager:
         #         f.write(self.config.to_yaml())
 
         else:
-            with open(self.config_file) as f:
+            with open(self.config_file, "rb") as f:
                 fc = f.read()
-            self.__config = Configuration.from_yaml(fc)
+            # a cache hit skips both YAML parsing and schema validation
+            self.__cache_key = ConfigCacheKey.of(self.config_file, fc)
+            cached = _load_cached_configuration(self.__cache_key)
+            self.__validated = cached is not None
+            self.__config = cached or Configuration.from_yaml(fc.decode())
 
     def load_configuration(self) -> Configuration:
-        validate(
-            instance=asdict(self.__config),
-            schema=get_json_schema(),
-            cls=Draft6Validator,
-        )
+        if not self.__validated:
+            from jsonschema.exceptions import best_match
+
+            error = best_match(get_validator().iter_errors(asdict(self.__config)))
+            if error is not None:
+                raise InvalidConfiguration(str(error))
+            _store_cached_configuration(self.__cache_key, self.__config)
+            self.__validated = True
         return self.__config
 
 
@@ -169,7 +338,7 @@ def load_configuration_handle_errors(
             IMPROPER_CONFIG_HELP_TEXT,
         )
         exit(1)
-    except ValidationError as ve:
+    except InvalidConfiguration as ve:
         log(
             "error",
             f"{IMPROPER_CONFIG_HELP_TEXT}\nvalidation error: {ve}",
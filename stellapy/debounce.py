@@ -0,0 +1,242 @@
+import os
+from dataclasses import dataclass, field
+from threading import Condition, Thread
+from time import monotonic
+from typing import Callable
+
+from stellapy.logger import log
+
+STORM_WINDOW = 0.25  # seconds over which the event rate is measured
+STORM_QUIET = 1.0  # seconds, the shortest quiet window ending a storm
+
+
+def _is_top_level(directory: str) -> bool:
+    """
+    Returns `True` for the root of the project and the directories right inside it.
+    """
+    parent = os.path.dirname(directory)
+    return parent in ("", ".") or os.path.dirname(parent) == parent
+
+
+@dataclass
+class ChangeBatch:
+    """
+    A deduplicated set of changed paths collected during a single debounce window, along with the
+    event types seen for every path.
+
+    Once a batch holds more than `max_paths` paths, they are collapsed into per-directory summaries,
+    which are folded into their parents until they fit again, but never beyond the top-level
+    directories of the project, so that the summary still tells where the changes are. Later
+    changes below a summarized directory are only counted.
+    """
+
+    changes: dict[str, set[str]] = field(default_factory=dict)
+    # directory to the number of changes below it, once the batch has been collapsed
+    summaries: dict[str, int] = field(default_factory=dict)
+    first_event_at: float = 0.0  # monotonic seconds
+    last_event_at: float = 0.0
+    flushed_at: float = 0.0  # the end of the debounce window
+    event_count: int = 0
+    max_paths: int = 0  # 0 means unbounded
+
+    def add(self, path: str, event_type: str) -> None:
+        now = monotonic()
+        if not self:
+            self.first_event_at = now
+        self.last_event_at = now
+        self.event_count += 1
+        if self.summaries:
+            directory = self.__summary_for(path)
+            if directory is not None:
+                self.summaries[directory] += 1
+                return
+        self.changes.setdefault(path, set()).add(event_type)
+        if self.max_paths and len(self) > self.max_paths:
+            self.__collapse()
+
+    @property
+    def paths(self) -> list[str]:
+        """
+        The changed paths, followed by the summarized directories.
+        """
+        return sorted(self.changes) + sorted(self.summaries)
+
+    @property
+    def collapsed(self) -> bool:
+        return bool(self.summaries)
+
+    def __len__(self) -> int:
+        return len(self.changes) + len(self.summaries)
+
+    def __bool__(self) -> bool:
+        return bool(self.changes or self.summaries)
+
+    def __summary_for(self, path: str) -> str | None:
+        """
+        Returns the summarized directory `path` is in, if any.
+        """
+        parent = os.path.dirname(path)
+        while parent:
+            if parent in self.summaries:
+                return parent
+            parent, previous = os.path.dirname(parent), parent
+            if parent == previous:
+                break
+        return None
+
+    def __collapse(self) -> None:
+        summaries = self.summaries
+        for path, event_types in self.changes.items():
+            directory = os.path.dirname(path) or path
+            summaries[directory] = summaries.get(directory, 0) + len(event_types)
+        self.changes = {}
+        # fold the deepest directories into their parents until the summaries fit
+        while len(summaries) > self.max_paths:
+            foldable = [d for d in summaries if not _is_top_level(d)]
+            if not foldable:
+                break
+            deepest = max(directory.count(os.sep) for directory in foldable)
+            folded: dict[str, int] = {}
+            for directory, count in summaries.items():
+                if directory.count(os.sep) == deepest and not _is_top_level(directory):
+                    directory = os.path.dirname(directory)
+                folded[directory] = folded.get(directory, 0) + count
+            summaries = folded
+        self.summaries = summaries
+
+    def describe(self) -> str:
+        """
+        Returns how many files changed in how many directories, for a collapsed batch.
+        """
+        directories = set(self.summaries)
+        directories.update(os.path.dirname(path) or path for path in self.changes)
+        files = len(self.changes) + sum(self.summaries.values())
+        return f"{files} file(s) in {len(directories)} directories"
+
+
+class Debouncer:
+    """
+    Trailing-edge debouncer which coalesces bursts of filesystem events into a single `ChangeBatch`.
+
+    The callback fires once no new event has arrived for `quiet_interval` seconds, or once
+    `max_wait` seconds have passed since the first event of the batch, whichever comes first. The
+    callback is always invoked from the debouncer's own thread, never from the caller of `push`.
+
+    Events arriving faster than `storm_rate` per second, like during a `git checkout`, start a
+    storm. A storm isn't cut short by `max_wait`, and only ends once the tree has been quiet for
+    at least `STORM_QUIET` seconds, so that it results in a single callback.
+    """
+
+    def __init__(
+        self,
+        quiet_interval: float,
+        max_wait: float,
+        callback: Callable[[ChangeBatch], None],
+        storm_rate: float = 0,
+        max_paths: int = 0,
+    ) -> None:
+        """
+        `storm_rate` is in events per second, 0 disables storm detection. Batches are collapsed
+        beyond `max_paths` paths, 0 means they are unbounded.
+        """
+        self.quiet_interval = quiet_interval
+        self.max_wait = max(max_wait, quiet_interval)
+        self.callback_fn = callback
+        self.storm_rate = storm_rate
+        self.max_paths = max_paths
+        self.storm_count = 0
+        self.__batch = ChangeBatch(max_paths=max_paths)
+        self.__window_start = 0.0  # monotonic seconds
+        self.__window_events = 0
+        self.__in_storm = False
+        self.__cond = Condition()
+        self.__stopped = False
+        self.__thread = Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+    def push(self, path: str, event_type: str) -> None:
+        """
+        Record a change and (re)arm the quiet window.
+        """
+        with self.__cond:
+            self.__batch.add(path, event_type)
+            if self.storm_rate and not self.__in_storm:
+                self.__measure_rate()
+            self.__cond.notify()
+
+    def flush(self) -> None:
+        """
+        Fire the callback for the pending batch right away, if there is one.
+        """
+        with self.__cond:
+            batch = self.__take_batch()
+        if batch:
+            self.callback_fn(batch)
+
+    def stop(self) -> None:
+        """
+        Stop the debouncer thread, dropping any pending changes.
+        """
+        with self.__cond:
+            self.__stopped = True
+            self.__batch = ChangeBatch(max_paths=self.max_paths)
+            self.__cond.notify()
+
+    def __measure_rate(self) -> None:
+        now = self.__batch.last_event_at
+        if now - self.__window_start > STORM_WINDOW:
+            self.__window_start = now
+            self.__window_events = 0
+        self.__window_events += 1
+        if self.__window_events >= self.storm_rate * STORM_WINDOW:
+            self.__in_storm = True
+            self.storm_count += 1
+            log("info", "event storm detected, holding back restarts until the project is quiet")
+
+    def __take_batch(self) -> ChangeBatch:
+        batch = self.__batch
+        batch.flushed_at = monotonic()
+        self.__batch = ChangeBatch(max_paths=self.max_paths)
+        if self.__in_storm:
+            self.__in_storm = False
+            self.__window_events = 0
+            where = batch.describe() if batch.collapsed else f"{len(batch.changes)} path(s)"
+            log(
+                "info",
+                f"event storm of {batch.event_count} event(s) on {where} lasted "
+                f"{batch.last_event_at - batch.first_event_at:.1f} s, handling it as one change",
+            )
+        return batch
+
+    def __deadline(self) -> float:
+        if self.__in_storm:
+            return self.__batch.last_event_at + max(self.quiet_interval, STORM_QUIET)
+        return min(
+            self.__batch.last_event_at + self.quiet_interval,
+            self.__batch.first_event_at + self.max_wait,
+        )
+
+    def __run(self) -> None:
+        while True:
+            with self.__cond:
+                while not self.__stopped and not self.__batch:
+                    self.__cond.wait()
+                if self.__stopped:
+                    return
+
+                # keep sleeping until the window is quiet or the max wait cap is hit
+                while not self.__stopped and self.__batch:
+                    remaining = self.__deadline() - monotonic()
+                    if remaining <= 0:
+                        break
+                    self.__cond.wait(remaining)
+                if self.__stopped:
+                    return
+
+                batch = self.__take_batch()
+
+            if batch:
+                try:
+                    self.callback_fn(batch)
+                except Exception as e:
+                    log("error", f"an error occurred while handling file changes: {e}")
@@ -1,12 +1,33 @@
 import os
 import shlex
 import signal
+import socket
 import subprocess
 import sys
+from dataclasses import dataclass
+from functools import lru_cache
 from platform import system
+from time import perf_counter, sleep
+from typing import Callable
 
 from stellapy.configuration import Script
+from stellapy.hotreload import (
+    HotReloadController,
+    build_hot_reload_controller,
+    python_target,
+)
+from stellapy.listener import (
+    bind_listener,
+    listener_env,
+    pass_listener,
+    with_listen_pid,
+)
 from stellapy.logger import log
+from stellapy.output import OutputMultiplexer
+from stellapy.steps import StepRunner
+from stellapy.supervisor import Supervisor
+from stellapy.timeline import RestartCycle
+from stellapy.zygote import ForkedProcess, Zygote, ZygoteStats
 
 WINDOWS = system() == "Windows"
 
@@ -28,7 +49,112 @@ def _test_powershell() -> bool:
             dummy_stdout.close()
 
 
-PWSH_PRESENT = _test_powershell()
+@lru_cache(maxsize=None)
+def powershell_present() -> bool:
+    """
+    Returns `True` if stella is running on Windows and powershell is available. The check spawns a
+    process, so it's only done once, and never on other systems.
+    """
+    return WINDOWS and _test_powershell()
+
+
+PROC_PRESENT = os.path.isdir("/proc/self")
+STOP_POLL_INTERVAL = 0.01  # seconds, doubled after every check of the processes left
+STOP_POLL_MAX_INTERVAL = 0.2  # seconds
+
+
+def _children_map() -> dict[int, list[int]]:
+    """
+    Returns a mapping of pid to the pids of its children, read from `/proc`.
+    """
+    children: dict[int, list[int]] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "rb") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # the process name is in parentheses and may contain spaces, so split after it
+        ppid = int(stat[stat.rindex(b")") + 2 :].split()[1])
+        children.setdefault(ppid, []).append(int(entry))
+    return children
+
+
+def _process_tree(*pids: int) -> set[int]:
+    """
+    Returns `pids` along with the pids of all their descendants. Only `pids` themselves are
+    returned on systems without `/proc`.
+    """
+    tree = set(pids)
+    if not PROC_PRESENT:
+        return tree
+    children = _children_map()
+    stack = list(pids)
+    while stack:
+        for child in children.get(stack.pop(), []):
+            if child not in tree:
+                tree.add(child)
+                stack.append(child)
+    return tree
+
+
+def _is_alive(pid: int) -> bool:
+    """
+    Returns `True` if the process `pid` is running. Zombies are considered dead.
+    """
+    if PROC_PRESENT:
+        try:
+            with open(f"/proc/{pid}/stat", "rb") as f:
+                stat = f.read()
+        except OSError:
+            return False
+        return stat[stat.rindex(b")") + 2 : stat.rindex(b")") + 3] != b"Z"
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _signal_tree(pids: set[int], pgid: int | None, sig: int) -> None:
+    """
+    Sends `sig` to the process group `pgid` and to every pid in `pids` outside of it, so that
+    descendants which moved to their own session or group are reached as well.
+    """
+    group_signalled = False
+    if pgid is not None:
+        try:
+            os.killpg(pgid, sig)  # type: ignore (unix based systems)
+            group_signalled = True
+        except (ProcessLookupError, PermissionError):
+            pass
+    for pid in pids:
+        try:
+            if group_signalled and os.getpgid(pid) == pgid:  # type: ignore (unix based systems)
+                continue
+            os.kill(pid, sig)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+
+@dataclass
+class StopTiming:
+    """
+    Durations (in seconds) of the phases of the last stop.
+    """
+
+    graceful: float = 0.0  # from the graceful signal until the tree exited or the grace period ran out
+    forced: float = 0.0  # from SIGKILL until the tree exited
+    escalated: bool = False
+    leftover: int = 0  # processes still alive after the kill
+
+    @property
+    def total(self) -> float:
+        return self.graceful + self.forced
 
 
 class Executor:
@@ -36,13 +162,60 @@ class Executor:
     base class for executing processes.
     """
 
-    def __init__(self, script: Script) -> None:
+    def __init__(
+        self,
+        script: Script,
+        grace_interval: float = 5000,
+        output: OutputMultiplexer | None = None,
+        supervisor: Supervisor | None = None,
+        before_spawn: Callable[[], None] | None = None,
+    ) -> None:
+        """
+        `grace_interval` is the duration in milliseconds the process tree is given to exit on its
+        own when closed, before it is killed. If `output` is given, the output of the process is
+        piped through it, otherwise the process writes to the terminal directly. Every started
+        process is followed by the `supervisor`, a default one if not given. `before_spawn` is
+        called right before every start of the app, after its steps.
+        """
         self.__command, self.shell = self.build_command(script)
+        self.hot_reloader: HotReloadController | None = None
+        if script.hot_reload:
+            self.hot_reloader = self.__build_hot_reloader()
+        self.zygote: Zygote | None = None
+        self.zygote_stats = ZygoteStats()
+        if script.preload:
+            self.zygote = self.__build_zygote(script.preload)
+        self.step_runner: StepRunner | None = None
+        if script.steps:
+            try:
+                self.step_runner = StepRunner(
+                    script.steps, script.max_parallel, script.name, output
+                )
+            except ValueError as e:
+                log("error", f"invalid steps in script `{script.name}`: {e}")
+                exit(1)
+        self.last_restart = 0.0  # seconds
+        self.output = output
+        self.supervisor = supervisor or Supervisor()
+        self.before_spawn = before_spawn
+        self.__process: subprocess.Popen | ForkedProcess | None = None
+        self.grace_period = grace_interval / 1000
+        self.last_stop = StopTiming()
+        self.listener: socket.socket | None = None
+        if script.socket_activation:
+            self.listener = self.__bind_listener(script)
         self.command_to_display = (
             self.__command
             if isinstance(self.__command, str)
             else " ".join(self.__command)
         )
+        if self.listener and self.shell and "exec " not in self.command_to_display:
+            # sd_listen_fds style apps ignore a socket meant for another pid
+            log(
+                "warning",
+                "with `shell: true` `LISTEN_PID` is the pid of the shell, `exec` the server in the "
+                "command so that it matches",
+            )
         # print(self.__command, sel.shell)
 
     @staticmethod
@@ -88,6 +261,7 @@ class Executor:
 
         4. Raise a type error because we don't identify the command type.
         """
+        PWSH_PRESENT = powershell_present()
         if isinstance(script.command, str):
             if PWSH_PRESENT and WINDOWS:
                 return (
@@ -135,43 +309,387 @@ class Executor:
                 f"invalid type of {script.command=}, {type(script.command)=}"
             )
 
-    def start(self):
+    def start(self, cycle: RestartCycle | None = None):
+        """
+        Runs the steps and starts the app, marking the phases in `cycle` if given.
+        """
+        if self.step_runner:
+            succeeded = self.step_runner.run()
+            if cycle:
+                cycle.mark("steps_finished")
+            if not succeeded:
+                if not self.step_runner.cancelled:
+                    log("error", "a step failed, waiting for file changes to restart...")
+                return
+        if self.before_spawn:
+            self.before_spawn()
+        stdout, stderr = (
+            (subprocess.PIPE, subprocess.PIPE)
+            if self.pipes_output
+            else (sys.stdout, sys.stderr)
+        )
+        env = None
+        if self.hot_reloader:
+            self.hot_reloader.expect_worker()
+            env = self.hot_reloader.env()
+        env = self.__output_env(env)
+        if self.zygote and self.__fork_from_zygote(env):
+            if cycle:
+                cycle.mark("spawned")
+            self.supervisor.watch(self.__process)  # type: ignore (set when forking)
+            return
         try:
             if WINDOWS:
                 self.__process = subprocess.Popen(
                     self.__command,
-                    stdout=sys.stdout,
-                    stderr=sys.stderr,
+                    stdout=stdout,
+                    stderr=stderr,
+                    env=env,
                     creationflags=subprocess.CREATE_NEW_PROCESS_GROUP,
-                    shell=False if PWSH_PRESENT else True,
+                    shell=False if powershell_present() else True,
                     # setting shell False if we want to execute commands using pwsh,
                     # if pwsh not available, use cmd.exe as fallback, which is done by python
                 )
             else:
+                command, shell = self.__spawn_command()
                 self.__process = subprocess.Popen(
-                    self.__command,
-                    stdout=sys.stdout,
-                    stderr=sys.stderr,
-                    preexec_fn=os.setsid,  # type: ignore (unix based systems)
-                    shell=self.shell,
+                    command,
+                    stdout=stdout,
+                    stderr=stderr,
+                    env=self.__listener_env(env),
+                    preexec_fn=self.__preexec,
+                    shell=shell,
+                    # the passed socket lives at fd 3, which close_fds would close again
+                    close_fds=self.listener is None,
                 )
         except Exception as e:
             log("error", "the app crashed, waiting for file changes to restart...")
             print(e)
+            return
+
+        if cycle:
+            cycle.mark("spawned")
+        if self.output:
+            self.output.attach(self.__process.stdout, self.__process.stderr)
+        self.supervisor.watch(self.__process)
+
+    def __fork_from_zygote(self, env: dict[str, str] | None) -> bool:
+        """
+        Starts the app as a fork of the zygote, (re)building the zygote first if needed. Returns
+        `False` if the app has to be started the regular way.
+        """
+        assert self.zygote
+        warm = self.zygote.alive
+        if not warm and not self.__start_zygote():
+            self.zygote_stats.misses += 1
+            return False
+        _, target = python_target(self.__command)  # type: ignore (checked when building)
+        # the zygote worker sets `LISTEN_PID` in the forked child itself
+        process = self.zygote.fork(target, self.__listener_env(env) or dict(os.environ))
+        if process is None:
+            self.zygote_stats.misses += 1
+            return False
+        self.__process = process
+        if warm:
+            self.zygote_stats.hits += 1
+        else:
+            self.zygote_stats.misses += 1
+        return True
+
+    def __start_zygote(self) -> bool:
+        assert self.zygote
+        self.zygote.close()
+        fd, env = self.zygote.prepare()
+        env = self.__output_env(env)
+        stdout, stderr = (
+            (subprocess.PIPE, subprocess.PIPE)
+            if self.pipes_output
+            else (sys.stdout, sys.stderr)
+        )
+        # the forked children inherit the zygote's output and the passed socket at fd 3
+        try:
+            process = subprocess.Popen(
+                self.zygote.command,
+                stdout=stdout,
+                stderr=stderr,
+                env=env,
+                preexec_fn=self.__preexec,
+                close_fds=self.listener is None,
+                pass_fds=(fd,) if self.listener is None else (),
+            )
+        except OSError as e:
+            log("error", f"unable to start the zygote, starting the app directly: {e}")
+            return False
+        self.zygote.attach(process)
+        if self.output:
+            self.output.attach(process.stdout, process.stderr)
+        if not self.zygote.wait_ready():
+            log("error", "the zygote didn't start, starting the app directly")
+            self.zygote.close()
+            return False
+        return True
+
+    @property
+    def pipes_output(self) -> bool:
+        return self.output is not None
 
-    def re_execute(self):
+    def __output_env(self, env: dict[str, str] | None) -> dict[str, str] | None:
+        """
+        Python buffers its output when it isn't written to a terminal, which would hold the lines
+        of a piped app back until the buffer fills up.
+        """
+        if not self.pipes_output or "PYTHONUNBUFFERED" in (env or os.environ):
+            return env
+        return {**(env or os.environ), "PYTHONUNBUFFERED": "1"}
+
+    def __spawn_command(self) -> tuple[list[str] | str, bool]:
+        """
+        Returns the command to start the app with and whether to run it in a shell. With socket
+        activation the command is wrapped so that `LISTEN_PID` is set to the pid it runs as, which
+        is the one of the shell with `shell: true`, unless the shell `exec`s the app.
+        """
+        if not self.listener:
+            return self.__command, self.shell
+        command = self.__command
+        argv = command if isinstance(command, list) else [command]
+        if self.shell:
+            # what `subprocess` runs for `shell=True`
+            argv = ["/bin/sh", "-c", *argv]
+        return with_listen_pid(argv), False
+
+    def __listener_env(self, env: dict[str, str] | None) -> dict[str, str] | None:
+        return listener_env(env) if self.listener else env
+
+    def __preexec(self):
+        os.setsid()  # type: ignore (unix based systems)
+        if self.listener:
+            pass_listener(self.listener.fileno())
+
+    @staticmethod
+    def __bind_listener(script: Script) -> socket.socket | None:
+        if WINDOWS:
+            log("error", "socket activation is not supported on windows, ignoring it")
+            return None
+        if not script.url:
+            log("error", "socket activation requires the script's `url`, ignoring it")
+            return None
+        try:
+            return bind_listener(script.url)
+        except (OSError, ValueError) as e:
+            log(
+                "error",
+                f"unable to listen at `{script.url}` for socket activation, ignoring it: {e}",
+            )
+            return None
+
+    def __build_hot_reloader(self) -> HotReloadController | None:
+        if not isinstance(self.__command, list):
+            log("error", "hot reload doesn't support chained commands, ignoring it")
+            return None
+        hot_reloader = build_hot_reload_controller(self.__command)
+        if hot_reloader:
+            # the worker is started directly, without a shell in between
+            self.__command, self.shell = hot_reloader.command, False
+        return hot_reloader
+
+    def __build_zygote(self, modules: list[str]) -> Zygote | None:
+        if WINDOWS:
+            log("error", "preloading isn't supported on windows, ignoring it")
+            return None
+        split = None
+        if isinstance(self.__command, list):
+            split = python_target(self.__command)
+        if split is None:
+            log(
+                "error",
+                "preloading needs a `python script.py` or `python -m module` command, ignoring it",
+            )
+            return None
+        return Zygote(split[0], modules)
+
+    def re_execute(
+        self,
+        changed: list[str] | None = None,
+        cycle: RestartCycle | None = None,
+        changed_dirs: list[str] | None = None,
+    ):
+        """
+        Restarts the app. `changed` are the paths whose changes caused the restart, if known, and
+        `changed_dirs` the directories with changes to unknown files; the zygote is rebuilt if they
+        make it stale. The phases of the restart are marked in `cycle`, if given.
+        """
+        started = perf_counter()
+        if cycle:
+            cycle.mark("kill_sent")
         self.close()
-        self.start()
+        if cycle:
+            cycle.mark("exited")
+        zygote = self.zygote
+        if (
+            zygote
+            and zygote.alive
+            and (changed or changed_dirs)
+            and zygote.is_stale(changed or [], changed_dirs)
+        ):
+            log("info", "the preloaded modules have changed, rebuilding the zygote")
+            self.zygote_stats.rebuilds += 1
+            zygote.close()
+        self.start(cycle)
+        self.last_restart = perf_counter() - started
+        if self.zygote:
+            stats = self.zygote_stats
+            log(
+                "stella",
+                f"restarted in {self.last_restart * 1000:.0f} ms, zygote hit rate "
+                f"{stats.hit_rate:.0%} ({stats.hits}/{stats.hits + stats.misses})",
+            )
+
+    def hot_reload(self, paths: list[str]) -> bool:
+        """
+        Reloads the modules loaded from `paths` inside the running app, if the script is in hot
+        reload mode. Returns `False` if the app needs a full restart instead.
+        """
+        if not self.hot_reloader or not self.__process:
+            return False
+        if self.__process.poll() is not None:
+            return False
+        result = self.hot_reloader.reload(paths)
+        if not result.ok:
+            log("info", f"hot reload not possible, restarting: {result.restart_reason}")
+            return False
+        modules = f" ({', '.join(result.reloaded)})" if result.reloaded else ""
+        log(
+            "info",
+            f"hot reloaded {len(result.reloaded)} module(s){modules} in {result.seconds * 1000:.0f} ms",
+        )
+        return True
 
     def close(self):
+        """
+        Stops the process along with all of its descendants, and waits until they've exited.
+
+        The graceful signal (`SIGTERM`, or `CTRL_BREAK_EVENT` on Windows) is sent first. Processes
+        still alive after the grace period are killed, so a new process never races the old one for
+        resources like ports.
+        """
+        if self.step_runner:
+            self.step_runner.cancel()
+        if not self.__process:
+            return
+        self.supervisor.release()
         try:
             if WINDOWS:
-                self.__process.send_signal(signal.CTRL_BREAK_EVENT)
+                self.__close_windows(self.__process)
             else:
-                os.killpg(os.getpgid(self.__process.pid), signal.SIGTERM)  # type: ignore
+                self.__close_unix(self.__process)
         except Exception as e:
             print(e)
             log("error", "the app crashed, waiting for file changes to restart...")
+        finally:
+            self.__process = None
+
+        if self.last_stop.escalated:
+            log(
+                "error",
+                f"the app didn't exit within {self.grace_period * 1000:.0f} ms, killed it",
+            )
+        if self.last_stop.leftover:
+            log(
+                "error",
+                f"{self.last_stop.leftover} process(es) of the app are still alive after being killed",
+            )
+
+    def shutdown(self):
+        """
+        Closes the process and releases the listening socket, the hot reload controller, the
+        zygote and the output, if any.
+        """
+        self.close()
+        if self.listener:
+            self.listener.close()
+            self.listener = None
+        if self.hot_reloader:
+            self.hot_reloader.close()
+            self.hot_reloader = None
+        if self.zygote:
+            self.zygote.close()
+        if self.output:
+            self.output.close()
+
+    def __close_unix(self, process: subprocess.Popen | ForkedProcess):
+        # snapshot the tree before signalling, children get reparented once their parent exits
+        tree = _process_tree(process.pid)
+        try:
+            pgid = os.getpgid(process.pid)  # type: ignore (unix based systems)
+        except ProcessLookupError:
+            pgid = None
+        timing = StopTiming()
+
+        started = perf_counter()
+        _signal_tree(tree, pgid, signal.SIGTERM)
+        alive = self.__wait_for_tree(process, tree, self.grace_period)
+        timing.graceful = perf_counter() - started
+
+        if alive:
+            timing.escalated = True
+            started = perf_counter()
+            _signal_tree(alive, pgid, signal.SIGKILL)  # type: ignore (unix based systems)
+            alive = self.__wait_for_tree(process, alive, self.grace_period)
+            timing.forced = perf_counter() - started
+            timing.leftover = len(alive)
+
+        self.last_stop = timing
+
+    def __close_windows(self, process: subprocess.Popen):
+        timing = StopTiming()
+        started = perf_counter()
+        process.send_signal(signal.CTRL_BREAK_EVENT)  # type: ignore (windows)
+        try:
+            process.wait(self.grace_period)
+        except subprocess.TimeoutExpired:
+            timing.escalated = True
+        timing.graceful = perf_counter() - started
+
+        if timing.escalated:
+            started = perf_counter()
+            subprocess.run(
+                ["taskkill", "/T", "/F", "/PID", str(process.pid)],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            try:
+                process.wait(self.grace_period)
+            except subprocess.TimeoutExpired:
+                timing.leftover = 1
+            timing.forced = perf_counter() - started
+
+        self.last_stop = timing
+
+    @staticmethod
+    def __wait_for_tree(
+        process: subprocess.Popen | ForkedProcess, tree: set[int], timeout: float
+    ) -> set[int]:
+        """
+        Waits up to `timeout` seconds for every process in `tree` to exit. The app itself is waited
+        for first, since it usually takes its children along, the processes left are then checked
+        with a growing interval. Returns the pids still alive.
+        """
+        deadline = perf_counter() + timeout
+        try:
+            # also reaps our direct child, otherwise it stays around as a zombie
+            process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            pass
+        alive = {pid for pid in tree if _is_alive(pid)}
+        interval = STOP_POLL_INTERVAL
+        while alive:
+            remaining = deadline - perf_counter()
+            if remaining <= 0:
+                break
+            sleep(min(interval, remaining))
+            interval = min(interval * 2, STOP_POLL_MAX_INTERVAL)
+            alive = {pid for pid in alive if _is_alive(pid)}
+        return alive
 
 
 if __name__ == "__main__":
@@ -0,0 +1,156 @@
+import mmap
+import os
+from hashlib import blake2b, sha256
+from threading import Lock, Thread
+from time import time_ns
+
+from stellapy.cache import cache_dir, read_json, write_json
+from stellapy.debounce import ChangeBatch
+from stellapy.logger import log
+
+MMAP_THRESHOLD = 1 << 20  # bytes, larger files are hashed through mmap
+READ_CHUNK_SIZE = 1 << 16  # bytes
+DIGEST_SIZE = 16  # bytes
+# nanoseconds, the coarsest mtime resolution around (FAT), see `ContentIndex`
+RACY_WINDOW = 2_000_000_000
+# directory events which matter by themselves, modifications are reported for their files too
+STRUCTURAL_EVENT_TYPES = {"created", "deleted", "moved"}
+
+
+def hash_file(path: str, size: int) -> str:
+    """
+    Returns a hex digest of the contents of the file at `path`, whose size is `size`.
+    """
+    digest = blake2b(digest_size=DIGEST_SIZE)
+    with open(path, "rb") as f:
+        if size >= MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                digest.update(m)
+        else:
+            for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ContentIndex:
+    """
+    A persisted index of the contents of the watched files, used to tell changes apart from events
+    which didn't change any bytes, like a file being saved without edits, touched by a formatter, or
+    restored by a `git stash` round-trip.
+
+    Every entry holds the size, mtime and content hash of a file, and when it was recorded. Files
+    whose size and mtime match their entry are assumed unchanged, others are hashed again. Like
+    git's racy-clean rule, entries recorded within `RACY_WINDOW` of their mtime are always hashed
+    again, since on filesystems with coarse timestamps a same-sized edit right after the entry
+    was recorded keeps the mtime. The index is built lazily: the
+    entries saved by earlier runs are loaded in a background thread on startup, and a file gets an
+    entry on its first event, so the tree is never walked nor hashed up front.
+    """
+
+    def __init__(self, root: str = ".") -> None:
+        self.root = os.path.abspath(root)
+        name = sha256(self.root.encode()).hexdigest()[:32]
+        self.cache_file = cache_dir("hashes", f"{name}.json")
+        self.suppressed_events = 0
+        self.suppressed_restarts = 0
+        # relative path to [size, mtime_ns, digest, recorded_ns]
+        self.__entries: dict[str, list] = {}
+        self.__lock = Lock()
+        self.__dirty = False
+        self.__thread: Thread | None = None
+
+    def build(self) -> None:
+        """
+        Loads the persisted index in a background thread.
+        """
+        self.__thread = Thread(target=self.__build, daemon=True)
+        self.__thread.start()
+
+    def save(self) -> None:
+        with self.__lock:
+            if not self.__dirty:
+                return
+            entries = dict(self.__entries)
+            self.__dirty = False
+        write_json(self.cache_file, {"root": self.root, "entries": entries})
+
+    def filter(self, batch: ChangeBatch) -> ChangeBatch:
+        """
+        Returns a batch with only the paths from `batch` whose contents have changed, updating the
+        index along the way. Paths not in the index yet are considered changed, and so are the
+        directories summarizing a collapsed batch.
+        """
+        changed = ChangeBatch(
+            summaries=dict(batch.summaries),
+            first_event_at=batch.first_event_at,
+            last_event_at=batch.last_event_at,
+            flushed_at=batch.flushed_at,
+            max_paths=batch.max_paths,
+        )
+        for path, event_types in batch.changes.items():
+            if self.has_changed(path, event_types):
+                changed.changes[path] = event_types
+            else:
+                self.suppressed_events += 1
+        changed.event_count = batch.event_count if changed else 0
+        if not changed:
+            self.suppressed_restarts += 1
+        return changed
+
+    def has_changed(self, path: str, event_types: set[str] | None = None) -> bool:
+        key = self.__key(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            # deleted, the index only knows the files it has seen, so a file missing from it only
+            # didn't change anything if it was created since, like temporary files written by
+            # editors
+            with self.__lock:
+                existed = self.__entries.pop(key, None) is not None
+                self.__dirty = self.__dirty or existed
+            return existed or "created" not in (event_types or set())
+        if os.path.isdir(path):
+            return bool(STRUCTURAL_EVENT_TYPES & (event_types or set()))
+        return self.__update(key, path, stat)
+
+    def __key(self, path: str) -> str:
+        return os.path.relpath(os.path.abspath(path), self.root)
+
+    def __update(self, key: str, path: str, stat: os.stat_result) -> bool:
+        """
+        Brings the entry of a file up to date, returning `True` if its contents changed.
+        """
+        with self.__lock:
+            entry = self.__entries.get(key)
+        if (
+            entry
+            and entry[0] == stat.st_size
+            and entry[1] == stat.st_mtime_ns
+            and not self.__is_racy(entry)
+        ):
+            return False
+        # taken before reading, so that an edit made while hashing leaves the entry racy
+        recorded = time_ns()
+        try:
+            digest = hash_file(path, stat.st_size)
+        except (OSError, ValueError):
+            return True
+        with self.__lock:
+            self.__entries[key] = [stat.st_size, stat.st_mtime_ns, digest, recorded]
+            self.__dirty = True
+        return entry is None or entry[2] != digest
+
+    @staticmethod
+    def __is_racy(entry: list) -> bool:
+        # entries saved by older versions don't know when they were recorded
+        return len(entry) < 4 or entry[3] - entry[1] < RACY_WINDOW
+
+    def __build(self) -> None:
+        cached = read_json(self.cache_file)
+        if not cached or cached.get("root") != self.root:
+            return
+        with self.__lock:
+            # entries updated by events in the meantime are more recent
+            self.__entries = {**cached.get("entries", {}), **self.__entries}
+            count = len(self.__entries)
+        log("stella", f"loaded the content hashes of {count} file(s)")
@@ -0,0 +1,175 @@
+import json
+import os
+import re
+import socket
+from dataclasses import dataclass, field
+from pathlib import Path
+from threading import Lock, Thread
+
+from stellapy.logger import log
+
+WORKER_PATH = Path(__file__).with_name("hotreload_worker.py")
+ADDRESS_ENV = "STELLA_HOT_RELOAD_ADDRESS"  # keep in sync with hotreload_worker.py
+LISTEN_HOST = "127.0.0.1"
+CONNECT_TIMEOUT = 30  # seconds, for the worker to connect after the app was started
+RELOAD_TIMEOUT = 30  # seconds
+
+PYTHON_EXECUTABLE = re.compile(r"^(python|pypy)(\d+(\.\d+)?)?(\.exe)?$", re.IGNORECASE)
+# interpreter options which don't take a value, and don't change what is executed
+PYTHON_FLAGS = {"-u", "-B", "-O", "-OO", "-E", "-s", "-S", "-q", "-b", "-bb", "-d"}
+
+
+def python_target(command: list[str]) -> tuple[list[str], list[str]] | None:
+    """
+    Splits a python command like `python -u app.py --debug` or `python3 -m app` into the
+    interpreter and its options (`['python', '-u']`) and the target (`['app.py', '--debug']` or
+    `['-m', 'app']`). Returns `None` if the command doesn't run a python script or module.
+    """
+    if not command or not PYTHON_EXECUTABLE.match(os.path.basename(command[0])):
+        return None
+    index = 1
+    while index < len(command) and command[index] in PYTHON_FLAGS:
+        index += 1
+    target = command[index:]
+    if not target:
+        return None
+    if target[0] == "-m":
+        return (command[:index], target) if len(target) > 1 else None
+    if target[0].startswith("-"):
+        return None
+    return command[:index], target
+
+
+@dataclass
+class HotReloadResult:
+    """
+    The outcome of a hot reload request.
+    """
+
+    reloaded: list[str] = field(default_factory=list)  # names of the reloaded modules
+    restart_reason: str = ""  # why a full restart is needed instead, if it is
+    seconds: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return not self.restart_reason
+
+
+class HotReloadController:
+    """
+    Stella's side of the hot reload mode.
+
+    The app is run by `hotreload_worker.py` using the app's own interpreter, which connects back to
+    the controller after it starts. The controller then sends it the paths of the changed files,
+    and the worker reloads the affected modules in place, or answers that a full restart is
+    needed.
+    """
+
+    def __init__(self, command: list[str]) -> None:
+        """
+        `command` is the split python command of the script, which must be accepted by
+        `python_target`.
+        """
+        split = python_target(command)
+        if split is None:
+            raise ValueError(f"`{' '.join(command)}` doesn't run a python script")
+        interpreter, target = split
+        self.command = interpreter + [str(WORKER_PATH)] + target
+        self.__server = socket.create_server((LISTEN_HOST, 0))
+        self.__server.settimeout(CONNECT_TIMEOUT)
+        self.__lock = Lock()
+        self.__connection: socket.socket | None = None
+        self.__stream = None
+
+    @property
+    def address(self) -> str:
+        host, port = self.__server.getsockname()[:2]
+        return f"{host}:{port}"
+
+    @property
+    def connected(self) -> bool:
+        return self.__stream is not None
+
+    def env(self) -> dict[str, str]:
+        """
+        Returns the environment to start the worker with.
+        """
+        return dict(os.environ, **{ADDRESS_ENV: self.address})
+
+    def expect_worker(self) -> None:
+        """
+        Drops the connection to the previous worker and waits for the freshly started one to
+        connect, in a background thread.
+        """
+        self.disconnect()
+        Thread(target=self.__accept, daemon=True).start()
+
+    def reload(self, paths: list[str]) -> HotReloadResult:
+        """
+        Asks the worker to reload the modules loaded from `paths`.
+        """
+        with self.__lock:
+            if self.__stream is None:
+                return HotReloadResult(restart_reason="the worker isn't connected")
+            try:
+                self.__stream.write(json.dumps({"paths": paths}).encode() + b"\n")
+                line = self.__stream.readline()
+            except OSError as e:
+                line = b""
+                error = e
+            else:
+                error = "the worker exited"
+            if not line:
+                self.__disconnect()
+                return HotReloadResult(restart_reason=str(error))
+
+        reply = json.loads(line)
+        return HotReloadResult(
+            reloaded=reply.get("reloaded", []),
+            restart_reason=reply.get("reason", "") if reply["status"] != "ok" else "",
+            seconds=reply.get("seconds", 0.0),
+        )
+
+    def disconnect(self) -> None:
+        with self.__lock:
+            self.__disconnect()
+
+    def close(self) -> None:
+        self.disconnect()
+        self.__server.close()
+
+    def __disconnect(self) -> None:
+        if self.__connection:
+            self.__connection.close()
+        self.__connection = None
+        self.__stream = None
+
+    def __accept(self) -> None:
+        try:
+            connection, _ = self.__server.accept()
+        except OSError:
+            # timed out, or the controller was closed
+            return
+        connection.settimeout(RELOAD_TIMEOUT)
+        with self.__lock:
+            self.__disconnect()
+            self.__connection = connection
+            self.__stream = connection.makefile("rwb", buffering=0)
+
+
+def build_hot_reload_controller(command: list[str]) -> HotReloadController | None:
+    """
+    Returns the hot reload controller for the script's split command, or `None` (after logging
+    why) if the command can't be hot reloaded.
+    """
+    if python_target(command) is None:
+        log(
+            "error",
+            "hot reload needs a `python script.py` or `python -m module` command, ignoring it",
+        )
+        return None
+    try:
+        return HotReloadController(command)
+    except OSError as e:
+        log("error", f"unable to listen for the hot reload worker, ignoring it: {e}")
+        return None
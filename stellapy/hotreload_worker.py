@@ -0,0 +1,240 @@
+"""
+The worker process of stella's hot reload mode.
+
+It runs the target script or module (`worker.py script.py args...` or `worker.py -m module args...`)
+in the main thread, just like `python` itself would, and listens for reload requests from stella
+on a TCP connection in a background thread.
+
+This file is executed by path with the app's own interpreter, so it must only use the standard
+library and must not import anything from stellapy.
+"""
+
+import importlib
+import importlib.util
+import json
+import os
+import runpy
+import socket
+import sys
+import threading
+import time
+from types import FunctionType, ModuleType
+
+ADDRESS_ENV = "STELLA_HOT_RELOAD_ADDRESS"
+
+
+def _is_project_module(module, root):
+    path = getattr(module, "__file__", None)
+    if not path or not path.endswith(".py"):
+        return False
+    path = os.path.abspath(path)
+    return path.startswith(root + os.sep) and "site-packages" not in path
+
+
+def _modules_by_path(root):
+    modules = {}
+    for name, module in list(sys.modules.items()):
+        if isinstance(module, ModuleType) and _is_project_module(module, root):
+            modules.setdefault(os.path.abspath(module.__file__), []).append(name)
+    return modules
+
+
+def _dependencies(module):
+    """
+    Returns the names of the modules `module` refers to in its namespace.
+    """
+    deps = set()
+    for value in list(vars(module).values()):
+        if isinstance(value, ModuleType):
+            deps.add(value.__name__)
+        else:
+            owner = getattr(value, "__module__", None)
+            if isinstance(owner, str):
+                deps.add(owner)
+    deps.discard(module.__name__)
+    return deps
+
+
+def _reload_order(changed, root):
+    """
+    Returns the changed modules followed by the project modules depending on them, so that every
+    module is reloaded after the modules it depends on.
+    """
+    project = {
+        name: module
+        for name, module in list(sys.modules.items())
+        if isinstance(module, ModuleType)
+        and name != "__main__"
+        and _is_project_module(module, root)
+    }
+    dependents = {name: set() for name in project}
+    for name, module in project.items():
+        for dep in _dependencies(module):
+            if dep in dependents:
+                dependents[dep].add(name)
+
+    affected = set()
+    stack = list(changed)
+    while stack:
+        name = stack.pop()
+        if name in affected or name not in project:
+            continue
+        affected.add(name)
+        stack.extend(dependents[name])
+
+    # depth first topological sort, restricted to the affected modules
+    order, visited = [], set()
+
+    def visit(name):
+        if name in visited:
+            return
+        visited.add(name)
+        for dep in _dependencies(project[name]):
+            if dep in affected:
+                visit(dep)
+        order.append(name)
+
+    for name in sorted(affected):
+        visit(name)
+    return order
+
+
+def _patch_function(old, new):
+    """
+    Makes `old` behave like `new`, so that references to `old` held elsewhere (like the route table
+    of a web framework) run the new code.
+    """
+    try:
+        old.__code__ = new.__code__
+    except ValueError:
+        # the number of free variables changed, can't patch this one
+        return
+    old.__defaults__ = new.__defaults__
+    old.__kwdefaults__ = new.__kwdefaults__
+    old.__doc__ = new.__doc__
+    old.__dict__.update(new.__dict__)
+
+
+def _patch_class(old, new):
+    for attr, value in list(vars(new).items()):
+        if attr in ("__dict__", "__weakref__"):
+            continue
+        current = vars(old).get(attr)
+        if isinstance(current, FunctionType) and isinstance(value, FunctionType):
+            _patch_function(current, value)
+            continue
+        try:
+            setattr(old, attr, value)
+        except (AttributeError, TypeError):
+            pass
+
+
+def _patch(old_namespace, module):
+    for name, old in old_namespace.items():
+        new = vars(module).get(name)
+        if new is None or new is old:
+            continue
+        if isinstance(old, FunctionType) and isinstance(new, FunctionType):
+            _patch_function(old, new)
+        elif (
+            isinstance(old, type)
+            and isinstance(new, type)
+            and old.__module__ == module.__name__
+        ):
+            _patch_class(old, new)
+
+
+def reload_paths(paths, root, target_path):
+    """
+    Reloads the modules loaded from `paths` and the project modules depending on them. Returns
+    the names of the reloaded modules, or raises `RuntimeError` if a full restart is needed.
+    """
+    by_path = _modules_by_path(root)
+    changed = set()
+    for path in paths:
+        path = os.path.abspath(path)
+        if os.path.isdir(path):
+            continue
+        if not path.endswith(".py"):
+            raise RuntimeError(f"{path} is not a python module")
+        if path == target_path:
+            raise RuntimeError(f"{path} is the main module")
+        names = [name for name in by_path.get(path, []) if name != "__main__"]
+        changed.update(names)
+
+    importlib.invalidate_caches()
+    reloaded = []
+    for name in _reload_order(changed, root):
+        module = sys.modules[name]
+        # the bytecode cache is only invalidated by mtime with a precision of a second
+        try:
+            os.remove(importlib.util.cache_from_source(module.__file__))
+        except (OSError, NotImplementedError, ValueError):
+            pass
+        old_namespace = dict(vars(module))
+        try:
+            importlib.reload(module)
+        except BaseException as e:
+            raise RuntimeError(f"reloading {name} failed: {e!r}") from e
+        _patch(old_namespace, module)
+        reloaded.append(name)
+    return reloaded
+
+
+def _serve(connection, root, target_path):
+    stream = connection.makefile("rwb", buffering=0)
+    for line in stream:
+        try:
+            request = json.loads(line)
+        except ValueError:
+            continue
+        started = time.perf_counter()
+        try:
+            reloaded = reload_paths(request.get("paths", []), root, target_path)
+            reply = {"status": "ok", "reloaded": reloaded}
+        except Exception as e:
+            reply = {"status": "restart", "reason": str(e)}
+        reply["seconds"] = time.perf_counter() - started
+        stream.write(json.dumps(reply).encode() + b"\n")
+
+
+def _connect(root, target_path):
+    address = os.environ.pop(ADDRESS_ENV, "")
+    if not address:
+        return
+    host, port = address.rsplit(":", 1)
+    try:
+        connection = socket.create_connection((host, int(port)))
+    except OSError:
+        return
+    thread = threading.Thread(
+        target=_serve, args=(connection, root, target_path), daemon=True
+    )
+    thread.start()
+
+
+def main():
+    args = sys.argv[1:]
+    if not args:
+        sys.exit("usage: hotreload_worker.py (script.py | -m module) [args...]")
+
+    root = os.path.abspath(os.getcwd())
+    if args[0] == "-m" and len(args) > 1:
+        target_path = None
+        spec = importlib.util.find_spec(args[1])
+        if spec and spec.origin:
+            target_path = os.path.abspath(spec.origin)
+        sys.argv = [args[1]] + args[2:]
+        sys.path[0] = root
+        _connect(root, target_path)
+        runpy.run_module(args[1], run_name="__main__", alter_sys=True)
+    else:
+        target_path = os.path.abspath(args[0])
+        sys.argv = args
+        sys.path[0] = os.path.dirname(target_path)
+        _connect(root, target_path)
+        runpy.run_path(target_path, run_name="__main__")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+import os
+from dataclasses import dataclass
+from threading import RLock
+
+import gitignorefile
+
+# in increasing order of precedence within a single directory
+IGNORE_FILE_NAMES = (".gitignore", "stella.ignore")
+
+
+@dataclass(frozen=True)
+class IgnoreFile:
+    """
+    The compiled rules of a single ignore file, relative to the directory it lives in.
+    """
+
+    path: str
+    base_dir: str
+    rules: tuple
+
+    @classmethod
+    def load(cls, path: str, base_dir: str) -> "IgnoreFile | None":
+        try:
+            with open(path) as f:
+                patterns = f.read().splitlines()
+        except (OSError, UnicodeDecodeError):
+            return None
+        rules = tuple(
+            rule
+            for rule in (gitignorefile._rule_from_pattern(p) for p in patterns)
+            if rule
+        )
+        return cls(path, base_dir, rules) if rules else None
+
+    def verdict(self, rel_path: str, is_dir: bool) -> bool | None:
+        """
+        Returns `True` if the path is ignored, `False` if it is explicitly re-included using a
+        negated pattern and `None` if no rule in this file matches it. As in git, the last matching
+        rule wins.
+        """
+        for rule in reversed(self.rules):
+            if rule.match(rel_path, is_dir):
+                return not rule.negation
+        return None
+
+
+class IgnoreIndex:
+    """
+    A per-directory index of every `.gitignore` and `stella.ignore` file in the project tree.
+
+    The rules for a path are looked up the way git does it: ignore files in deeper directories take
+    precedence over the ones in their parents, and within a directory `stella.ignore` takes
+    precedence over `.gitignore`. Ignore files in the parents of the project root, up to the
+    repository root, and `.git/info/exclude` apply with the lowest precedence.
+
+    Ignore files are loaded lazily the first time a directory is looked up, and the resulting rule
+    chain is cached per directory until `invalidate` is called for an ignore file.
+    """
+
+    def __init__(self, root: str = ".") -> None:
+        self.root = os.path.abspath(root)
+        self.__own_files: dict[str, tuple[IgnoreFile, ...]] = {}
+        self.__chains: dict[str, tuple[IgnoreFile, ...]] = {}
+        self.__lock = RLock()
+
+    def match(self, path: str, is_dir: bool | None = None) -> bool:
+        """
+        Returns `True` if `path` is ignored.
+        """
+        path = os.path.abspath(path)
+        for ignore_file in self.chain(os.path.dirname(path)):
+            rel_path = path[len(ignore_file.base_dir) :].lstrip(os.sep)
+            if os.sep != "/":
+                rel_path = rel_path.replace(os.sep, "/")
+            if is_dir is None:
+                is_dir = os.path.isdir(path)
+            verdict = ignore_file.verdict(rel_path, is_dir)
+            if verdict is not None:
+                return verdict
+        return False
+
+    def chain(self, directory: str) -> tuple[IgnoreFile, ...]:
+        """
+        Returns the ignore files applying to the entries of `directory`, deepest first.
+        """
+        chain = self.__chains.get(directory)
+        if chain is not None:
+            return chain
+
+        with self.__lock:
+            if directory == self.root:
+                chain = self.__files_in(directory) + self.__outer_files()
+            elif directory.startswith(self.root + os.sep):
+                chain = self.__files_in(directory) + self.chain(
+                    os.path.dirname(directory)
+                )
+            else:
+                # paths outside the project are never ignored
+                chain = ()
+            self.__chains[directory] = chain
+        return chain
+
+    def invalidate(self, ignore_file_path: str) -> None:
+        """
+        Reloads the ignore file at `ignore_file_path` (which may have been created, modified or
+        deleted) and drops the cached rule chains of its directory and all directories below it.
+        """
+        directory = os.path.dirname(os.path.abspath(ignore_file_path))
+        prefix = directory + os.sep
+        with self.__lock:
+            self.__own_files.pop(directory, None)
+            for cached in list(self.__chains):
+                if cached == directory or cached.startswith(prefix):
+                    del self.__chains[cached]
+            if not directory.startswith(self.root + os.sep):
+                # an ignore file in (or above) the root applies to the whole tree
+                self.__chains.clear()
+
+    @staticmethod
+    def is_ignore_file(path: str) -> bool:
+        return os.path.basename(path) in IGNORE_FILE_NAMES
+
+    def __files_in(self, directory: str) -> tuple[IgnoreFile, ...]:
+        files = self.__own_files.get(directory)
+        if files is None:
+            loaded = (
+                IgnoreFile.load(os.path.join(directory, name), directory)
+                for name in reversed(IGNORE_FILE_NAMES)
+            )
+            files = tuple(f for f in loaded if f)
+            self.__own_files[directory] = files
+        return files
+
+    def __outer_files(self) -> tuple[IgnoreFile, ...]:
+        """
+        Ignore files in the parents of the root, up to the repository root, along with the
+        repository's `.git/info/exclude`.
+        """
+        files: tuple[IgnoreFile, ...] = ()
+        directory = self.root
+        while True:
+            if directory != self.root:
+                files += self.__files_in(directory)
+            if os.path.isdir(os.path.join(directory, ".git")):
+                exclude = IgnoreFile.load(
+                    os.path.join(directory, ".git", "info", "exclude"), directory
+                )
+                if exclude:
+                    files += (exclude,)
+                break
+            parent = os.path.dirname(directory)
+            if parent == directory:
+                break
+            directory = parent
+        return files
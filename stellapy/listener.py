@@ -0,0 +1,57 @@
+import os
+import socket
+from urllib.parse import urlparse
+
+# the first file descriptor used for passed sockets, as defined by systemd's sd_listen_fds
+SD_LISTEN_FDS_START = 3
+LISTEN_BACKLOG = 1024
+DEFAULT_PORTS = {"http": 80, "https": 443, "ws": 80, "wss": 443}
+
+
+def address_from_url(url: str) -> tuple[str, int]:
+    """
+    Returns the host and the port a script's `url` points at. URLs without a scheme, like
+    `localhost:8000`, are treated as http URLs.
+    """
+    if "://" not in url:
+        url = f"http://{url}"
+    parsed = urlparse(url)
+    host = parsed.hostname or "localhost"
+    port = parsed.port or DEFAULT_PORTS.get(parsed.scheme, 80)
+    return host, port
+
+
+def bind_listener(url: str) -> socket.socket:
+    """
+    Binds and listens on the address from `url`, so that connections made while the app is being
+    restarted wait in the kernel backlog instead of being refused.
+    """
+    return socket.create_server(address_from_url(url), backlog=LISTEN_BACKLOG)
+
+
+def pass_listener(fd: int) -> None:
+    """
+    Installs the listening socket `fd` as file descriptor 3 in the current process. Meant to be
+    called in the child process between fork and exec (i.e. as a part of `preexec_fn`).
+    """
+    if fd != SD_LISTEN_FDS_START:
+        os.dup2(fd, SD_LISTEN_FDS_START)  # the duplicate is inheritable
+    else:
+        os.set_inheritable(fd, True)
+
+
+def listener_env(env: dict[str, str] | None) -> dict[str, str]:
+    """
+    Returns `env` (the current environment if `None`) along with the `LISTEN_FDS` and
+    `LISTEN_FDNAMES` variables the way systemd socket activation sets them. The environment has to
+    be passed to the new process explicitly, since `subprocess` builds it before forking.
+    """
+    return {**(env or os.environ), "LISTEN_FDS": "1", "LISTEN_FDNAMES": "stella"}
+
+
+def with_listen_pid(argv: list[str]) -> list[str]:
+    """
+    Wraps `argv` in a shell which sets `LISTEN_PID` to its own pid and then execs into `argv`,
+    which keeps the pid, since the pid of the app isn't known before it is started.
+    """
+    return ["/bin/sh", "-c", 'LISTEN_PID=$$; export LISTEN_PID; exec "$@"', "stella", *argv]
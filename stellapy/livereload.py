@@ -0,0 +1,362 @@
+import asyncio
+import http.client
+import json
+import struct
+from base64 import b64encode
+from hashlib import sha1
+from threading import Thread
+from urllib.parse import urlparse
+
+from stellapy.logger import log
+
+LISTEN_HOST = "127.0.0.1"
+WEBSOCKET_PATH = "/livereload"
+CLIENT_SCRIPT_PATH = "/livereload.js"
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+LIVERELOAD_PROTOCOL = "http://livereload.com/protocols/official-7"
+PROXY_TIMEOUT = 30  # seconds
+
+# opcodes of websocket frames
+OP_TEXT = 0x1
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+# reconnects after the server goes away, so that tabs survive restarts of stella
+CLIENT_SCRIPT = """(function () {
+  var src = document.currentScript ? document.currentScript.src : "";
+  var host = src ? new URL(src).host : "%(host)s";
+  function connect() {
+    var ws = new WebSocket("ws://" + host + "%(path)s");
+    ws.onopen = function () {
+      ws.send(JSON.stringify({ command: "hello", protocols: ["%(protocol)s"] }));
+    };
+    ws.onmessage = function (event) {
+      var message = JSON.parse(event.data);
+      if (message.command === "reload") {
+        window.location.reload();
+      }
+    };
+    ws.onclose = function () {
+      setTimeout(connect, 1000);
+    };
+  }
+  connect();
+})();
+"""
+
+ERROR_PAGE = """<!DOCTYPE html>
+<html>
+<head><title>stella: app unavailable</title></head>
+<body>
+<p>stella couldn't reach the app at <code>%(url)s</code>: %(error)s.</p>
+<p>This page reloads automatically once the app has restarted.</p>
+</body>
+</html>
+"""
+
+# hop-by-hop headers, and the ones which change when the body is rewritten
+SKIPPED_REQUEST_HEADERS = {
+    "connection",
+    "keep-alive",
+    "proxy-connection",
+    "te",
+    "upgrade",
+    "accept-encoding",
+    "host",
+}
+SKIPPED_RESPONSE_HEADERS = {
+    "connection",
+    "keep-alive",
+    "transfer-encoding",
+    "content-length",
+}
+
+
+def _websocket_frame(opcode: int, payload: bytes) -> bytes:
+    """
+    Builds a single unmasked (server to client) websocket frame.
+    """
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < 1 << 16:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+    return header + payload
+
+
+async def _read_websocket_frame(reader: asyncio.StreamReader) -> tuple[int, bytes]:
+    """
+    Reads a single client to server websocket frame, returning its opcode and unmasked payload.
+    """
+    first, second = await reader.readexactly(2)
+    length = second & 0x7F
+    if length == 126:
+        (length,) = struct.unpack("!H", await reader.readexactly(2))
+    elif length == 127:
+        (length,) = struct.unpack("!Q", await reader.readexactly(8))
+    mask = await reader.readexactly(4) if second & 0x80 else b""
+    payload = await reader.readexactly(length)
+    if mask:
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+    return first & 0x0F, payload
+
+
+async def _read_request_head(
+    reader: asyncio.StreamReader,
+) -> tuple[str, str, dict[str, str]]:
+    """
+    Reads an HTTP request line and its headers. Header names are lowercased.
+    """
+    head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1")
+    request_line, *header_lines = head.split("\r\n")
+    method, target, _ = request_line.split(" ", 2)
+    headers = {}
+    for line in header_lines:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+    return method, target, headers
+
+
+def _response(status: str, content_type: str, body: bytes) -> bytes:
+    return (
+        f"HTTP/1.1 {status}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        "Cache-Control: no-store\r\n"
+        "Connection: close\r\n\r\n"
+    ).encode("latin-1") + body
+
+
+class LiveReloadServer:
+    """
+    A tiny livereload server, used to reload browser tabs without selenium.
+
+    It serves a client script at `/livereload.js`, which keeps a websocket connection to
+    `/livereload` open and reloads the page when told to. The server speaks the livereload
+    protocol, so the LiveReload browser extensions can connect to it as well.
+
+    Optionally, a reverse proxy is started in front of the app which injects the client script into
+    every HTML page, so the app doesn't need to include it itself.
+
+    The server runs an asyncio event loop in a background thread; `reload` can be called from any
+    thread.
+    """
+
+    def __init__(self, port: int, app_url: str = "", proxy_port: int = 0) -> None:
+        self.port = port
+        self.app_url = app_url if "://" in app_url else f"http://{app_url}"
+        self.proxy_port = proxy_port if app_url else 0
+        self.__loop = asyncio.new_event_loop()
+        self.__clients: set[asyncio.StreamWriter] = set()
+        self.__servers: list[asyncio.Server] = []
+        self.__thread = Thread(target=self.__loop.run_forever, daemon=True)
+
+    @property
+    def script_url(self) -> str:
+        return f"http://{LISTEN_HOST}:{self.port}{CLIENT_SCRIPT_PATH}"
+
+    @property
+    def client_count(self) -> int:
+        return len(self.__clients)
+
+    def start(self) -> None:
+        """
+        Starts listening. Raises `OSError` if a port is not available.
+        """
+        self.__thread.start()
+        asyncio.run_coroutine_threadsafe(self.__start_servers(), self.__loop).result()
+        log(
+            "stella",
+            f'livereload server listening, include <script src="{self.script_url}"></script> in your pages',
+        )
+        if self.proxy_port:
+            log(
+                "stella",
+                f"open http://{LISTEN_HOST}:{self.proxy_port} to browse `{self.app_url}` with livereload injected",
+            )
+
+    def reload(self) -> None:
+        """
+        Tells every connected browser tab to reload.
+        """
+        self.__loop.call_soon_threadsafe(self.__broadcast_reload)
+
+    def stop(self) -> None:
+        if not self.__thread.is_alive():
+            return
+        asyncio.run_coroutine_threadsafe(self.__stop_servers(), self.__loop).result()
+        self.__loop.call_soon_threadsafe(self.__loop.stop)
+        self.__thread.join()
+
+    async def __start_servers(self) -> None:
+        self.__servers.append(
+            await asyncio.start_server(self.__handle, LISTEN_HOST, self.port)
+        )
+        if self.proxy_port:
+            self.__servers.append(
+                await asyncio.start_server(
+                    self.__handle_proxy, LISTEN_HOST, self.proxy_port
+                )
+            )
+
+    async def __stop_servers(self) -> None:
+        for client in list(self.__clients):
+            client.close()
+        for server in self.__servers:
+            server.close()
+
+    def __send(self, client: asyncio.StreamWriter, message: dict) -> None:
+        client.write(_websocket_frame(OP_TEXT, json.dumps(message).encode()))
+
+    def __broadcast_reload(self) -> None:
+        for client in list(self.__clients):
+            try:
+                self.__send(client, {"command": "reload", "path": "/", "liveCSS": False})
+            except Exception:
+                self.__clients.discard(client)
+
+    async def __handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            _, target, headers = await _read_request_head(reader)
+            path = urlparse(target).path
+            if path == WEBSOCKET_PATH and "sec-websocket-key" in headers:
+                await self.__handle_websocket(reader, writer, headers)
+            elif path == CLIENT_SCRIPT_PATH:
+                script = CLIENT_SCRIPT % {
+                    "host": f"{LISTEN_HOST}:{self.port}",
+                    "path": WEBSOCKET_PATH,
+                    "protocol": LIVERELOAD_PROTOCOL,
+                }
+                writer.write(
+                    _response("200 OK", "application/javascript", script.encode())
+                )
+            else:
+                writer.write(_response("404 Not Found", "text/plain", b"not found"))
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            self.__clients.discard(writer)
+            writer.close()
+
+    async def __handle_websocket(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        headers: dict[str, str],
+    ) -> None:
+        accept = b64encode(
+            sha1((headers["sec-websocket-key"] + WEBSOCKET_GUID).encode()).digest()
+        ).decode()
+        writer.write(
+            (
+                "HTTP/1.1 101 Switching Protocols\r\n"
+                "Upgrade: websocket\r\n"
+                "Connection: Upgrade\r\n"
+                f"Sec-WebSocket-Accept: {accept}\r\n\r\n"
+            ).encode("latin-1")
+        )
+        await writer.drain()
+        self.__clients.add(writer)
+
+        while True:
+            opcode, payload = await _read_websocket_frame(reader)
+            if opcode == OP_CLOSE:
+                writer.write(_websocket_frame(OP_CLOSE, payload[:2]))
+                return
+            if opcode == OP_PING:
+                writer.write(_websocket_frame(OP_PONG, payload))
+            elif opcode == OP_TEXT:
+                try:
+                    message = json.loads(payload)
+                except ValueError:
+                    continue
+                if message.get("command") == "hello":
+                    self.__send(
+                        writer,
+                        {
+                            "command": "hello",
+                            "protocols": [LIVERELOAD_PROTOCOL],
+                            "serverName": "stella",
+                        },
+                    )
+            await writer.drain()
+
+    async def __handle_proxy(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            method, target, headers = await _read_request_head(reader)
+            length = int(headers.get("content-length", 0))
+            body = await reader.readexactly(length) if length else None
+            writer.write(
+                await asyncio.to_thread(self.__forward, method, target, headers, body)
+            )
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    def __forward(
+        self, method: str, target: str, headers: dict[str, str], body: bytes | None
+    ) -> bytes:
+        """
+        Forwards a request to the app and returns the response to send back to the browser, with
+        the client script injected into HTML pages.
+        """
+        upstream = urlparse(self.app_url)
+        connection_class = (
+            http.client.HTTPSConnection
+            if upstream.scheme == "https"
+            else http.client.HTTPConnection
+        )
+        connection = connection_class(
+            upstream.hostname or "localhost", upstream.port, timeout=PROXY_TIMEOUT
+        )
+        script_tag = f'<script src="{self.script_url}"></script>'
+        try:
+            connection.request(
+                method,
+                target,
+                body=body,
+                headers={
+                    name: value
+                    for name, value in headers.items()
+                    if name not in SKIPPED_REQUEST_HEADERS
+                },
+            )
+            response = connection.getresponse()
+            payload = response.read()
+        except OSError as e:
+            page = ERROR_PAGE % {"url": self.app_url, "error": e}
+            page = page.replace("</body>", f"{script_tag}</body>")
+            return _response("502 Bad Gateway", "text/html", page.encode())
+        finally:
+            connection.close()
+
+        response_headers = [
+            (name, value)
+            for name, value in response.getheaders()
+            if name.lower() not in SKIPPED_RESPONSE_HEADERS
+        ]
+        content_type = response.getheader("content-type", "")
+        if "text/html" in content_type and not response.getheader("content-encoding"):
+            tag = script_tag.encode()
+            index = payload.lower().rfind(b"</body>")
+            payload = (
+                payload[:index] + tag + payload[index:]
+                if index != -1
+                else payload + tag
+            )
+
+        head = f"HTTP/1.1 {response.status} {response.reason}\r\n"
+        head += "".join(f"{name}: {value}\r\n" for name, value in response_headers)
+        head += f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n"
+        return head.encode("latin-1") + payload
@@ -1,28 +1,192 @@
+import atexit
+import sys
 from datetime import datetime
+from queue import Empty, Full, Queue
+from threading import Event, Lock, Thread
+from time import time
 
-from rich import print
-from rich.text import Text
+# the levels of the standard `logging` module
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVELS = {"debug": DEBUG, "info": INFO, "warning": WARNING, "error": ERROR}
 
+# severity to its level and the style it's printed in
+SEVERITIES = {
+    "debug": (DEBUG, "dim"),
+    "stella": (INFO, "cyan"),
+    "info": (INFO, "green"),
+    "warning": (WARNING, "yellow"),
+    "error": (ERROR, "red"),
+}
+MAX_PENDING = 10000  # messages waiting to be written, more are dropped
+FLUSH_TIMEOUT = 2  # seconds
 
-def log(severity: str, message: str) -> None:
+
+class _Writer:
+    """
+    Writes the log messages to the terminal, and optionally as JSON lines to a file, from its own
+    thread. Logging only puts the message in a bounded queue, so it never blocks on a slow terminal;
+    messages which don't fit in the queue are dropped and counted.
+    """
+
+    def __init__(self) -> None:
+        self.level = INFO
+        self.console = True
+        self.json_file = ""
+        self.dropped = 0
+        self.__queue: Queue[tuple[float, str, str] | Event] = Queue(MAX_PENDING)
+        self.__json = None
+        self.__reported = 0
+        self.__thread: Thread | None = None
+        self.__lock = Lock()
+
+    def configure(self, level: int, json_file: str) -> None:
+        self.level = level
+        self.json_file = json_file
+        # `-` writes the JSON lines to stderr, in place of the terminal output
+        self.console = json_file != "-"
+
+    def put(self, severity: str, message: str) -> None:
+        if not self.__thread:
+            self.__start()
+        try:
+            self.__queue.put_nowait((time(), severity, message))
+        except Full:
+            self.dropped += 1
+
+    def flush(self, timeout: float = FLUSH_TIMEOUT) -> None:
+        """
+        Waits until the messages logged so far have been written.
+        """
+        if not self.__thread or not self.__thread.is_alive():
+            return
+        written = Event()
+        try:
+            self.__queue.put(written, timeout=timeout)
+        except Full:
+            return
+        written.wait(timeout)
+
+    def __start(self) -> None:
+        with self.__lock:
+            if self.__thread:
+                return
+            self.__thread = Thread(target=self.__run, daemon=True)
+            self.__thread.start()
+            atexit.register(self.flush)
+
+    def __run(self) -> None:
+        # rich is imported lazily to keep the startup of the CLI fast
+        from rich import print
+        from rich.text import Text
+
+        self.__print = print
+        self.__text = Text
+        while True:
+            item = self.__queue.get()
+            # write whatever has queued up in one go
+            while True:
+                if isinstance(item, Event):
+                    self.__flush_sinks()
+                    item.set()
+                else:
+                    self.__write(*item)
+                try:
+                    item = self.__queue.get_nowait()
+                except Empty:
+                    break
+            if self.dropped != self.__reported:
+                count, self.__reported = self.dropped - self.__reported, self.dropped
+                self.__write(
+                    time(),
+                    "error",
+                    f"dropped {count} log message(s) because the terminal couldn't keep up",
+                )
+            self.__flush_sinks()
+
+    def __write(self, created: float, severity: str, message: str) -> None:
+        moment = datetime.fromtimestamp(created)
+        level, style = SEVERITIES.get(severity, (INFO, ""))
+        if self.console:
+            self.__print(
+                self.__text(f"[stella] {moment:%H:%M:%S} -> {message}", style=style)
+            )
+        if self.json_file:
+            self.__write_json(moment, level, severity, message)
+
+    def __write_json(
+        self, moment: datetime, level: int, severity: str, message: str
+    ) -> None:
+        import json
+
+        if self.__json is None:
+            try:
+                self.__json = (
+                    sys.stderr
+                    if self.json_file == "-"
+                    else open(self.json_file, "a", encoding="utf-8")
+                )
+            except OSError as e:
+                self.json_file = ""
+                self.console = True
+                self.__write(time(), "error", f"unable to open the JSON log file: {e}")
+                return
+        record = {
+            "time": moment.isoformat(timespec="milliseconds"),
+            "level": next(name for name, value in LEVELS.items() if value == level),
+            "severity": severity,
+            "message": message,
+        }
+        self.__json.write(json.dumps(record) + "\n")
+
+    def __flush_sinks(self) -> None:
+        if self.console:
+            sys.stdout.flush()
+        if self.__json:
+            self.__json.flush()
+
+
+_writer = _Writer()
+
+
+def configure(level: str = "info", json_file: str = "") -> None:
     """
-    The `log` function logs the messages according to their severity.
+    Sets the lowest level of the messages which are logged, one of `LEVELS`, and a file to which
+    every message is also written as a JSON line. A `json_file` of `-` writes the JSON lines to
+    stderr instead of logging to the terminal.
     """
-    current_time = datetime.now().strftime("%H:%M:%S")
-    if severity == "stella":
-        print(Text(f"[stella] {current_time} -> {message}", style="cyan"))
+    _writer.configure(LEVELS[level.lower()], json_file)
 
-    elif severity == "info":
-        print(Text(f"[stella] {current_time} -> {message}", style="green"))
 
-    elif severity == "error":
-        print(Text(f"[stella] {current_time} -> {message}", style="red"))
+def json_log_file() -> str:
+    """
+    Returns the path of the file the JSON lines are written to, or an empty string if they aren't
+    written to a file.
+    """
+    return "" if _writer.json_file == "-" else _writer.json_file
 
-    else:
-        print(
-            "FATAL ERROR: Invalid value of the 'severity' parameter of log function. This should never happen. You might want to open an issue on GitHub."
-        )
-        quit(1)
+
+def log(severity: str, message: str) -> None:
+    """
+    The `log` function logs the messages according to their severity, which is `stella`, `info`
+    (both at the info level), `debug`, `warning` or `error`. Unknown severities are logged at the
+    info level.
+
+    The message is written by a separate thread, so logging never waits for the terminal.
+    """
+    level, _ = SEVERITIES.get(severity, (INFO, ""))
+    if level >= _writer.level:
+        _writer.put(severity, message)
+
+
+def flush() -> None:
+    """
+    Waits until the messages logged so far have been written, like before printing to the terminal
+    directly.
+    """
+    _writer.flush()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,117 @@
+import os
+from collections import OrderedDict
+from threading import Lock
+from typing import Callable, Generic, Iterable, TypeVar
+
+K = TypeVar("K")
+V = TypeVar("V")
+MatchFunc = Callable[..., bool]
+
+
+class LRUCache(Generic[K, V]):
+    """
+    A small thread-safe, bounded least-recently-used cache.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self.__data: OrderedDict[K, V] = OrderedDict()
+        self.__lock = Lock()
+
+    def get(self, key: K) -> V | None:
+        with self.__lock:
+            try:
+                self.__data.move_to_end(key)
+            except KeyError:
+                return None
+            return self.__data[key]
+
+    def put(self, key: K, value: V) -> None:
+        with self.__lock:
+            self.__data[key] = value
+            self.__data.move_to_end(key)
+            if len(self.__data) > self.maxsize:
+                self.__data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__data.clear()
+
+    def __len__(self) -> int:
+        return len(self.__data)
+
+
+class PathMatcher:
+    """
+    Combines the ignore rules, the `.git` directory check and the `include_only` patterns into a
+    single matcher.
+
+    Checks are ordered from the cheapest to the most expensive and stop at the first one which
+    decides the result. Verdicts are memoized in bounded LRU caches, one for directories and one for
+    individual paths, so a directory found to be ignored short-circuits every path below it.
+    """
+
+    def __init__(
+        self,
+        ignore_match: MatchFunc,
+        include_match: MatchFunc,
+        cache_size: int = 8192,
+        excluded: Iterable[str] = (),
+    ) -> None:
+        """
+        `excluded` are files and directories which are never matched whatever the rules say, like
+        the ones stella writes to itself while running.
+        """
+        self.ignore_match = ignore_match
+        self.include_match = include_match
+        self.excluded = frozenset(os.path.abspath(path) for path in excluded)
+        self.__dir_verdicts: LRUCache[str, bool] = LRUCache(cache_size)
+        self.__path_verdicts: LRUCache[tuple[str, bool], bool] = LRUCache(cache_size)
+
+    def matches(self, path: str, is_dir: bool = False) -> bool:
+        """
+        Returns `True` if a change to `path` should be acted upon.
+        """
+        verdict = self.__path_verdicts.get((path, is_dir))
+        if verdict is None:
+            verdict = self.__evaluate(path, is_dir)
+            self.__path_verdicts.put((path, is_dir), verdict)
+        return verdict
+
+    def is_ignored_dir(self, path: str) -> bool:
+        """
+        Returns `True` if the directory `path` or any of its parents is ignored.
+        """
+        verdict = self.__dir_verdicts.get(path)
+        if verdict is None:
+            verdict = self.__evaluate_dir(path)
+            self.__dir_verdicts.put(path, verdict)
+        return verdict
+
+    def clear_cache(self) -> None:
+        self.__dir_verdicts.clear()
+        self.__path_verdicts.clear()
+
+    def __evaluate_dir(self, path: str) -> bool:
+        if os.path.basename(path) == ".git":
+            return True
+        if self.excluded and os.path.abspath(path) in self.excluded:
+            return True
+        parent = os.path.dirname(path)
+        if parent and parent != path and self.is_ignored_dir(parent):
+            return True
+        return bool(self.ignore_match(path, is_dir=True))
+
+    def __evaluate(self, path: str, is_dir: bool) -> bool:
+        parent = os.path.dirname(path)
+        if parent and self.is_ignored_dir(parent):
+            return False
+        if self.excluded and os.path.abspath(path) in self.excluded:
+            return False
+        if is_dir:
+            return not self.is_ignored_dir(path) and bool(
+                self.include_match(path, is_dir=True)
+            )
+        if self.ignore_match(path, is_dir=False):
+            return False
+        return bool(self.include_match(path, is_dir=False))
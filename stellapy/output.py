@@ -0,0 +1,264 @@
+import os
+import sys
+from collections import deque
+from datetime import datetime
+from threading import Condition, Lock, Thread
+from typing import BinaryIO, Callable
+
+from stellapy.logger import log
+
+CONSOLE_BUFFER = 4 * 1024 * 1024  # characters waiting for the terminal
+LOG_BUFFER = 32 * 1024 * 1024  # characters waiting for the log file
+READ_SIZE = 65536  # bytes
+MAX_LINE = 65536  # bytes, longer lines are split
+CLOSE_TIMEOUT = 2  # seconds given to the writers to drain their buffers
+
+
+class RotatingLogFile:
+    """
+    A log file which is rotated once it grows beyond `max_bytes`. The rotated files are named
+    like `app.log.1` (the newest) up to `app.log.N` with N being `backups`.
+    """
+
+    def __init__(self, path: str, max_bytes: int, backups: int) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.__file = open(path, "a", encoding="utf-8")
+        self.__size = self.__file.tell()
+
+    def write(self, text: str) -> None:
+        size = len(text.encode("utf-8", errors="replace"))
+        if self.max_bytes and self.__size and self.__size + size > self.max_bytes:
+            self.__rotate()
+        self.__file.write(text)
+        self.__size += size
+
+    def flush(self) -> None:
+        self.__file.flush()
+
+    def close(self) -> None:
+        self.__file.close()
+
+    def __rotate(self) -> None:
+        self.__file.close()
+        if self.backups:
+            for index in range(self.backups - 1, 0, -1):
+                older = f"{self.path}.{index}"
+                if os.path.exists(older):
+                    os.replace(older, f"{self.path}.{index + 1}")
+            os.replace(self.path, f"{self.path}.1")
+            self.__file = open(self.path, "a", encoding="utf-8")
+        else:
+            self.__file = open(self.path, "w", encoding="utf-8")
+        self.__size = 0
+
+
+class _Sink:
+    """
+    A destination of the output, written to by its own thread from a bounded buffer. Lines which
+    don't fit in the buffer are dropped and counted instead of blocking the readers, so a slow
+    terminal or disk can never stall the app.
+    """
+
+    def __init__(
+        self,
+        write: Callable[[bool, datetime, list[str]], None],
+        flush: Callable[[], None],
+        report: Callable[[int], None],
+        capacity: int,
+    ) -> None:
+        """
+        At most `capacity` characters are buffered. `report` is called with the number of lines
+        dropped since its last call, by the writing thread, so that a stalled destination can't
+        block anything else.
+        """
+        self.dropped = 0
+        self.__write = write
+        self.__flush = flush
+        self.__report = report
+        self.__capacity = capacity
+        # chunks of lines read at the same time from the same pipe
+        self.__chunks: deque[tuple[bool, datetime, list[str]]] = deque()
+        self.__pending = 0  # characters
+        self.__closed = False
+        self.__condition = Condition()
+        self.__reported = 0
+        self.__thread = Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+    def put(self, is_error: bool, time: datetime, lines: list[str]) -> None:
+        size = sum(map(len, lines))
+        with self.__condition:
+            room = self.__capacity - self.__pending
+            if size > room:
+                kept: list[str] = []
+                for line in lines:
+                    if len(line) > room:
+                        break
+                    kept.append(line)
+                    room -= len(line)
+                self.dropped += len(lines) - len(kept)
+                lines, size = kept, sum(map(len, kept))
+            if lines:
+                self.__chunks.append((is_error, time, lines))
+                self.__pending += size
+                self.__condition.notify()
+
+    def close(self) -> bool:
+        """
+        Writes the buffered lines and stops the thread, returning `False` if it didn't stop in time.
+        """
+        with self.__condition:
+            self.__closed = True
+            self.__condition.notify()
+        self.__thread.join(CLOSE_TIMEOUT)
+        return not self.__thread.is_alive()
+
+    def __run(self) -> None:
+        while True:
+            with self.__condition:
+                while not self.__chunks and not self.__closed:
+                    self.__condition.wait()
+                chunks, self.__chunks = self.__chunks, deque()
+                self.__pending = 0
+                closed = self.__closed
+                dropped = self.dropped
+            for chunk in chunks:
+                self.__write(*chunk)
+            if dropped != self.__reported:
+                self.__report(dropped - self.__reported)
+                self.__reported = dropped
+            # flush once per batch, instead of after every line
+            self.__flush()
+            if closed:
+                break
+
+
+class OutputMultiplexer:
+    """
+    Reads the output of the app from its pipes and hands every line to the terminal, the log file
+    and the output callback, optionally prefixed and timestamped. The last `history` lines are
+    kept in memory, so they can be shown again after a crash.
+
+    The pipes are always drained as fast as the app writes to them, writing to the terminal and
+    the log file happens on separate threads.
+    """
+
+    def __init__(
+        self,
+        prefix: str = "",
+        callback: Callable[[str], None] | None = None,
+        timestamps: bool = False,
+        history: int = 1000,
+        log_file: str = "",
+        log_max_bytes: int = 0,
+        log_backups: int = 0,
+    ) -> None:
+        self.prefix = prefix
+        self.callback = callback
+        self.timestamps = timestamps
+        self.__history: deque[str] = deque(maxlen=history)
+        self.__history_lock = Lock()
+        self.console = _Sink(
+            self.__write_console,
+            self.__flush_console,
+            self.__report_console,
+            CONSOLE_BUFFER,
+        )
+        self.log: RotatingLogFile | None = None
+        self.log_sink: _Sink | None = None
+        if log_file:
+            self.log = RotatingLogFile(log_file, log_max_bytes, log_backups)
+            self.log_sink = _Sink(
+                self.__write_log, self.log.flush, self.__report_log, LOG_BUFFER
+            )
+
+    def attach(
+        self, stdout: BinaryIO | None, stderr: BinaryIO | None, notify: bool = True
+    ) -> None:
+        """
+        Starts reading the pipes of a newly started process. With `notify` set to `False` the
+        lines aren't handed to the output callback, for output which isn't the app's own, like the
+        one of its steps.
+        """
+        for pipe, is_error in ((stdout, False), (stderr, True)):
+            if pipe:
+                Thread(
+                    target=self.__read, args=(pipe, is_error, notify), daemon=True
+                ).start()
+
+    def recent(self, count: int) -> list[str]:
+        """
+        Returns up to `count` of the most recent lines of output.
+        """
+        with self.__history_lock:
+            return list(self.__history)[-count:]
+
+    @property
+    def dropped(self) -> int:
+        return self.console.dropped + (self.log_sink.dropped if self.log_sink else 0)
+
+    def close(self) -> None:
+        self.console.close()
+        if self.log_sink and self.log and self.log_sink.close():
+            self.log.close()
+
+    def __read(self, pipe: BinaryIO, is_error: bool, notify: bool) -> None:
+        """
+        Reads whatever the app has written so far, so that the lines of a burst of output are
+        handed on together.
+        """
+        partial = b""
+        with pipe:
+            while chunk := pipe.read1(READ_SIZE):  # type: ignore (a BufferedReader)
+                *complete, partial = (partial + chunk).split(b"\n")
+                lines = [line.decode(errors="replace") + "\n" for line in complete]
+                while len(partial) >= MAX_LINE:
+                    lines.append(partial[:MAX_LINE].decode(errors="replace") + "\n")
+                    partial = partial[MAX_LINE:]
+                if lines:
+                    self.__handle(is_error, lines, notify)
+        if partial:
+            self.__handle(is_error, [partial.decode(errors="replace") + "\n"], notify)
+
+    def __handle(self, is_error: bool, lines: list[str], notify: bool) -> None:
+        time = datetime.now()
+        with self.__history_lock:
+            self.__history.extend(lines)
+        self.console.put(is_error, time, lines)
+        if self.log_sink:
+            self.log_sink.put(is_error, time, lines)
+        if self.callback and notify:
+            for line in lines:
+                self.callback(line)
+
+    def __write_console(self, is_error: bool, time: datetime, lines: list[str]) -> None:
+        head = self.prefix + (time.strftime("%H:%M:%S ") if self.timestamps else "")
+        sink = sys.stderr if is_error else sys.stdout
+        sink.write("".join(head + line for line in lines) if head else "".join(lines))
+
+    @staticmethod
+    def __flush_console() -> None:
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+    @staticmethod
+    def __report_console(count: int) -> None:
+        log("error", f"dropped {count} line(s) of output because the terminal couldn't keep up")
+
+    def __write_log(self, is_error: bool, time: datetime, lines: list[str]) -> None:
+        assert self.log
+        head = f"{time.isoformat(sep=' ', timespec='milliseconds')} {'err' if is_error else 'out'} "
+        for line in lines:
+            self.log.write(head + line)
+
+    def __report_log(self, count: int) -> None:
+        assert self.log
+        stamp = datetime.now().isoformat(sep=" ", timespec="milliseconds")
+        self.log.write(
+            f"{stamp} stella dropped {count} line(s) of output because the disk couldn't keep up\n"
+        )
@@ -0,0 +1,320 @@
+import os
+import sys
+from threading import Event, Thread
+from time import perf_counter
+from typing import NamedTuple
+
+from watchdog.events import (
+    DirCreatedEvent,
+    DirDeletedEvent,
+    FileCreatedEvent,
+    FileDeletedEvent,
+    FileModifiedEvent,
+    FileMovedEvent,
+    FileSystemEvent,
+    FileSystemEventHandler,
+)
+
+from stellapy.ignore import IgnoreIndex
+from stellapy.logger import log
+from stellapy.matcher import PathMatcher
+
+# filesystems on which changes made by another machine (the docker host, the NFS server, windows
+# for WSL) never produce native events
+EVENTLESS_FILESYSTEMS = frozenset(
+    (
+        "nfs",
+        "nfs4",
+        "cifs",
+        "smb3",
+        "smbfs",
+        "9p",
+        "drvfs",
+        "vboxsf",
+        "fuse.sshfs",
+        "fuse.grpcfuse",
+        "fakeowner",
+    )
+)
+# the interval is stretched so that scanning takes at most 1 / SCAN_SHARE of the time
+SCAN_SHARE = 5
+
+
+class Snapshot(NamedTuple):
+    """
+    What is remembered about a directory entry between two scans.
+    """
+
+    inode: int
+    mtime_ns: int
+    size: int
+    is_dir: bool
+
+
+def filesystem_type(path: str) -> str | None:
+    """
+    Returns the type of the filesystem `path` is on, as listed in `/proc/self/mountinfo`. Returns
+    `None` where that isn't available.
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+    path = os.path.realpath(path)
+    best, fs_type = "", None
+    try:
+        with open("/proc/self/mountinfo", encoding="utf-8") as f:
+            for line in f:
+                fields, _, rest = line.partition(" - ")
+                fields, rest = fields.split(), rest.split()
+                if len(fields) < 5 or not rest:
+                    continue
+                # spaces and the like are escaped as octal in mount points
+                mount_point = fields[4].encode().decode("unicode_escape")
+                inside = path == mount_point or path.startswith(
+                    mount_point.rstrip("/") + "/"
+                )
+                if inside and len(mount_point) >= len(best):
+                    best, fs_type = mount_point, rest[0]
+    except OSError:
+        return None
+    return fs_type
+
+
+def select_backend(requested: str, root: str = ".") -> str:
+    """
+    Resolves the `watch_backend` option to either `native` or `polling`. `auto` picks polling when
+    `root` is on a filesystem known not to deliver native events.
+    """
+    if requested != "auto":
+        return requested
+    fs_type = filesystem_type(root)
+    if fs_type in EVENTLESS_FILESYSTEMS:
+        log(
+            "stella",
+            f"the project is on a `{fs_type}` filesystem which doesn't report changes, polling for them instead",
+        )
+        return "polling"
+    return "native"
+
+
+class ScandirPoller:
+    """
+    Finds changes by scanning the tree every `interval` seconds, for filesystems which don't
+    deliver native events. The changes are dispatched to the event handler as watchdog events, so
+    they are filtered, debounced and hashed exactly like native ones.
+
+    Ignored directories are never entered and ignored files never stat-ed. Every directory keeps a
+    compact snapshot of its entries, which is diffed in place on every scan. Files deleted and
+    created with the same inode during one scan are reported as moved.
+
+    If a scan takes long, the interval is stretched so that scanning takes at most a fifth of the
+    time.
+    """
+
+    def __init__(
+        self,
+        event_handler: FileSystemEventHandler,
+        matcher: PathMatcher,
+        root: str = ".",
+        interval: float = 0.5,
+    ) -> None:
+        self.event_handler = event_handler
+        self.matcher = matcher
+        self.root = root
+        self.interval = interval  # seconds
+        self.current_interval = interval
+        self.scan_time = 0.0  # seconds
+        self.file_count = 0
+        # directory to its tracked entries
+        self.__dirs: dict[str, dict[str, Snapshot]] = {}
+        # directory to the names of its entries known to be ignored
+        self.__ignored: dict[str, set[str]] = {}
+        self.__stopped = Event()
+        self.__thread = Thread(target=self.__run, daemon=True)
+
+    def start(self) -> None:
+        """
+        Takes the first snapshot and starts polling.
+        """
+        self.__scan(emit=False)
+        log(
+            "stella",
+            f"polling {self.file_count} file(s) in {len(self.__dirs)} directories every "
+            f"{self.current_interval * 1000:.0f} ms, a scan takes {self.scan_time * 1000:.0f} ms",
+        )
+        self.__thread.start()
+
+    def stop(self) -> None:
+        self.__stopped.set()
+        if self.__thread.is_alive():
+            self.__thread.join()
+
+    def is_alive(self) -> bool:
+        return self.__thread.is_alive()
+
+    def poll(self) -> None:
+        """
+        Scans the tree once, dispatching the changes found since the last scan.
+        """
+        self.__scan(emit=True)
+
+    def __run(self) -> None:
+        while not self.__stopped.wait(self.current_interval):
+            self.poll()
+
+    def __scan(self, emit: bool) -> None:
+        started = perf_counter()
+        created: list[tuple[str, Snapshot]] = []
+        deleted: list[tuple[str, Snapshot]] = []
+        modified: list[str] = []
+        seen: set[str] = set()
+        stack = [self.root]
+        while stack:
+            directory = stack.pop()
+            seen.add(directory)
+            self.__scan_dir(directory, stack, created, deleted, modified)
+        # directories which vanished along with a parent
+        for directory in [d for d in self.__dirs if d not in seen]:
+            self.__forget(directory, deleted)
+        self.file_count = sum(
+            not entry.is_dir for entries in self.__dirs.values() for entry in entries.values()
+        )
+        self.scan_time = perf_counter() - started
+        self.__adapt_interval()
+        if not emit:
+            return
+        if self.__dispatch(created, deleted, modified):
+            # the ignore rules changed, take a new baseline under the new rules instead of
+            # reporting everything they uncovered or hid as created or deleted
+            self.__dirs.clear()
+            self.__ignored.clear()
+            self.__scan(emit=False)
+
+    def __scan_dir(
+        self,
+        directory: str,
+        stack: list[str],
+        created: list[tuple[str, Snapshot]],
+        deleted: list[tuple[str, Snapshot]],
+        modified: list[str],
+    ) -> None:
+        old = self.__dirs.get(directory, {})
+        ignored = self.__ignored.setdefault(directory, set())
+        new: dict[str, Snapshot] = {}
+        still_ignored: list[str] = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.name in ignored:
+                        still_ignored.append(entry.name)
+                        continue
+                    path = entry.path
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                        if is_dir:
+                            if entry.name not in old and self.matcher.is_ignored_dir(path):
+                                still_ignored.append(entry.name)
+                                continue
+                            new[entry.name] = Snapshot(entry.inode(), 0, 0, True)
+                            stack.append(path)
+                            continue
+                        # entries from the last scan have been matched already, ignore files are
+                        # always tracked since they change what is ignored
+                        if (
+                            entry.name not in old
+                            and not IgnoreIndex.is_ignore_file(path)
+                            and not self.matcher.matches(path)
+                        ):
+                            still_ignored.append(entry.name)
+                            continue
+                        stat = entry.stat()
+                    except OSError:
+                        # vanished while scanning, or a broken symlink
+                        continue
+                    new[entry.name] = Snapshot(
+                        stat.st_ino, stat.st_mtime_ns, stat.st_size, False
+                    )
+        except OSError:
+            pass
+        if len(still_ignored) != len(ignored):
+            # forget the verdicts about entries which are gone
+            self.__ignored[directory] = set(still_ignored)
+
+        for name, entry in new.items():
+            previous = old.get(name)
+            if previous == entry:
+                continue
+            path = os.path.join(directory, name)
+            if previous is None:
+                created.append((path, entry))
+            elif previous.is_dir != entry.is_dir:
+                self.__delete(path, previous, deleted)
+                created.append((path, entry))
+            elif not entry.is_dir:
+                modified.append(path)
+        for name, entry in old.items():
+            if name not in new:
+                self.__delete(os.path.join(directory, name), entry, deleted)
+        self.__dirs[directory] = new
+
+    def __delete(
+        self, path: str, entry: Snapshot, deleted: list[tuple[str, Snapshot]]
+    ) -> None:
+        if entry.is_dir:
+            self.__forget(path, deleted)
+        deleted.append((path, entry))
+
+    def __forget(self, directory: str, deleted: list[tuple[str, Snapshot]]) -> None:
+        """
+        Drops a directory and everything below it from the snapshot, reporting its contents as
+        deleted.
+        """
+        for name, entry in self.__dirs.pop(directory, {}).items():
+            self.__delete(os.path.join(directory, name), entry, deleted)
+        self.__ignored.pop(directory, None)
+
+    def __adapt_interval(self) -> None:
+        interval = max(self.interval, self.scan_time * SCAN_SHARE)
+        stretched = interval > self.interval
+        if stretched != (self.current_interval > self.interval):
+            if stretched:
+                log(
+                    "info",
+                    f"a scan of {self.file_count} file(s) takes {self.scan_time * 1000:.0f} ms, "
+                    f"polling every {interval * 1000:.0f} ms instead",
+                )
+            else:
+                log("info", f"polling every {interval * 1000:.0f} ms again")
+        self.current_interval = interval
+
+    def __dispatch(
+        self,
+        created: list[tuple[str, Snapshot]],
+        deleted: list[tuple[str, Snapshot]],
+        modified: list[str],
+    ) -> bool:
+        """
+        Hands the changes found by a scan to the event handler. Returns `True` if an ignore file
+        changed.
+        """
+        events: list[FileSystemEvent] = []
+        moved_from = {
+            entry.inode: path for path, entry in deleted if not entry.is_dir and entry.inode
+        }
+        events.extend(DirDeletedEvent(path) for path, entry in deleted if entry.is_dir)
+        for path, entry in created:
+            if entry.is_dir:
+                events.append(DirCreatedEvent(path))
+                continue
+            source = moved_from.pop(entry.inode, None)
+            events.append(FileMovedEvent(source, path) if source else FileCreatedEvent(path))
+        # the deleted files which weren't moved
+        events.extend(FileDeletedEvent(path) for path in moved_from.values())
+        events.extend(FileModifiedEvent(path) for path in modified)
+
+        ignore_rules_changed = False
+        for event in events:
+            for path in (event.src_path, event.dest_path):
+                if path and IgnoreIndex.is_ignore_file(path):
+                    ignore_rules_changed = True
+            self.event_handler.dispatch(event)
+        return ignore_rules_changed
@@ -0,0 +1,186 @@
+import os
+import re
+import socket
+from threading import Event, Thread
+from time import monotonic
+from typing import Callable
+
+from stellapy.configuration import Script
+from stellapy.listener import address_from_url
+from stellapy.logger import log
+
+PROBE_INTERVAL = 0.025  # seconds
+PROBE_CONNECT_TIMEOUT = 0.5  # seconds
+
+
+class ReadinessProbe:
+    """
+    Base class for the strategies used to detect when a freshly started app is ready to serve.
+    """
+
+    def reset(self) -> None:
+        """
+        Called every time the app is (re)started.
+        """
+        pass
+
+    def wait(self, timeout: float) -> bool:
+        """
+        Blocks for at most `timeout` seconds, returning `True` as soon as the app is ready.
+        """
+        raise NotImplementedError
+
+
+class TCPProbe(ReadinessProbe):
+    """
+    Considers the app ready once a TCP connection to its port succeeds.
+    """
+
+    def __init__(self, url: str) -> None:
+        self.address = address_from_url(url)
+
+    def wait(self, timeout: float) -> bool:
+        started = monotonic()
+        try:
+            with socket.create_connection(
+                self.address, timeout=min(timeout, PROBE_CONNECT_TIMEOUT)
+            ):
+                return True
+        except OSError:
+            Event().wait(max(0, timeout - (monotonic() - started)))
+            return False
+
+
+class HTTPProbe(ReadinessProbe):
+    """
+    Considers the app ready once a GET request to its URL gets a response with a status code
+    below 500.
+    """
+
+    def __init__(self, url: str) -> None:
+        self.url = url if "://" in url else f"http://{url}"
+
+    def wait(self, timeout: float) -> bool:
+        # urllib is slow to import, and only needed by this probe
+        import urllib.error
+        import urllib.request
+
+        started = monotonic()
+        try:
+            with urllib.request.urlopen(
+                self.url, timeout=max(timeout, PROBE_CONNECT_TIMEOUT)
+            ):
+                return True
+        except urllib.error.HTTPError as e:
+            if e.code < 500:
+                return True
+        except (OSError, ValueError):
+            pass
+        Event().wait(max(0, timeout - (monotonic() - started)))
+        return False
+
+
+class OutputProbe(ReadinessProbe):
+    """
+    Considers the app ready once a line of its output matches a regular expression.
+    """
+
+    def __init__(self, pattern: str) -> None:
+        self.pattern = re.compile(pattern)
+        self.__ready = Event()
+
+    def feed(self, line: str) -> None:
+        if not self.__ready.is_set() and self.pattern.search(line):
+            self.__ready.set()
+
+    def reset(self) -> None:
+        self.__ready.clear()
+
+    def wait(self, timeout: float) -> bool:
+        return self.__ready.wait(timeout)
+
+
+def build_probe(script: Script) -> ReadinessProbe | None:
+    """
+    Returns the readiness probe configured for the script, or `None` if the browser should be
+    reloaded after the fixed `browser_wait_interval`.
+    """
+    match script.readiness:
+        case "delay":
+            return None
+        case "tcp" if script.socket_activation and os.name != "nt":
+            # stella holds the port itself, so connecting always succeeds right away
+            log(
+                "warning",
+                "the `tcp` readiness probe can't tell when the app is ready with "
+                "`socket_activation`, using the `http` one instead",
+            )
+            return HTTPProbe(script.url)
+        case "tcp":
+            return TCPProbe(script.url)
+        case "http":
+            return HTTPProbe(script.url)
+        case "output":
+            return OutputProbe(script.ready_pattern)
+        case _:
+            # this should never happen because of configuration validation
+            raise ValueError(f"invalid readiness={script.readiness}")
+
+
+class ReadinessWaiter:
+    """
+    Runs a readiness probe in a background thread after every (re)start of the app and calls back
+    once it is ready, or once the timeout has passed.
+    """
+
+    def __init__(
+        self,
+        probe: ReadinessProbe,
+        timeout: float,
+        on_ready: Callable[[float], None],
+        on_timeout: Callable[[], None],
+    ) -> None:
+        """
+        `timeout` is in seconds, `on_ready` is called with the time it took for the app to become
+        ready, in seconds.
+        """
+        self.probe = probe
+        self.timeout = timeout
+        self.on_ready = on_ready
+        self.on_timeout = on_timeout
+        self.__cancelled = Event()
+
+    def arm(self) -> None:
+        """
+        Abandons any previous wait and resets the probe. Called right before the app is spawned,
+        so that nothing it prints before `start` is missed.
+        """
+        self.cancel()
+        self.__cancelled = Event()
+        self.probe.reset()
+
+    def start(self) -> None:
+        """
+        Starts waiting for the app which was just started, in a background thread.
+        """
+        Thread(target=self.__wait, args=(self.__cancelled,), daemon=True).start()
+
+    def cancel(self) -> None:
+        self.__cancelled.set()
+
+    def __wait(self, cancelled: Event) -> None:
+        started = monotonic()
+        deadline = started + self.timeout
+        while not cancelled.is_set():
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                self.on_timeout()
+                return
+            try:
+                ready = self.probe.wait(min(PROBE_INTERVAL, remaining))
+            except Exception as e:
+                log("error", f"readiness probe failed: {e}")
+                ready = False
+            if ready and not cancelled.is_set():
+                self.on_ready(monotonic() - started)
+                return
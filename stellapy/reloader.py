@@ -1,21 +1,25 @@
+import os
+import sys
 from dataclasses import dataclass
 from datetime import datetime, timedelta
 from logging import exception
-from threading import Lock, Thread
-from time import sleep
+from heapq import heappop, heappush
+from threading import Condition, Lock, Thread
 from typing import Any, Callable, Generic, TypeVar
 
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.common.exceptions import NoSuchElementException
-from watchdog.observers import Observer
-
 from stellapy.configuration import Configuration, load_configuration_handle_errors
+from stellapy.debounce import ChangeBatch
 from stellapy.executor import Executor
-from stellapy.logger import log
-from stellapy.walker import GitignoreMatchingEventHandler
+from stellapy.logger import flush as flush_log, log
+from stellapy.output import OutputMultiplexer
+from stellapy.readiness import OutputProbe, ReadinessWaiter, build_probe
+from stellapy.routing import ActionRouter, run_command
+from stellapy.supervisor import Supervisor
+from stellapy.timeline import RestartCycle, TimelineRecorder
+from stellapy.watcher import Watcher
 
 T = TypeVar("T")
+RECENT_OUTPUT_LINES = 50  # shown by `lo`
 ActionFunc = Callable[["Trigger"], None]
 ErrorHandlerFunc = Callable[["Trigger", Exception], None]
 
@@ -23,7 +27,8 @@ ErrorHandlerFunc = Callable[["Trigger", Exception], None]
 @dataclass(frozen=True)
 class Trigger(Generic[T]):
     """
-    Similar to contexts in go, a trigger carries an action to perform at a certain datetime, along with an error handler and a value.
+    Similar to contexts in go, a trigger carries an action to perform at a certain datetime, along
+    with an error handler and a value.
     """
 
     action: ActionFunc
@@ -37,46 +42,120 @@ class Trigger(Generic[T]):
 
 class TriggerQueue:
     """
-    A list of triggers offering some useful and thread-safe methods.
-    The type variable `T` is used for the value of Trigger.
+    A deadline-ordered, thread-safe queue of triggers.
+
+    Triggers are kept in a heap ordered by their deadline, so the thread calling `run` sleeps until
+    the earliest trigger is due, and is woken up early whenever a trigger is added or cancelled.
     """
 
     def __init__(self) -> None:
-        self.triggers: list[Trigger[Any]] = []
-        self.__lock = Lock()
+        self.__heap: list[tuple[datetime, int, Trigger[Any]]] = []
+        self.__pending: set[int] = set()  # handles of triggers not yet fired or cancelled
+        self.__next_handle = 0
+        self.__cond = Condition()
+        self.__stopped = False
+        self.fired_count = 0
+
+    @property
+    def pending_count(self) -> int:
+        return len(self.__pending)
+
+    def add(self, trigger: Trigger[Any]) -> int:
+        """
+        Add a trigger to the queue. Returns a handle which can be passed to `cancel`.
+        """
+        with self.__cond:
+            handle = self.__next_handle
+            self.__next_handle += 1
+            heappush(self.__heap, (trigger.when, handle, trigger))
+            self.__pending.add(handle)
+            self.__cond.notify()
+            return handle
+
+    def cancel(self, handle: int) -> bool:
+        """
+        Cancel a single trigger. Returns `False` if it has already fired or been cancelled.
+        """
+        with self.__cond:
+            if handle not in self.__pending:
+                return False
+            self.__pending.discard(handle)
+            self.__cond.notify()
+            return True
 
-    def add(self, trigger: Trigger[Any]):
+    def cancel_all(self):
         """
-        Add a trigger to the queue.
+        Cancel all the scheduled triggers.
         """
-        with self.__lock:
-            self.triggers.append(trigger)
+        with self.__cond:
+            self.__heap.clear()
+            self.__pending.clear()
+            self.__cond.notify()
 
     def execute_remaining(self):
         """
         Executes all the triggers that need to be executed, i.e., whose deadline has been reached.
         """
-        now = datetime.now()
-        with self.__lock:
-            # store all ready triggers in a temp list
-            to_execute = [t for t in self.triggers if now >= t.when]
-            self.triggers = [t for t in self.triggers if t not in to_execute]
+        with self.__cond:
+            to_execute = self.__pop_due(datetime.now())
 
         for trigger in to_execute:
-            try:
-                trigger.action(trigger)
-            except Exception as e:
-                if trigger.error_handler:
-                    trigger.error_handler(trigger, e)
-                else:
-                    raise e
+            self.__execute(trigger)
 
-    def cancel_all(self):
+    def run(self):
         """
-        Cancel all the scheduled triggers.
+        Executes the triggers as they become due, until `stop` is called.
+        """
+        while True:
+            with self.__cond:
+                while not self.__stopped:
+                    self.__drop_cancelled()
+                    if not self.__heap:
+                        self.__cond.wait()
+                        continue
+                    timeout = (self.__heap[0][0] - datetime.now()).total_seconds()
+                    if timeout <= 0:
+                        break
+                    self.__cond.wait(timeout)
+                if self.__stopped:
+                    return
+                to_execute = self.__pop_due(datetime.now())
+
+            for trigger in to_execute:
+                self.__execute(trigger)
+
+    def stop(self):
+        """
+        Cancels all the triggers and makes `run` return.
         """
-        with self.__lock:
-            self.triggers.clear()
+        with self.__cond:
+            self.__stopped = True
+            self.__heap.clear()
+            self.__pending.clear()
+            self.__cond.notify_all()
+
+    def __drop_cancelled(self):
+        while self.__heap and self.__heap[0][1] not in self.__pending:
+            heappop(self.__heap)
+
+    def __pop_due(self, now: datetime) -> list[Trigger[Any]]:
+        due = []
+        while self.__heap and self.__heap[0][0] <= now:
+            _, handle, trigger = heappop(self.__heap)
+            if handle in self.__pending:
+                self.__pending.discard(handle)
+                due.append(trigger)
+        self.fired_count += len(due)
+        return due
+
+    def __execute(self, trigger: Trigger[Any]):
+        try:
+            trigger.action(trigger)
+        except Exception as e:
+            if trigger.error_handler:
+                trigger.error_handler(trigger, e)
+            else:
+                raise e
 
 
 class Reloader:
@@ -85,11 +164,23 @@ class Reloader:
     """
 
     def __init__(
-        self, config: Configuration, script_name: str, config_file: str
+        self,
+        config: Configuration,
+        script_name: str,
+        config_file: str,
+        watcher: Watcher | None = None,
+        output_prefix: str = "",
+        port_offset: int = 0,
+        timeline: TimelineRecorder | None = None,
     ) -> None:
         """
         Constructs the Reloader class. Sets a lot of instance variables used from the config. The
         `config_file` is the path to the config file.
+
+        When running several scripts side by side, they share a `watcher` and a `timeline`, every
+        line of their output is prefixed with `output_prefix`, and their livereload ports are
+        shifted by `port_offset`. Otherwise the reloader creates and owns a watcher and a timeline
+        of its own.
         """
         self.config = config
         self.script = self.config.find_script(script_name)
@@ -100,23 +191,57 @@ class Reloader:
             )
             exit(1)
         self.config_file = config_file
-        self.executor = Executor(self.script)
         self.url = self.script.url
         self.RELOAD_BROWSER = bool(self.url)
+        self.livereload: "LiveReloadServer | None" = None
+        if self.RELOAD_BROWSER and self.config.browser == "livereload":
+            from stellapy.livereload import LiveReloadServer
+
+            proxy_port = self.config.livereload_proxy_port
+            self.livereload = LiveReloadServer(
+                self.config.livereload_port + port_offset,
+                self.url,
+                proxy_port + port_offset if proxy_port else 0,
+            )
 
-        # watchdog observer
-        self.observer = Observer()
-        self.observer.schedule(
-            GitignoreMatchingEventHandler(
-                self.config.include_only, self.config.poll_interval, self._restart
+        # readiness detection, the browser is reloaded after a fixed delay if there's no probe
+        self.readiness_waiter: ReadinessWaiter | None = None
+        probe = build_probe(self.script)
+        if probe:
+            self.readiness_waiter = ReadinessWaiter(
+                probe,
+                self.script.readiness_timeout / 1000,
+                self._on_ready,
+                self._on_ready_timeout,
+            )
+        self.executor = Executor(
+            self.script,
+            self.config.grace_interval,
+            self._build_output(
+                probe.feed if isinstance(probe, OutputProbe) else None, output_prefix
+            ),
+            Supervisor(
+                self.config.monitor_interval / 1000,
+                self.config.memory_growth_warning,
+                self._on_exit,
             ),
-            ".",
-            recursive=True,
+            self.readiness_waiter.arm if self.readiness_waiter else None,
         )
 
+        # file watching
+        self.owns_watcher = watcher is None
+        self.watcher = watcher or Watcher(self.config)
+        self.watcher.subscribe(self._on_changes)
+        self.router = ActionRouter(self.script.actions)
+
+        # restart timing
+        self.owns_timeline = timeline is None
+        self.timeline = timeline or TimelineRecorder(self.config.timeline)
+        self._cycle: RestartCycle | None = None
+        self._cycle_lock = Lock()
+
         # trigger executor
-        self._finished = False  # used by trigger thread to look for exits
-        self.trigger_execution_interval = 0.1  # seconds
+        self._finished = False  # used by the input thread to look for exits
         self.trigger_queue = TriggerQueue()
         self.trigger_thread = Thread(target=self._trigger_executor)
         self.trigger_thread.start()
@@ -127,17 +252,53 @@ class Reloader:
             milliseconds=self.config.browser_wait_interval
         )
 
+    def _build_output(
+        self, callback: Callable[[str], None] | None, prefix: str
+    ) -> OutputMultiplexer | None:
+        """
+        Returns the multiplexer the output of the app is piped through, or `None` if the app can
+        write to the terminal directly.
+        """
+        config = self.config
+        if not (
+            callback
+            or prefix
+            or config.output == "pipe"
+            or config.output_timestamps
+            or config.log_dir
+        ):
+            return None
+        log_file = ""
+        if config.log_dir:
+            log_file = os.path.join(config.log_dir, f"{self.script.name.lower()}.log")  # type: ignore
+        return OutputMultiplexer(
+            prefix,
+            callback,
+            config.output_timestamps,
+            config.output_history,
+            log_file,
+            config.log_max_bytes,
+            config.log_backups,
+        )
+
     def _trigger_executor(self):
         """
-        Executes all the remaining triggers in the trigger queue until `self._finished`
-        is set to `True`.
+        Executes the triggers in the trigger queue as they become due, until the queue is stopped.
         """
-        while not self._finished:
-            self.trigger_queue.execute_remaining()
-            sleep(self.trigger_execution_interval)
+        self.trigger_queue.run()
 
     def _start_browser(self):
-        # selenium driver
+        if self.livereload:
+            try:
+                self.livereload.start()
+            except OSError as e:
+                log("error", f"unable to start the livereload server: {e}")
+                self.stop()
+            return
+
+        # selenium driver, imported here since it's slow to import and not always needed
+        from selenium import webdriver
+
         if self.config.browser not in ("firefox", "chrome", "safari", "edge"):
             # this should never happen because of configuration validation
             raise Exception(f"invalid browser={self.config.browser}")
@@ -169,7 +330,8 @@ class Reloader:
             elif "net::ERR_" in se or "Reached error page" in se:
                 log(
                     "error",
-                    f"browser startup failed, retrying in {self._displayable_seconds_from_timedelta(self.browser_wait_delta)} seconds",
+                    "browser startup failed, retrying in "
+                    f"{self._displayable_seconds_from_timedelta(self.browser_wait_delta)} seconds",
                 )
                 self.trigger_queue.add(
                     Trigger(
@@ -188,6 +350,14 @@ class Reloader:
         """
         A helper function used in browser reload triggers.
         """
+        if self.livereload:
+            self.livereload.reload()
+            self._mark_cycle("browser_refreshed")
+            return
+
+        from selenium.common.exceptions import NoSuchElementException
+        from selenium.webdriver.common.by import By
+
         self.driver.refresh()
         # firefox throws an error via selenium if the refresh wasn't successfull
         # chrome and edge don't, so we can't call the error handler function (exponential backoff)
@@ -199,10 +369,11 @@ class Reloader:
             try:
                 el = self.driver.find_element(By.CLASS_NAME, "neterror")
             except NoSuchElementException:
-                return
+                pass
             else:
                 if el.tag_name == "body":
                     raise Exception("failed to load page")
+        self._mark_cycle("browser_refreshed")
 
     @staticmethod
     def _displayable_seconds_from_timedelta(t: timedelta):
@@ -229,23 +400,204 @@ class Reloader:
             )
         )
 
-    def _restart(self):
-        log(
-            "info",
-            "detected changes in the project, reloading server and browser",
-        )
+    @property
+    def _for_script(self) -> str:
+        """
+        Names the script in log messages, when several scripts are running.
+        """
+        return "" if self.owns_watcher else f" of `{self.script.name}`"  # type: ignore
+
+    @staticmethod
+    def _describe_paths(paths: list[str]) -> str:
+        shown = ", ".join(f"`{p}`" for p in paths[:3])
+        more = f" and {len(paths) - 3} more" if len(paths) > 3 else ""
+        return f"{shown}{more}"
+
+    @classmethod
+    def _describe_batch(cls, batch: ChangeBatch) -> str:
+        if not batch.collapsed:
+            return cls._describe_paths(batch.paths)
+        return f"{batch.describe()} ({cls._describe_paths(sorted(batch.summaries))})"
+
+    def _on_changes(self, batch: ChangeBatch):
+        """
+        Called with every batch of changes from the watcher, decides what to do about them.
+        """
+        route = self.router.route(batch)
+        for command in route.commands:
+            run_command(command)
+        if route.restart:
+            self._restart(batch)
+        elif route.reload_browser:
+            log(
+                "info",
+                f"detected changes in {self._describe_batch(batch)}, reloading browser{self._for_script}",
+            )
+            if self._browser_started():
+                self._add_browser_reload_trigger(timedelta())
+        elif route.empty:
+            log(
+                "info",
+                f"ignored changes in {self._describe_paths(route.ignored)}{self._for_script}",
+            )
+
+    def _restart(self, batch: ChangeBatch | None = None):
         # cancel all prev triggers, because we got a new change
         self.trigger_queue.cancel_all()
-        self.executor.re_execute()
-        if self.RELOAD_BROWSER:
-            self.trigger_queue.add(
-                Trigger[timedelta](
-                    action=self._browser_reloader,
-                    when=datetime.now() + self.browser_wait_delta,
-                    error_handler=self._browser_reload_error_handler,
-                    value=self.browser_wait_delta,
-                ),
+        if self.readiness_waiter:
+            self.readiness_waiter.cancel()
+        cycle = self._begin_cycle("change", batch)
+        # a collapsed batch doesn't tell which modules changed
+        if batch and not batch.collapsed and self.executor.hot_reload(batch.paths):
+            self._mark_cycle("hot_reloaded")
+            # the app kept running, so it's ready right away
+            if self._browser_started():
+                self._add_browser_reload_trigger(timedelta())
+            else:
+                self._finish_cycle()
+            return
+        if batch:
+            log(
+                "info",
+                f"detected changes in {self._describe_batch(batch)}, reloading server and browser{self._for_script}",
+            )
+        else:
+            log(
+                "info",
+                f"detected changes in the project, reloading server and browser{self._for_script}",
+            )
+        self.executor.re_execute(
+            list(batch.changes) if batch else None,
+            cycle,
+            list(batch.summaries) if batch else None,
+        )
+        self._schedule_browser_reload()
+        self._after_restart(cycle)
+
+    def _restart_now(self, trigger: str) -> None:
+        """
+        Restarts the app without any changes to go by, like on `rs`.
+        """
+        self.trigger_queue.cancel_all()
+        if self.readiness_waiter:
+            self.readiness_waiter.cancel()
+        cycle = self._begin_cycle(trigger)
+        self.executor.re_execute(cycle=cycle)
+        self._schedule_browser_reload()
+        self._after_restart(cycle)
+
+    def _on_exit(self, code: int | None) -> None:
+        """
+        Called by the supervisor when the app exits on its own, restarts it if `auto_restart` says
+        so. Apps which keep exiting shortly after starting are restarted after a growing delay.
+        """
+        if self.readiness_waiter:
+            self.readiness_waiter.cancel()
+        policy = self.script.auto_restart  # type: ignore
+        if self._finished or policy == "never" or (policy == "on_failure" and code == 0):
+            if code != 0:
+                log("error", f"waiting for file changes to restart{self._for_script}...")
+            self._finish_cycle()
+            return
+        delay = self.executor.supervisor.backoff()
+        log("info", f"restarting{self._for_script} in {delay:.1f} s")
+        self.trigger_queue.add(
+            Trigger[int | None](
+                action=lambda _: self._restart_now("crash"),
+                when=datetime.now() + timedelta(seconds=delay),
+                error_handler=None,
+                value=code,
             )
+        )
+
+    def _begin_cycle(
+        self, trigger: str, batch: ChangeBatch | None = None
+    ) -> RestartCycle | None:
+        """
+        Starts timing a restart, emitting the previous cycle if it's still unfinished.
+        """
+        self._finish_cycle()
+        if not self.timeline.enabled:
+            return None
+        cycle = self.timeline.begin(self.script.name, trigger, len(batch) if batch else 0)  # type: ignore
+        if batch:
+            cycle.mark("event", batch.first_event_at)
+            cycle.mark("debounced", batch.flushed_at)
+        with self._cycle_lock:
+            self._cycle = cycle
+        return cycle
+
+    def _last_phase(self) -> str:
+        """
+        The phase which completes a restart cycle of this script.
+        """
+        if self._browser_started():
+            return "browser_refreshed"
+        if self.readiness_waiter:
+            return "ready"
+        return "spawned"
+
+    def _mark_cycle(self, phase: str) -> None:
+        with self._cycle_lock:
+            cycle = self._cycle
+        if not cycle:
+            return
+        cycle.mark(phase)
+        if phase == self._last_phase():
+            self._finish_cycle()
+
+    def _after_restart(self, cycle: RestartCycle | None) -> None:
+        # nothing else is going to happen if the app didn't start, or if it needn't get ready
+        if cycle and ("spawned" not in cycle.marks or self._last_phase() == "spawned"):
+            self._finish_cycle()
+
+    def _finish_cycle(self) -> None:
+        with self._cycle_lock:
+            cycle, self._cycle = self._cycle, None
+        if cycle:
+            self.timeline.emit(cycle)
+
+    def _schedule_browser_reload(self):
+        """
+        Schedules the browser reload for the freshly started app, either as soon as the readiness
+        probe succeeds or after `browser_wait_interval`.
+        """
+        if self.readiness_waiter:
+            self.readiness_waiter.start()
+        elif self.RELOAD_BROWSER:
+            self._add_browser_reload_trigger(self.browser_wait_delta)
+
+    def _add_browser_reload_trigger(self, delay: timedelta):
+        self.trigger_queue.add(
+            Trigger[timedelta](
+                action=self._browser_reloader,
+                when=datetime.now() + delay,
+                error_handler=self._browser_reload_error_handler,
+                value=self.browser_wait_delta,
+            ),
+        )
+
+    def _on_ready(self, elapsed: float):
+        log("stella", f"the app is ready, took {elapsed * 1000:.0f} ms")
+        self._mark_cycle("ready")
+        # the initial page load is done by `_start_browser` itself
+        if self._browser_started():
+            self._add_browser_reload_trigger(timedelta())
+
+    def _on_ready_timeout(self):
+        log(
+            "error",
+            f"the app wasn't ready within {self.script.readiness_timeout / 1000:.1f} seconds",  # type: ignore
+        )
+        if self._browser_started():
+            self._add_browser_reload_trigger(timedelta())
+        else:
+            self._finish_cycle()
+
+    def _browser_started(self) -> bool:
+        return self.RELOAD_BROWSER and (
+            self.livereload is not None or hasattr(self, "driver")
+        )
 
     def manual_input(self) -> None:
         """
@@ -256,56 +608,73 @@ class Reloader:
                 message = input().lower().strip()
             except EOFError:
                 break
+            self.handle_input(message)
 
-            if message == "ex":
-                log("info", "stopping server")
-                self.stop()
+    def handle_input(self, message: str) -> None:
+        """
+        Handles a single manual command.
+        """
+        if message == "ex":
+            log("info", "stopping server")
+            self.stop()
 
-            elif message == "rs":
-                log("info", "restarting the server")
-                self.trigger_queue.cancel_all()
-                self.executor.re_execute()
-                if self.RELOAD_BROWSER:
-                    self.trigger_queue.add(
-                        Trigger(
-                            action=self._browser_reloader,
-                            when=datetime.now() + self.browser_wait_delta,
-                            error_handler=self._browser_reload_error_handler,
-                            value=self.browser_wait_delta,
-                        )
-                    )
+        elif message == "rs":
+            log("info", f"restarting the server of `{self.script.name}`")  # type: ignore
+            self._restart_now("manual")
 
-            elif message == "rb":
-                if self.RELOAD_BROWSER:
-                    try:
-                        log("info", "trying to reload browser window")
+        elif message == "rb":
+            if self.RELOAD_BROWSER:
+                try:
+                    log("info", "trying to reload browser window")
+                    if self.livereload:
+                        self.livereload.reload()
+                    else:
                         self.driver.refresh()
-                    except Exception:
-                        log("error", "unable to refresh browser window")
-                else:
-                    log(
-                        "stella",
-                        "no browser URL is configured, can't refresh browser window",
-                    )
-
-            elif message == "rc":
+                except Exception:
+                    log("error", "unable to refresh browser window")
+            else:
                 log(
                     "stella",
-                    "attempting to reload configuration, stopping existing commands and browser windows",
+                    "no browser URL is configured, can't refresh browser window",
                 )
-                self.stop()
-                cfg_file, new_config = load_configuration_handle_errors(
-                    self.config_file
+
+        elif message == "lo":
+            output = self.executor.output
+            if not output:
+                log(
+                    "stella",
+                    "the output of the app isn't captured, set `output: pipe` to keep its last lines",
                 )
-                self.__init__(new_config, self.script.name, cfg_file)  # type: ignore
-                # ignore above because if self.script was None program would've already quit in __init__
-                self.start()
+                return
+            lines = output.recent(RECENT_OUTPUT_LINES)
+            log("stella", f"the last {len(lines)} line(s) of output{self._for_script}:")
+            flush_log()
+            sys.stdout.writelines(output.prefix + line for line in lines)
+            sys.stdout.flush()
+
+        elif message == "st":
+            log("stella", f"{self.executor.supervisor.status()}{self._for_script}")
+
+        elif message == "rc":
+            log(
+                "stella",
+                "attempting to reload configuration, stopping existing commands and browser windows",
+            )
+            self.stop()
+            cfg_file, new_config = load_configuration_handle_errors(self.config_file)
+            self.__init__(new_config, self.script.name, cfg_file)  # type: ignore
+            # ignore above because if self.script was None program would've already quit in __init__
+            self.start()
 
     def stop(self):
         try:
             self.trigger_queue.cancel_all()
-            self.executor.close()
-            if self.RELOAD_BROWSER:
+            if self.readiness_waiter:
+                self.readiness_waiter.cancel()
+            self.executor.shutdown()
+            if self.livereload:
+                self.livereload.stop()
+            elif self.RELOAD_BROWSER:
                 if getattr(self, "driver", "!nope!") != "!nope!":
                     # condition to check if driver was initialized
                     self.driver.quit()
@@ -317,36 +686,141 @@ class Reloader:
             exception(e)
         finally:
             self._finished = True
-            if self.observer.is_alive():
-                self.observer.stop()
-                self.observer.join()
+            self.trigger_queue.stop()
+            self._finish_cycle()
+            if self.owns_timeline:
+                self.timeline.close()
+            if self.owns_watcher:
+                self.watcher.stop()
 
     def start(self) -> None:
         """
         Starts the server. All reloading and stuff is done here.
         """
-        log("stella", "starting stella")
-        log(
-            "stella",
-            f"using config file located at `{self.config_file}`",
-        )
+        # a shared watcher belongs to a `MultiReloader`, which handles the input as well
+        standalone = self.owns_watcher
+        if standalone:
+            log("stella", "starting stella")
+            log(
+                "stella",
+                f"using config file located at `{self.config_file}`",
+            )
         browser_text = f"and listening at `{self.url}` on the browser"
         log(
             "stella",
-            f"executing `{self.executor.command_to_display if self.script else ''}` {browser_text if self.RELOAD_BROWSER else ''}",
-        )
-        browser_text = ", `rb` to refresh browser page"
-        log(
-            "stella",
-            f"input `rs` to manually restart the server{browser_text if self.RELOAD_BROWSER else ''} & `ex` to stop the server",
+            f"executing `{self.executor.command_to_display if self.script else ''}` "
+            f"{browser_text if self.RELOAD_BROWSER else ''}",
         )
-        # running the input thread as daemon would allow the program
-        #  to exit even if the input thread is still running
-        input_thread = Thread(target=self.manual_input, daemon=True)
-        input_thread.start()
+        if standalone:
+            browser_text = ", `rb` to refresh browser page"
+            log(
+                "stella",
+                f"input `rs` to manually restart the server{browser_text if self.RELOAD_BROWSER else ''}, "
+                "`lo` to show the last lines of output, `st` to show the status of the app & `ex` to "
+                "stop the server",
+            )
+            # running the input thread as daemon would allow the program
+            #  to exit even if the input thread is still running
+            input_thread = Thread(target=self.manual_input, daemon=True)
+            input_thread.start()
         self.executor.start()
+        if self.readiness_waiter:
+            self.readiness_waiter.start()
         if self.RELOAD_BROWSER:
             self._start_browser()
 
-        self.observer.start()
+        if self.owns_watcher:
+            self.watcher.start()
         # self.restart()
+
+
+class MultiReloader:
+    """
+    Runs several scripts side by side in a single process.
+
+    The scripts share one watcher, so the project is only watched and filtered once, while every
+    script keeps its own executor, browser and restart policy. The output of every script is
+    prefixed with its name.
+    """
+
+    def __init__(
+        self, config: Configuration, script_names: list[str], config_file: str
+    ) -> None:
+        self.config = config
+        self.script_names = script_names
+        self.config_file = config_file
+        self.watcher = Watcher(config)
+        self.timeline = TimelineRecorder(config.timeline)
+        width = max(len(name) for name in script_names)
+        self.reloaders = [
+            Reloader(
+                config,
+                name,
+                config_file,
+                watcher=self.watcher,
+                output_prefix=f"[{name.lower().ljust(width)}] ",
+                port_offset=index,
+                timeline=self.timeline,
+            )
+            for index, name in enumerate(script_names)
+        ]
+        self._finished = False
+
+    def start(self) -> None:
+        log("stella", f"starting stella with {len(self.reloaders)} scripts")
+        log("stella", f"using config file located at `{self.config_file}`")
+        log(
+            "stella",
+            "input `rs` to restart all scripts or `rs NAME` to restart one, "
+            "`rb [NAME]` to refresh browser pages, `lo [NAME]` to show the last lines of output, "
+            "`st [NAME]` to show the status of the apps & `ex` to stop",
+        )
+        Thread(target=self.manual_input, daemon=True).start()
+        # start the scripts concurrently, so that one's steps don't hold up the others
+        threads = [Thread(target=reloader.start) for reloader in self.reloaders]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.watcher.start()
+
+    def manual_input(self) -> None:
+        while not self._finished:
+            try:
+                command, *names = input().lower().split() or [""]
+            except EOFError:
+                break
+
+            if command == "ex":
+                log("info", "stopping server")
+                self.stop()
+
+            elif command == "rc":
+                log(
+                    "stella",
+                    "attempting to reload configuration, stopping existing commands and browser windows",
+                )
+                self.stop()
+                cfg_file, new_config = load_configuration_handle_errors(
+                    self.config_file
+                )
+                self.__init__(new_config, self.script_names, cfg_file)
+                self.start()
+
+            elif command in ("rs", "rb", "lo", "st"):
+                targets = [
+                    reloader
+                    for reloader in self.reloaders
+                    if not names or reloader.script.name.lower() in names  # type: ignore
+                ]
+                if not targets:
+                    log("error", f"no script named {', '.join(names)} is running")
+                for reloader in targets:
+                    reloader.handle_input(command)
+
+    def stop(self) -> None:
+        for reloader in self.reloaders:
+            reloader.stop()
+        self.watcher.stop()
+        self.timeline.close()
+        self._finished = True
@@ -0,0 +1,105 @@
+import os
+import re
+import subprocess
+from dataclasses import dataclass, field
+from time import perf_counter
+from typing import Callable
+
+import gitignorefile
+
+from stellapy.configuration import ActionRule
+from stellapy.debounce import ChangeBatch
+from stellapy.logger import log
+
+WILDCARDS = re.compile(r"[*?\[\]!]")
+
+
+def specificity(pattern: str) -> int:
+    """
+    Returns how specific a pattern is, i.e. its number of literal characters. `static/css/*.css`
+    is more specific than `*.css`.
+    """
+    return len(WILDCARDS.sub("", pattern))
+
+
+@dataclass
+class Route:
+    """
+    What to do about a batch of changes.
+    """
+
+    restart: bool = False
+    reload_browser: bool = False
+    commands: list[str] = field(default_factory=list)  # in the order of the rules
+    ignored: list[str] = field(default_factory=list)  # paths
+
+    @property
+    def empty(self) -> bool:
+        return not (self.restart or self.reload_browser or self.commands)
+
+
+class ActionRouter:
+    """
+    Routes changed paths to the action of the most specific rule matching them. Paths without a
+    matching rule restart the server.
+    """
+
+    def __init__(self, rules: list[ActionRule]) -> None:
+        compiled: list[tuple[ActionRule, Callable[..., bool]]] = []
+        for rule in rules:
+            if rule.action == "command" and not rule.command:
+                log("error", f"the `{rule.pattern}` command rule has no command, ignoring it")
+                continue
+            match = gitignorefile._IgnoreRules(
+                [gitignorefile._rule_from_pattern(rule.pattern)], "."
+            ).match
+            compiled.append((rule, match))
+        # most specific first, the order of the config breaks ties
+        self.rules = sorted(compiled, key=lambda pair: -specificity(pair[0].pattern))
+
+    def rule_for(self, path: str) -> ActionRule | None:
+        is_dir = os.path.isdir(path)
+        for rule, match in self.rules:
+            if match(path, is_dir):
+                return rule
+        return None
+
+    def route(self, batch: ChangeBatch) -> Route:
+        route = Route()
+        for path in batch.paths:
+            rule = self.rule_for(path)
+            action = rule.action if rule else "restart"
+            match action:
+                case "restart":
+                    route.restart = True
+                case "reload_browser":
+                    route.reload_browser = True
+                case "command":
+                    if rule and rule.command not in route.commands:
+                        route.commands.append(rule.command)
+                case "ignore":
+                    route.ignored.append(path)
+                case _:
+                    # this should never happen because of configuration validation
+                    raise ValueError(f"invalid action={action}")
+        return route
+
+
+def run_command(command: str) -> int:
+    """
+    Runs the command of a `command` rule to completion, with its output going to the terminal.
+    Returns its exit code.
+    """
+    log("info", f"running `{command}`")
+    started = perf_counter()
+    try:
+        code = subprocess.run(command, shell=True).returncode
+    except OSError as e:
+        log("error", f"unable to run `{command}`: {e}")
+        return 1
+    elapsed = (perf_counter() - started) * 1000
+    if code:
+        log("error", f"`{command}` exited with code {code} after {elapsed:.0f} ms")
+    else:
+        log("info", f"`{command}` finished in {elapsed:.0f} ms")
+    return code
@@ -4,8 +4,7 @@ from logging import exception
 import click
 
 from stellapy.configuration import Configuration, load_configuration_handle_errors
-from stellapy.logger import log
-from stellapy.reloader import Reloader
+from stellapy.logger import LEVELS, configure, log
 
 NAME = "stella"
 VERSION = "0.4.0"
@@ -16,7 +15,22 @@ VERSION = "0.4.0"
 
 @click.group("stella")
 @click.version_option(VERSION, prog_name=NAME)
-def main():
+@click.option("--quiet", "-q", is_flag=True, help="Only log errors.")
+@click.option(
+    "--log-level",
+    type=click.Choice(list(LEVELS), case_sensitive=False),
+    default="info",
+    envvar="STELLA_LOG_LEVEL",
+    help="The lowest level of the messages which are logged.",
+)
+@click.option(
+    "--log-json",
+    required=False,
+    type=str,
+    envvar="STELLA_LOG_JSON",
+    help="Also write the log as JSON lines to this file, `-` writes them to stderr instead of logging to the terminal.",
+)
+def main(quiet: bool, log_level: str, log_json: str | None):
     """
     stella is a command line utility made to streamline your web development experience, by
     providing live reload capabilities for both the backend as well as the frontend code.
@@ -25,13 +39,14 @@ def main():
 
     Example Usage:\n
     $ stella init\n
-    $ stella run server
+    $ stella run server\n
+    $ stella --quiet run server
     """
-    pass
+    configure("error" if quiet else log_level, log_json or "")
 
 
 @main.command("run")
-@click.argument("script", default="default")
+@click.argument("scripts", nargs=-1)
 @click.option(
     "--config-file",
     "-c",
@@ -40,11 +55,14 @@ def main():
     help="Path to the config file that is to be used.",
     envvar="STELLA_CONFIG",
 )
-def run(script: str, config_file: str | None):
+def run(scripts: tuple[str, ...], config_file: str | None):
     """
     Run the specified script with stella. Expects one argument - the name of the script from a config
     file. If no argument is provided, stella will run the script named `default` from the config file.
 
+    Several scripts can be run side by side by passing all of their names. They share a single file
+    watcher, and their output is prefixed with their names.
+
     You can also pass a --config-file option pointing to the path of the config file to be used.
     Alternatively, an environment variable named `STELLA_CONFIG` can also be set for the same.
     This is generally not required since stella automatically attempts to find `stella.yml` file in the
@@ -53,12 +71,21 @@ def run(script: str, config_file: str | None):
     Examples: \n
     $ stella run  // runs the default script from config \n
     $ stella run [script_name]  // runs the given script from config \n
+    $ stella run api worker web  // runs several scripts together \n
     $ stella run [script_name] --config-file /path/to/stella.yml
     """
+    # the reloader pulls in watchdog and friends, only import it when it's needed
+    from stellapy.reloader import MultiReloader, Reloader
+
     config_file_used, config = load_configuration_handle_errors(config_file)
+    # dict.fromkeys deduplicates while keeping the order
+    script_names = list(dict.fromkeys(name.lower() for name in scripts)) or ["default"]
     reloader = None
     try:
-        reloader = Reloader(config, script, config_file_used)
+        if len(script_names) == 1:
+            reloader = Reloader(config, script_names[0], config_file_used)
+        else:
+            reloader = MultiReloader(config, script_names, config_file_used)
         reloader.start()
     except KeyboardInterrupt:
         log("info", "stopping server")
@@ -69,6 +96,94 @@ def run(script: str, config_file: str | None):
         exception(e)
 
 
+@main.command("stats")
+@click.option(
+    "--file",
+    "-f",
+    "timeline_file",
+    required=False,
+    type=str,
+    help="Path to the timeline file, defaults to the `timeline` of the config file.",
+)
+@click.option(
+    "--config-file",
+    "-c",
+    required=False,
+    type=str,
+    help="Path to the config file that is to be used.",
+    envvar="STELLA_CONFIG",
+)
+@click.option(
+    "--all", "all_sessions", is_flag=True, help="Summarize all sessions, not just the last one."
+)
+@click.option("--json", "as_json", is_flag=True, help="Print the summary as JSON.")
+def stats(
+    timeline_file: str | None, config_file: str | None, all_sessions: bool, as_json: bool
+):
+    """
+    Summarize the restart timings recorded in the timeline file. For every script and every phase
+    of a restart, the median (p50), the 95th percentile (p95) and the maximum duration are shown,
+    in milliseconds. Only the last `stella run` session is summarized, unless --all is given.
+
+    Examples: \n
+    $ stella stats \n
+    $ stella stats --all --json \n
+    $ stella stats --file timeline.jsonl
+    """
+    import json
+
+    from stellapy.timeline import UNIX_PREFIX, percentile, read_cycles, summarize
+
+    if not timeline_file:
+        _, config = load_configuration_handle_errors(config_file)
+        timeline_file = config.timeline
+    if not timeline_file or timeline_file.startswith(UNIX_PREFIX):
+        log("error", "no timeline file is configured, set `timeline` to a file path first")
+        exit(1)
+    try:
+        cycles = read_cycles(timeline_file)
+    except OSError as e:
+        log("error", f"unable to read the timeline file `{timeline_file}`: {e}")
+        exit(1)
+    if cycles and not all_sessions:
+        last_session = cycles[-1].get("session")
+        cycles = [cycle for cycle in cycles if cycle.get("session") == last_session]
+
+    summary = {
+        script: {
+            phase: {
+                "count": len(durations),
+                "p50": percentile(durations, 50),
+                "p95": percentile(durations, 95),
+                "max": max(durations),
+            }
+            for phase, durations in phases.items()
+        }
+        for script, phases in summarize(cycles).items()
+    }
+    if as_json:
+        click.echo(json.dumps(summary, indent=2))
+        return
+    if not summary:
+        log("stella", f"no restarts have been recorded in `{timeline_file}` yet")
+        return
+
+    from rich import print
+    from rich.table import Table
+
+    for script, phases in summary.items():
+        table = Table(title=f"restarts of `{script}` (ms)", title_justify="left")
+        for column in ("phase", "count", "p50", "p95", "max"):
+            table.add_column(column, justify="left" if column == "phase" else "right")
+        for phase, row in phases.items():
+            table.add_row(
+                phase,
+                str(row["count"]),
+                *(f"{row[key]:.1f}" for key in ("p50", "p95", "max")),
+            )
+        print(table)
+
+
 @main.command("init")
 def init():
     """
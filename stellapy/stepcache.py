@@ -0,0 +1,97 @@
+import glob
+import os
+from hashlib import sha256
+from threading import Lock
+
+from stellapy.cache import cache_dir, read_json, write_json
+from stellapy.configuration import Step
+from stellapy.hashindex import hash_file
+
+
+def expand(patterns: list[str]) -> list[str]:
+    """
+    Returns the files matching any of the glob `patterns`, which may use `**`, sorted.
+    """
+    paths: set[str] = set()
+    for pattern in patterns:
+        for path in glob.glob(pattern, recursive=True):
+            if os.path.isfile(path):
+                paths.add(os.path.normpath(path))
+    return sorted(paths)
+
+
+class StepCache:
+    """
+    Remembers the inputs of the last successful run of every step, so that steps whose inputs
+    haven't changed since can be skipped, like make does. The cache is persisted, so it survives
+    restarts of stella.
+
+    A step's fingerprint covers its command, its input and output patterns and the contents of all
+    of its input files. The contents are only hashed again for files whose size or mtime changed.
+    """
+
+    def __init__(self, script_name: str, root: str = ".") -> None:
+        self.root = os.path.abspath(root)
+        # one file per script, so that scripts running side by side don't overwrite each other
+        key = sha256(f"{self.root}\0{script_name}".encode()).hexdigest()[:32]
+        self.cache_file = cache_dir("steps", f"{key}.json")
+        self.__lock = Lock()
+        cached = read_json(self.cache_file)
+        if not cached or cached.get("root") != self.root:
+            cached = {}
+        self.__fingerprints: dict[str, str] = cached.get("fingerprints", {})
+        # path to [size, mtime_ns, digest]
+        self.__files: dict[str, list] = cached.get("files", {})
+
+    def fingerprint(self, step: Step) -> str:
+        digest = sha256()
+        for part in (step.command, *step.inputs, "\0", *step.outputs, "\0"):
+            digest.update(part.encode() + b"\0")
+        for path in expand(step.inputs):
+            digest.update(f"{path}\0{self.__hash(path)}\0".encode())
+        return digest.hexdigest()
+
+    def is_up_to_date(self, step: Step, fingerprint: str) -> bool:
+        """
+        Returns `True` if the step has already succeeded with the same fingerprint, and all of its
+        outputs exist. Steps without inputs are never up to date.
+        """
+        if not step.inputs:
+            return False
+        with self.__lock:
+            if self.__fingerprints.get(step.name) != fingerprint:
+                return False
+        return all(glob.glob(pattern, recursive=True) for pattern in step.outputs)
+
+    def record(self, step: Step, fingerprint: str) -> None:
+        """
+        Records a successful run of the step.
+        """
+        with self.__lock:
+            self.__fingerprints[step.name] = fingerprint
+
+    def save(self) -> None:
+        with self.__lock:
+            data = {
+                "root": self.root,
+                "fingerprints": dict(self.__fingerprints),
+                "files": dict(self.__files),
+            }
+        write_json(self.cache_file, data)
+
+    def __hash(self, path: str) -> str:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return ""
+        with self.__lock:
+            entry = self.__files.get(path)
+        if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            return entry[2]
+        try:
+            digest = hash_file(path, stat.st_size)
+        except (OSError, ValueError):
+            return ""
+        with self.__lock:
+            self.__files[path] = [stat.st_size, stat.st_mtime_ns, digest]
+        return digest
@@ -0,0 +1,232 @@
+import os
+import signal
+import subprocess
+from collections import deque
+from dataclasses import dataclass
+from graphlib import CycleError, TopologicalSorter
+from threading import Event, Lock
+from time import perf_counter
+
+from stellapy.configuration import Step
+from stellapy.logger import log
+from stellapy.output import OutputMultiplexer
+from stellapy.stepcache import StepCache
+
+WINDOWS = os.name == "nt"
+POLL_INTERVAL = 0.01  # seconds
+
+
+@dataclass
+class StepTiming:
+    name: str
+    seconds: float
+    returncode: int
+
+
+def validate_steps(steps: list[Step]) -> None:
+    """
+    Raises `ValueError` if step names are duplicated, a step depends on an unknown step, or the
+    dependencies form a cycle.
+    """
+    names = [step.name for step in steps]
+    duplicates = {name for name in names if names.count(name) > 1}
+    if duplicates:
+        raise ValueError(f"duplicate step names: {', '.join(sorted(duplicates))}")
+    for step in steps:
+        unknown = set(step.depends_on) - set(names)
+        if unknown:
+            raise ValueError(
+                f"step `{step.name}` depends on unknown steps: {', '.join(sorted(unknown))}"
+            )
+    try:
+        TopologicalSorter({step.name: step.depends_on for step in steps}).prepare()
+    except CycleError as e:
+        raise ValueError(f"the steps depend on each other: {' -> '.join(e.args[1])}")
+
+
+class StepRunner:
+    """
+    Runs the one-shot steps of a script, each in its own process, in the order given by their
+    `depends_on` edges. Steps whose dependencies have succeeded run in parallel, up to `max_parallel`
+    at a time. Once a step fails, no further steps are started. Steps whose inputs are unchanged
+    since their last successful run are skipped.
+    """
+
+    def __init__(
+        self,
+        steps: list[Step],
+        max_parallel: int = 0,
+        script_name: str = "",
+        output: OutputMultiplexer | None = None,
+    ) -> None:
+        """
+        `max_parallel` of 0 means the number of CPUs. The output of the steps is piped through
+        `output` if given, like the one of the app, and goes to the terminal directly otherwise.
+        """
+        validate_steps(steps)
+        self.steps = {step.name: step for step in steps}
+        self.max_parallel = max_parallel or os.cpu_count() or 1
+        self.output = output
+        self.timings: list[StepTiming] = []
+        self.skipped: list[str] = []
+        self.cache: StepCache | None = None
+        if any(step.inputs for step in steps):
+            self.cache = StepCache(script_name)
+        self.__fingerprints: dict[str, str] = {}
+        self.__running: dict[str, tuple[subprocess.Popen, float]] = {}
+        self.__lock = Lock()
+        self.__cancelled = Event()
+
+    def run(self) -> bool:
+        """
+        Runs all the steps, returning `True` if every one of them succeeded.
+        """
+        self.__cancelled.clear()
+        self.timings = []
+        self.skipped = []
+        self.__fingerprints = {}
+        sorter = TopologicalSorter(
+            {name: step.depends_on for name, step in self.steps.items()}
+        )
+        sorter.prepare()
+        ready: deque[str] = deque()
+        failed = False
+        started = perf_counter()
+
+        while not self.__cancelled.is_set():
+            if not failed:
+                ready.extend(sorter.get_ready())
+                while ready and len(self.__running) < self.max_parallel:
+                    name = ready.popleft()
+                    if self.__is_up_to_date(name):
+                        sorter.done(name)
+                        ready.extend(sorter.get_ready())
+                        continue
+                    if not self.__start(name):
+                        failed = True
+                        break
+            if not self.__running:
+                break
+            for name, code in self.__reap():
+                if code == 0:
+                    sorter.done(name)
+                    if self.cache and name in self.__fingerprints:
+                        self.cache.record(self.steps[name], self.__fingerprints[name])
+                else:
+                    failed = True
+
+        if self.cache:
+            self.cache.save()
+        if self.__cancelled.is_set():
+            return False
+        work = sum(timing.seconds for timing in self.timings)
+        skipped = f", skipped {len(self.skipped)} up to date" if self.skipped else ""
+        log(
+            "info",
+            f"ran {len(self.timings)} step(s) in {(perf_counter() - started) * 1000:.0f} ms "
+            f"({work * 1000:.0f} ms of work){skipped}",
+        )
+        return not failed and not sorter.is_active()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.__cancelled.is_set()
+
+    def cancel(self) -> None:
+        """
+        Kills the running steps and makes `run` return.
+        """
+        self.__cancelled.set()
+        with self.__lock:
+            running = [process for process, _ in self.__running.values()]
+            self.__running.clear()
+        for process in running:
+            self.__kill(process)
+
+    def __is_up_to_date(self, name: str) -> bool:
+        step = self.steps[name]
+        if not self.cache or not step.inputs:
+            return False
+        # fingerprinted before the step runs, so inputs changing meanwhile cause another run
+        fingerprint = self.cache.fingerprint(step)
+        self.__fingerprints[name] = fingerprint
+        if not self.cache.is_up_to_date(step, fingerprint):
+            return False
+        self.skipped.append(name)
+        log("info", f"step `{name}` is up to date, skipped")
+        return True
+
+    def __start(self, name: str) -> bool:
+        step = self.steps[name]
+        pipe = subprocess.PIPE if self.output else None
+        try:
+            if WINDOWS:
+                process = subprocess.Popen(
+                    step.command,
+                    shell=True,
+                    stdout=pipe,
+                    stderr=pipe,
+                    creationflags=subprocess.CREATE_NEW_PROCESS_GROUP,
+                )
+            else:
+                process = subprocess.Popen(
+                    step.command,
+                    shell=True,
+                    stdout=pipe,
+                    stderr=pipe,
+                    start_new_session=True,
+                )
+        except OSError as e:
+            log("error", f"unable to run step `{name}`: {e}")
+            return False
+        if self.output:
+            # the output of a step never counts as the app being ready
+            self.output.attach(process.stdout, process.stderr, notify=False)
+        with self.__lock:
+            self.__running[name] = (process, perf_counter())
+        return True
+
+    def __reap(self) -> list[tuple[str, int]]:
+        """
+        Waits for at least one running step to finish, returning the finished steps along with
+        their exit codes.
+        """
+        while not self.__cancelled.is_set():
+            finished = []
+            with self.__lock:
+                for name, (process, started) in list(self.__running.items()):
+                    code = process.poll()
+                    if code is not None:
+                        del self.__running[name]
+                        finished.append((name, code, perf_counter() - started))
+            if finished:
+                break
+            self.__cancelled.wait(POLL_INTERVAL)
+        else:
+            return []
+
+        for name, code, seconds in finished:
+            self.timings.append(StepTiming(name, seconds, code))
+            if code == 0:
+                log("info", f"step `{name}` finished in {seconds * 1000:.0f} ms")
+            else:
+                log(
+                    "error",
+                    f"step `{name}` failed with exit code {code} after {seconds * 1000:.0f} ms",
+                )
+        return [(name, code) for name, code, _ in finished]
+
+    @staticmethod
+    def __kill(process: subprocess.Popen) -> None:
+        try:
+            if WINDOWS:
+                subprocess.run(
+                    ["taskkill", "/T", "/F", "/PID", str(process.pid)],
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                )
+            else:
+                os.killpg(process.pid, signal.SIGKILL)  # type: ignore (unix based systems)
+        except (ProcessLookupError, PermissionError):
+            pass
+        process.wait()
@@ -0,0 +1,230 @@
+import os
+import signal
+import subprocess
+from dataclasses import dataclass, field
+from threading import Lock, Thread
+from time import monotonic
+from typing import Callable
+
+from stellapy.logger import log
+from stellapy.zygote import ForkedProcess
+
+PROC_PRESENT = os.path.isdir("/proc/self")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if PROC_PRESENT else 4096
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if PROC_PRESENT else 100
+BACKOFF_INITIAL = 0.5  # seconds before the first automatic restart after a crash
+BACKOFF_MAX = 30.0  # seconds
+STABLE_UPTIME = 10.0  # seconds, runs at least this long reset the backoff
+SETTLE_TIME = 5.0  # seconds, memory is compared across runs this long after the start
+MEMORY_HISTORY = 20  # runs whose memory is remembered
+MIB = 1024 * 1024
+
+
+@dataclass
+class ResourceSample:
+    """
+    The resources used by a process tree at a point in time.
+    """
+
+    rss: int = 0  # bytes
+    cpu: float = 0.0  # seconds of CPU time used so far
+    processes: int = 0
+
+
+def sample_tree(pid: int) -> ResourceSample | None:
+    """
+    Sums up the resident memory and the CPU time of `pid` and all of its descendants, reading every
+    process from `/proc` once. Returns `None` on systems without `/proc`.
+    """
+    if not PROC_PRESENT:
+        return None
+    children: dict[int, list[int]] = {}
+    usage: dict[int, tuple[int, float]] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "rb") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # the process name is in parentheses and may contain spaces, so split after it
+        fields = stat[stat.rindex(b")") + 2 :].split()
+        children.setdefault(int(fields[1]), []).append(int(entry))
+        # utime and stime are the 14th and 15th fields, rss the 24th
+        cpu = (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+        usage[int(entry)] = (int(fields[21]) * PAGE_SIZE, cpu)
+
+    sample = ResourceSample()
+    stack = [pid]
+    while stack:
+        current = stack.pop()
+        if current in usage:
+            rss, cpu = usage[current]
+            sample.rss += rss
+            sample.cpu += cpu
+            sample.processes += 1
+        stack.extend(children.get(current, []))
+    return sample
+
+
+def describe_exit(code: int | None) -> str:
+    if code is None:
+        return "exited"
+    if code < 0:
+        try:
+            return f"was killed by {signal.Signals(-code).name}"
+        except ValueError:
+            return f"was killed by signal {-code}"
+    return f"exited with code {code}"
+
+
+@dataclass
+class Run:
+    """
+    A single run of the app, from its start until it exits or is stopped.
+    """
+
+    pid: int
+    started: float = field(default_factory=monotonic)
+    ended: float = 0.0
+    exit_code: int | None = None
+    stopped: bool = False  # stopped by stella, rather than exiting on its own
+    last: ResourceSample | None = None
+    cpu_percent: float = 0.0  # over the last sampling interval
+    peak_rss: int = 0
+    settled_rss: int = 0  # the memory used once the app has settled, 0 until then
+
+    @property
+    def uptime(self) -> float:
+        return (self.ended or monotonic()) - self.started
+
+
+class Supervisor:
+    """
+    Follows the runs of the app: notices when the app exits on its own and with which exit code,
+    counts consecutive short-lived runs to back off automatic restarts, and samples the memory and
+    CPU usage of its whole process tree every `interval` seconds.
+
+    The memory used by every run `SETTLE_TIME` seconds after its start is remembered, and a warning
+    is logged when it grows by more than `memory_growth` percent across restarts, which usually
+    means that something leaks.
+    """
+
+    def __init__(
+        self,
+        interval: float = 2.0,
+        memory_growth: float = 50,
+        on_exit: Callable[[int | None], None] | None = None,
+    ) -> None:
+        """
+        `on_exit` is called with the exit code whenever the app exits without being stopped by
+        stella, from the supervisor's thread. An `interval` of 0 disables the sampling.
+        """
+        self.interval = interval
+        self.memory_growth = memory_growth
+        self.on_exit = on_exit
+        self.run: Run | None = None
+        self.crashes = 0
+        self.short_runs = 0  # consecutive runs which exited before `STABLE_UPTIME`
+        self.__memory: list[int] = []  # the settled memory of the previous runs, in bytes
+        self.__warned_memory = 0
+        self.__lock = Lock()
+
+    def watch(self, process: subprocess.Popen | ForkedProcess) -> None:
+        """
+        Starts following a freshly started process.
+        """
+        run = Run(process.pid)
+        with self.__lock:
+            self.run = run
+        Thread(target=self.__follow, args=(process, run), daemon=True).start()
+
+    def release(self) -> None:
+        """
+        Called before stella stops the app, so that it isn't taken for a crash.
+        """
+        with self.__lock:
+            run = self.run
+            if run and not run.ended:
+                run.stopped = True
+
+    def backoff(self) -> float:
+        """
+        Returns how long to wait before restarting the app after it exited, doubling with every
+        consecutive run which didn't last `STABLE_UPTIME` seconds.
+        """
+        return min(BACKOFF_INITIAL * 2 ** max(self.short_runs - 1, 0), BACKOFF_MAX)
+
+    def status(self) -> str:
+        run = self.run
+        if not run:
+            return "the app hasn't been started"
+        if run.ended:
+            state = f"the app {describe_exit(run.exit_code)} after {run.uptime:.1f} s"
+        else:
+            state = f"the app is running as pid {run.pid} for {run.uptime:.1f} s"
+        if run.last:
+            state += (
+                f", {run.last.processes} process(es) using {run.last.rss / MIB:.1f} MiB "
+                f"(peak {run.peak_rss / MIB:.1f} MiB) and {run.cpu_percent:.0f}% CPU"
+            )
+        return f"{state}, {self.crashes} crash(es) so far"
+
+    def __follow(self, process: subprocess.Popen | ForkedProcess, run: Run) -> None:
+        timeout = self.interval if self.interval > 0 else None
+        while True:
+            try:
+                code = process.wait(timeout)
+                break
+            except subprocess.TimeoutExpired:
+                self.__sample(run)
+        with self.__lock:
+            run.ended = monotonic()
+            run.exit_code = code
+            stopped = run.stopped
+            current = run is self.run
+        if stopped or not current:
+            self.__remember_memory(run)
+            return
+
+        if code != 0:
+            self.crashes += 1
+        # clean exits count too, otherwise an app exiting right away is restarted in a tight loop
+        self.short_runs = 0 if run.uptime >= STABLE_UPTIME else self.short_runs + 1
+        log(
+            "error" if code != 0 else "info",
+            f"the app {describe_exit(code)} after {run.uptime:.1f} s",
+        )
+        self.__remember_memory(run)
+        if self.on_exit:
+            self.on_exit(code)
+
+    def __sample(self, run: Run) -> None:
+        sample = sample_tree(run.pid)
+        if not sample or not sample.processes:
+            return
+        if run.last and self.interval > 0:
+            run.cpu_percent = (sample.cpu - run.last.cpu) / self.interval * 100
+        run.last = sample
+        run.peak_rss = max(run.peak_rss, sample.rss)
+        if not run.settled_rss and run.uptime >= SETTLE_TIME:
+            run.settled_rss = sample.rss
+
+    def __remember_memory(self, run: Run) -> None:
+        if not run.settled_rss:
+            return
+        memory = self.__memory
+        memory.append(run.settled_rss)
+        del memory[:-MEMORY_HISTORY]
+        if not self.memory_growth or len(memory) < 3:
+            return
+        baseline = max(memory[0], self.__warned_memory)
+        growing = memory[-3] < memory[-2] < memory[-1]
+        if growing and memory[-1] > baseline * (1 + self.memory_growth / 100):
+            self.__warned_memory = memory[-1]
+            log(
+                "error",
+                f"the memory used by the app grew from {memory[0] / MIB:.1f} MiB to "
+                f"{memory[-1] / MIB:.1f} MiB over the last {len(memory)} runs, it might be leaking",
+            )
@@ -0,0 +1,173 @@
+import json
+import math
+import os
+import socket
+from datetime import datetime
+from threading import Lock
+from time import monotonic, time
+from typing import Any
+
+from stellapy.logger import log
+
+# the phases of a restart cycle, in the order they happen
+PHASES = (
+    "event",  # the first file change of the batch was seen
+    "debounced",  # the debounce window ended
+    "kill_sent",  # the old process was asked to stop
+    "exited",  # the old process tree is gone
+    "hot_reloaded",  # instead of the above, when the app was hot reloaded
+    "steps_finished",  # the script's steps are done
+    "spawned",  # the new process was started
+    "ready",  # the readiness probe succeeded
+    "browser_refreshed",
+)
+UNIX_PREFIX = "unix:"
+
+
+class RestartCycle:
+    """
+    The timestamps of the phases of a single restart. Phases can be marked from any thread, only
+    the first mark of a phase counts.
+    """
+
+    def __init__(self, session: str, script: str, trigger: str, paths: int = 0) -> None:
+        self.session = session
+        self.script = script
+        self.trigger = trigger  # change, manual or crash
+        self.paths = paths
+        self.marks: dict[str, float] = {}  # phase to monotonic seconds
+
+    def mark(self, phase: str, at: float | None = None) -> None:
+        self.marks.setdefault(phase, at or monotonic())
+
+    def to_dict(self) -> dict[str, Any]:
+        """
+        Returns the cycle as it is written to the timeline: the offset of every phase from the
+        start of the cycle and the duration of every phase since the previous one, in
+        milliseconds.
+        """
+        marked = sorted(
+            (phase for phase in PHASES if phase in self.marks),
+            key=lambda phase: (self.marks[phase], PHASES.index(phase)),
+        )
+        start = self.marks[marked[0]] if marked else monotonic()
+        offsets: dict[str, float] = {}
+        durations: dict[str, float] = {}
+        previous = start
+        for phase in marked:
+            offsets[phase] = round((self.marks[phase] - start) * 1000, 3)
+            if phase != marked[0]:
+                durations[phase] = round((self.marks[phase] - previous) * 1000, 3)
+            previous = self.marks[phase]
+        started_at = datetime.fromtimestamp(time() - (monotonic() - start))
+        return {
+            "session": self.session,
+            "script": self.script,
+            "trigger": self.trigger,
+            "paths": self.paths,
+            "time": started_at.isoformat(timespec="milliseconds"),
+            "total": round((previous - start) * 1000, 3),
+            "phases": offsets,
+            "durations": durations,
+        }
+
+
+class TimelineRecorder:
+    """
+    Writes every restart cycle as a JSON line to a file, or sends it as a datagram to a unix
+    socket if the target is given as `unix:PATH`. An empty target disables the timeline.
+
+    Sending never blocks, cycles which can't be delivered to the socket are dropped.
+    """
+
+    def __init__(self, target: str) -> None:
+        self.target = target
+        self.session = f"{datetime.now():%Y%m%dT%H%M%S}-{os.getpid()}"
+        self.__lock = Lock()
+        self.__socket: socket.socket | None = None
+        self.__file = None
+        if not target:
+            return
+        try:
+            if target.startswith(UNIX_PREFIX):
+                self.__socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)  # type: ignore (unix based systems)
+                self.__socket.setblocking(False)
+            else:
+                directory = os.path.dirname(target)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self.__file = open(target, "a", encoding="utf-8")
+        except OSError as e:
+            log("error", f"unable to open the timeline `{target}`: {e}")
+            self.target = ""
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.target)
+
+    def begin(self, script: str, trigger: str, paths: int = 0) -> RestartCycle:
+        return RestartCycle(self.session, script, trigger, paths)
+
+    def emit(self, cycle: RestartCycle) -> None:
+        if not self.enabled:
+            return
+        line = json.dumps(cycle.to_dict()) + "\n"
+        with self.__lock:
+            try:
+                if self.__socket:
+                    self.__socket.sendto(line.encode(), self.target[len(UNIX_PREFIX) :])
+                elif self.__file:
+                    self.__file.write(line)
+                    self.__file.flush()
+            except OSError:
+                pass
+
+    def close(self) -> None:
+        with self.__lock:
+            if self.__socket:
+                self.__socket.close()
+            if self.__file:
+                self.__file.close()
+            self.__socket = self.__file = None
+
+
+def read_cycles(path: str) -> list[dict[str, Any]]:
+    """
+    Returns the cycles of a timeline file, skipping lines which aren't valid.
+    """
+    cycles = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                cycle = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(cycle, dict):
+                cycles.append(cycle)
+    return cycles
+
+
+def percentile(values: list[float], q: float) -> float:
+    """
+    Returns the `q`th percentile of `values` using the nearest rank method.
+    """
+    ordered = sorted(values)
+    rank = max(math.ceil(q / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def summarize(cycles: list[dict[str, Any]]) -> dict[str, dict[str, list[float]]]:
+    """
+    Groups the phase durations of the cycles by script and phase, with the total duration of
+    every cycle under `total`.
+    """
+    summary: dict[str, dict[str, list[float]]] = {}
+    for cycle in cycles:
+        phases = summary.setdefault(cycle.get("script", ""), {})
+        durations = cycle.get("durations", {})
+        for phase in PHASES:
+            if phase in durations:
+                phases.setdefault(phase, []).append(durations[phase])
+        if "total" in cycle:
+            phases.setdefault("total", []).append(cycle["total"])
+    return summary
@@ -1,8 +1,8 @@
-from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Callable, Iterable
 
 import gitignorefile
+from watchdog import events
 from watchdog.events import (
     EVENT_TYPE_CLOSED,
     EVENT_TYPE_OPENED,
@@ -10,23 +10,38 @@ from watchdog.events import (
     FileSystemEventHandler,
 )
 
+from stellapy.debounce import ChangeBatch, Debouncer
+from stellapy.ignore import IgnoreIndex
+from stellapy.matcher import PathMatcher
+
+# only reported by watchdog 5 and later
+EVENT_TYPE_CLOSED_NO_WRITE = getattr(events, "EVENT_TYPE_CLOSED_NO_WRITE", "closed_no_write")
+
 
 def get_ignore_include_patterns(include_only: Iterable[str] | None):
-    # todo use stella.ignore and .gitignore together
-    ignore_filepath = find_ignore_file()
-    ignore_match = (
-        gitignorefile.parse(ignore_filepath) if ignore_filepath else lambda _: False
-    )
+    """
+    Returns the `IgnoreIndex` for the current directory, along with the compiled `include_only`
+    patterns.
+    """
+    ignore_index = IgnoreIndex(".")
     include_match = (
         gitignorefile._IgnoreRules(
             [gitignorefile._rule_from_pattern(pattern) for pattern in include_only],
             ".",
         ).match
         if include_only
-        else lambda _: True
+        else lambda _, is_dir=None: True
     )
 
-    return ignore_match, include_match
+    return ignore_index, include_match
+
+
+def compile_matcher(include_only: Iterable[str] | None) -> PathMatcher:
+    """
+    Compiles the ignore files and the `include_only` patterns into a single `PathMatcher`.
+    """
+    ignore_index, include_match = get_ignore_include_patterns(include_only)
+    return PathMatcher(ignore_index.match, include_match)
 
 
 class GitignoreMatchingEventHandler(FileSystemEventHandler):
@@ -39,33 +54,58 @@ class GitignoreMatchingEventHandler(FileSystemEventHandler):
         self,
         include_only: Iterable[str] | None,
         poll_interval: float,
-        callback: Callable[[], None],
+        max_wait_interval: float,
+        callback: Callable[[ChangeBatch], None],
+        storm_threshold: float = 0,
+        storm_max_paths: int = 0,
+        excluded: Iterable[str] = (),
     ) -> None:
+        """
+        `poll_interval` is the quiet window and `max_wait_interval` the upper bound on how long a
+        burst of changes can postpone the callback, both in milliseconds. `storm_threshold` is the
+        rate of events per second which starts an event storm, and `storm_max_paths` the number of
+        paths a batch can hold before it is summarized by directory, see `Debouncer`. `excluded`
+        paths are never watched, see `PathMatcher`.
+        """
         super().__init__()
-        self.ignore_match, self.include_match = get_ignore_include_patterns(
-            include_only
+        self.ignore_index, include_match = get_ignore_include_patterns(include_only)
+        self.matcher = PathMatcher(
+            self.ignore_index.match, include_match, excluded=excluded
+        )
+        self.debouncer = Debouncer(
+            poll_interval / 1000,
+            max_wait_interval / 1000,
+            callback,
+            storm_threshold,
+            storm_max_paths,
         )
-        self.poll_interval = poll_interval
-        self.callback_fn = callback
-        self.last_event_time = datetime.now()
 
     def on_any_event(self, event: FileSystemEvent) -> None:
-        # only respond to events after a certain threshold
-        if datetime.now() - self.last_event_time > timedelta(
-            milliseconds=self.poll_interval
-        ):
-            super().on_any_event(event)
-            self.callback_fn()
-            self.last_event_time = datetime.now()
+        # collect the change, the debouncer calls back once the tree is quiet. Only the watched
+        # ends of a move are collected, the matcher has cached their verdicts already
+        for path in (event.src_path, event.dest_path):
+            if path and self.matcher.matches(path, event.is_directory):
+                self.debouncer.push(path, event.event_type)
+
+    def stop(self) -> None:
+        self.debouncer.stop()
 
     def dispatch(self, event: FileSystemEvent) -> None:
-        no_dispatch_conditions = {
-            self.ignore_match(event.src_path),
-            ".git" in event.src_path,
-            event.event_type in (EVENT_TYPE_OPENED, EVENT_TYPE_CLOSED),
-            not self.include_match(event.src_path),
-        }
-        if any(no_dispatch_conditions):
+        # cheapest check first, the matcher short-circuits and caches the rest
+        if event.event_type in (
+            EVENT_TYPE_OPENED,
+            EVENT_TYPE_CLOSED,
+            EVENT_TYPE_CLOSED_NO_WRITE,
+        ):
+            return
+        for path in (event.src_path, event.dest_path):
+            if path and IgnoreIndex.is_ignore_file(path):
+                self.ignore_index.invalidate(path)
+                self.matcher.clear_cache()
+        # a move is acted upon when either of its ends is watched
+        if not self.matcher.matches(event.src_path, event.is_directory) and not (
+            event.dest_path and self.matcher.matches(event.dest_path, event.is_directory)
+        ):
             return
         return super().dispatch(event)
 
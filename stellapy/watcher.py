@@ -0,0 +1,192 @@
+import os
+from threading import Event, Thread
+from typing import Callable
+
+from watchdog.events import FileSystemEvent, FileSystemEventHandler
+from watchdog.observers import Observer
+from watchdog.observers.api import BaseObserver
+
+from stellapy.configuration import Configuration
+from stellapy.debounce import ChangeBatch
+from stellapy.hashindex import ContentIndex
+from stellapy.logger import json_log_file, log
+from stellapy.poller import ScandirPoller, select_backend
+from stellapy.timeline import UNIX_PREFIX
+from stellapy.walker import GitignoreMatchingEventHandler
+from stellapy.watches import WatchManager
+
+CANARY_TIMEOUT = 1.0  # seconds given to the native events to report the canary file
+
+
+class _Canary(FileSystemEventHandler):
+    """
+    Notices the events of a single file.
+    """
+
+    def __init__(self, path: str) -> None:
+        super().__init__()
+        self.path = os.path.abspath(path)
+        self.seen = Event()
+
+    def on_any_event(self, event: FileSystemEvent) -> None:
+        if os.path.abspath(event.src_path) == self.path:
+            self.seen.set()
+
+
+class Watcher:
+    """
+    Watches the project for changes and hands every batch of changes to the subscribed callbacks.
+
+    A single watcher can be shared by several scripts, so the tree is walked, watched and filtered
+    only once, no matter how many scripts are running.
+
+    Changes are reported by the operating system, or found by polling on filesystems which don't
+    report them, depending on `watch_backend`. With `auto`, a canary file is written before the
+    native watches are registered, and the watcher falls back to polling if no event reports it.
+    """
+
+    def __init__(self, config: Configuration, root: str = ".") -> None:
+        self.config = config
+        self.root = root
+        self.canary = os.path.join(root, f".stella-canary-{os.getpid()}")
+        self.event_handler = GitignoreMatchingEventHandler(
+            config.include_only,
+            config.poll_interval,
+            config.max_wait_interval,
+            self.__dispatch,
+            config.storm_threshold,
+            config.storm_max_paths,
+            self.__written_paths(config),
+        )
+        self.matcher = self.event_handler.matcher
+        self.backend = select_backend(config.watch_backend, root)
+        self.observer: BaseObserver | None = None
+        self.watch_manager: WatchManager | None = None
+        self.poller: ScandirPoller | None = None
+        if self.backend == "polling":
+            self.poller = self.__create_poller()
+        else:
+            self.observer = Observer()
+            self.watch_manager = WatchManager(
+                self.observer,
+                self.event_handler,
+                self.matcher,
+                root,
+                selective=config.watch_mode == "ignore_aware",
+            )
+            self.watch_manager.schedule()
+        self.content_index: ContentIndex | None = None
+        if config.content_hash:
+            self.content_index = ContentIndex(root)
+        self.__subscribers: list[Callable[[ChangeBatch], None]] = []
+
+    def subscribe(self, callback: Callable[[ChangeBatch], None]) -> None:
+        self.__subscribers.append(callback)
+
+    def start(self) -> None:
+        if self.watch_manager:
+            try:
+                if self.config.watch_backend == "auto" and not self.__events_arrive():
+                    self.__fall_back_to_polling(
+                        "the native events didn't report a test write to the project"
+                    )
+                else:
+                    self.watch_manager.start()
+            except OSError as e:
+                # usually the inotify watch or instance limits
+                if self.config.watch_backend != "auto":
+                    raise
+                self.__fall_back_to_polling(f"unable to watch the project natively ({e})")
+        if self.poller:
+            self.poller.start()
+        if self.content_index:
+            self.content_index.build()
+
+    def stop(self) -> None:
+        self.event_handler.stop()
+        if self.observer and self.observer.is_alive():
+            self.observer.stop()
+            self.observer.join()
+        if self.poller:
+            self.poller.stop()
+        if self.content_index:
+            self.content_index.save()
+
+    def __events_arrive(self) -> bool:
+        """
+        Writes the canary file and returns `True` if a native event reports it. The filesystem
+        type alone doesn't tell, bind mounts and virtual machine shares often look native. A
+        separate observer is used, so that the canary never reaches the event handler.
+        """
+        canary = _Canary(self.canary)
+        observer = Observer()
+        observer.schedule(canary, self.root, recursive=False)
+        observer.start()
+        try:
+            with open(self.canary, "w"):
+                pass
+            os.remove(self.canary)
+        except OSError:
+            # a read-only project never changes under us anyway
+            return True
+        else:
+            return canary.seen.wait(CANARY_TIMEOUT)
+        finally:
+            observer.stop()
+            observer.join()
+
+    def __fall_back_to_polling(self, reason: str) -> None:
+        log("error", f"{reason}, polling for changes instead")
+        if self.observer and self.observer.is_alive():
+            self.observer.stop()
+            self.observer.join()
+        self.observer = self.watch_manager = None
+        self.backend = "polling"
+        self.poller = self.__create_poller()
+
+    def __written_paths(self, config: Configuration) -> list[str]:
+        """
+        Returns the files and directories stella itself writes to while running, which would
+        otherwise restart the app over and over when they are inside the project.
+        """
+        paths = []
+        if config.timeline and not config.timeline.startswith(UNIX_PREFIX):
+            paths.append(config.timeline)
+        if config.log_dir:
+            paths.append(config.log_dir)
+        if json_log_file():
+            paths.append(json_log_file())
+        return paths
+
+    def __create_poller(self) -> ScandirPoller:
+        return ScandirPoller(
+            self.event_handler,
+            self.matcher,
+            self.root,
+            self.config.poll_interval / 1000,
+        )
+
+    def __dispatch(self, batch: ChangeBatch) -> None:
+        if self.content_index:
+            event_count = batch.event_count
+            batch = self.content_index.filter(batch)
+            if not batch:
+                log(
+                    "info",
+                    f"ignored {event_count} event(s) which didn't change any file contents, "
+                    f"{self.content_index.suppressed_restarts} restart(s) skipped so far",
+                )
+                return
+
+        if len(self.__subscribers) == 1:
+            self.__subscribers[0](batch)
+            return
+        # restart the scripts concurrently, so that related services come back together
+        threads = [
+            Thread(target=callback, args=(batch,), daemon=True)
+            for callback in self.__subscribers
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
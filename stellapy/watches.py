@@ -0,0 +1,233 @@
+import os
+from threading import Lock
+from time import perf_counter
+
+from watchdog.events import (
+    DirCreatedEvent,
+    DirDeletedEvent,
+    DirMovedEvent,
+    FileSystemEventHandler,
+)
+from watchdog.observers.api import BaseObserver, ObservedWatch
+
+from stellapy.logger import log
+from stellapy.matcher import PathMatcher
+
+
+def _is_leaf_dir(path: str) -> bool:
+    """
+    Returns `True` if the directory at `path` has no subdirectories.
+    """
+    try:
+        with os.scandir(path) as entries:
+            return not any(e.is_dir(follow_symlinks=False) for e in entries)
+    except OSError:
+        return True
+
+
+class WatchManager(FileSystemEventHandler):
+    """
+    Registers observer watches for a directory tree without ever descending into ignored
+    directories.
+
+    The tree is walked once and covered with as few watches as possible: every subtree which holds
+    no ignored directory gets a single recursive watch, while directories that do contain ignored
+    subdirectories are watched non-recursively and their remaining children are covered
+    individually. Ignored directories without subdirectories of their own (like `__pycache__`) cost
+    a single watch descriptor, so they are tolerated inside recursive watches instead of splitting
+    the tree further.
+
+    The manager also listens to the events of its own watches, so that directories created under a
+    non-recursive watch get watched and watches of deleted directories are removed. When an ignored
+    directory appears inside a recursive watch, or a tree holding one is moved into it, that watch
+    is split up again, since the OS would otherwise go on watching everything created below it.
+    """
+
+    def __init__(
+        self,
+        observer: BaseObserver,
+        event_handler: FileSystemEventHandler,
+        matcher: PathMatcher,
+        root: str = ".",
+        selective: bool = True,
+    ) -> None:
+        """
+        With `selective` set to `False`, the whole tree is watched using a single recursive watch,
+        which is how watchdog behaves by default.
+        """
+        super().__init__()
+        self.observer = observer
+        self.event_handler = event_handler
+        self.matcher = matcher
+        self.root = root
+        self.selective = selective
+        self.watches: dict[str, ObservedWatch] = {}
+        self.directory_count = 0
+        self.registration_time = 0.0  # seconds
+        # ignored directories which appeared while watching, never tolerated as leaves since they
+        # are likely to grow (like `node_modules` during an install)
+        self.__growing: set[str] = set()
+        self.__lock = Lock()
+
+    @property
+    def watch_count(self) -> int:
+        return len(self.watches)
+
+    def schedule(self) -> None:
+        """
+        Walks the tree and schedules the watches. The watches are registered with the OS when the
+        observer is started.
+        """
+        with self.__lock:
+            if self.selective:
+                self.__cover(self.root)
+            else:
+                self.__schedule(self.root, recursive=True)
+
+    def start(self) -> None:
+        """
+        Starts the observer and reports the registered watches.
+        """
+        started = perf_counter()
+        self.observer.start()
+        self.registration_time = perf_counter() - started
+        directories = (
+            f" covering {self.directory_count} directories" if self.selective else ""
+        )
+        log(
+            "stella",
+            f"registered {self.watch_count} watch(es){directories} in {self.registration_time * 1000:.0f} ms",
+        )
+
+    def on_created(self, event) -> None:
+        if self.selective and isinstance(event, DirCreatedEvent):
+            self.__add_directory(event.src_path)
+
+    def on_deleted(self, event) -> None:
+        if self.selective and isinstance(event, DirDeletedEvent):
+            self.__remove_directory(event.src_path)
+
+    def on_moved(self, event) -> None:
+        if self.selective and isinstance(event, DirMovedEvent):
+            self.__remove_directory(event.src_path)
+            self.__add_directory(event.dest_path)
+
+    def __schedule(self, path: str, recursive: bool) -> None:
+        watch = self.observer.schedule(self.event_handler, path, recursive=recursive)
+        self.observer.add_handler_for_watch(self, watch)
+        self.watches[path] = watch
+
+    def __covering_watch(self, path: str) -> str | None:
+        """
+        Returns the path of the recursive watch `path` is inside of, if any.
+        """
+        parent = os.path.dirname(path)
+        while parent and parent != path:
+            watch = self.watches.get(parent)
+            if watch and watch.is_recursive:
+                return parent
+            path, parent = parent, os.path.dirname(parent)
+        return None
+
+    def __ignored_ancestor(self, path: str, covering: str) -> str | None:
+        """
+        Returns the outermost ignored directory between `covering` and `path`, `path` included.
+        """
+        ignored = None
+        while path != covering and path.startswith(covering):
+            if self.matcher.is_ignored_dir(path):
+                ignored = path
+            path = os.path.dirname(path)
+        return ignored
+
+    def __holds_ignored_dir(self, path: str) -> bool:
+        try:
+            with os.scandir(path) as entries:
+                subdirs = [e.path for e in entries if e.is_dir(follow_symlinks=False)]
+        except OSError:
+            return False
+        return any(
+            self.matcher.is_ignored_dir(subdir) or self.__holds_ignored_dir(subdir)
+            for subdir in subdirs
+        )
+
+    def __cover(self, path: str) -> None:
+        if self.__plan(path):
+            self.__schedule(path, recursive=True)
+
+    def __plan(self, path: str) -> bool:
+        """
+        Walks the directory at `path`, scheduling watches for the parts of it that contain ignored
+        directories. Returns `True` if the whole subtree is clean, in which case the caller is
+        expected to watch it recursively.
+        """
+        self.directory_count += 1
+        clean = True
+        clean_children: list[str] = []
+        try:
+            with os.scandir(path) as entries:
+                subdirs = [
+                    os.path.join(path, e.name)
+                    for e in entries
+                    if e.is_dir(follow_symlinks=False)
+                ]
+        except OSError:
+            return True
+
+        for subdir in subdirs:
+            if self.matcher.is_ignored_dir(subdir):
+                if subdir not in self.__growing and _is_leaf_dir(subdir):
+                    self.directory_count += 1
+                else:
+                    clean = False
+                continue
+            if self.__plan(subdir):
+                clean_children.append(subdir)
+            else:
+                clean = False
+
+        if clean:
+            return True
+
+        self.__schedule(path, recursive=False)
+        for child in clean_children:
+            self.__schedule(child, recursive=True)
+        return False
+
+    def __add_directory(self, path: str) -> None:
+        with self.__lock:
+            if path in self.watches:
+                return
+            covering = self.__covering_watch(path)
+            if covering is None:
+                if not self.matcher.is_ignored_dir(path):
+                    self.__cover(path)
+                return
+            ignored = self.__ignored_ancestor(path, covering)
+            if ignored:
+                self.__growing.add(ignored)
+            elif not self.__holds_ignored_dir(path):
+                return
+            self.__split(covering)
+
+    def __split(self, path: str) -> None:
+        """
+        Replaces the recursive watch of `path` with a new plan of its subtree, which leaves out
+        the ignored directories that appeared in it.
+        """
+        try:
+            self.observer.unschedule(self.watches.pop(path))
+        except KeyError:
+            pass
+        self.__cover(path)
+
+    def __remove_directory(self, path: str) -> None:
+        prefix = path + os.sep
+        with self.__lock:
+            self.__growing.discard(path)
+            for watched in list(self.watches):
+                if watched == path or watched.startswith(prefix):
+                    try:
+                        self.observer.unschedule(self.watches.pop(watched))
+                    except KeyError:
+                        pass
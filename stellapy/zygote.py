@@ -0,0 +1,216 @@
+import json
+import os
+import socket
+import subprocess
+from dataclasses import dataclass
+from fnmatch import fnmatch
+from pathlib import Path
+from queue import Empty, Queue
+from threading import Event, Thread
+
+from stellapy.logger import log
+
+WORKER_PATH = Path(__file__).with_name("zygote_worker.py")
+FD_ENV = "STELLA_ZYGOTE_FD"  # keep in sync with zygote_worker.py
+READY_TIMEOUT = 120  # seconds, importing the preloaded modules can take a while
+FORK_TIMEOUT = 10  # seconds
+STOP_TIMEOUT = 5  # seconds
+
+# changes to these files mean the installed packages have (probably) changed
+LOCK_FILE_PATTERNS = (
+    "poetry.lock",
+    "Pipfile.lock",
+    "pdm.lock",
+    "uv.lock",
+    "requirements*.txt",
+    "pyproject.toml",
+    "setup.py",
+    "setup.cfg",
+)
+
+
+class ForkedProcess:
+    """
+    A process forked by the zygote. Implements the part of the `subprocess.Popen` interface used by
+    the executor. The zygote reaps it and reports its exit code.
+    """
+
+    def __init__(self, pid: int) -> None:
+        self.pid = pid
+        self.returncode: int | None = None
+        self.__exited = Event()
+
+    def poll(self) -> int | None:
+        return self.returncode
+
+    def wait(self, timeout: float | None = None) -> int | None:
+        if not self.__exited.wait(timeout):
+            raise subprocess.TimeoutExpired(f"pid {self.pid}", timeout or 0)
+        return self.returncode
+
+    def set_exited(self, code: int | None) -> None:
+        self.returncode = code
+        self.__exited.set()
+
+
+@dataclass
+class ZygoteStats:
+    """
+    Counts how app starts were served.
+    """
+
+    hits: int = 0  # forked from a warm zygote
+    misses: int = 0  # the zygote had to be (re)built first, or forking failed
+    rebuilds: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class Zygote:
+    """
+    A pre-warmed fork server for python apps.
+
+    The zygote is a python process which has imported the preloaded modules once. Every start of the
+    app is a fork of it, so the app doesn't pay for importing those modules again. The zygote is
+    considered stale, and has to be rebuilt, once a project file it has imported or a lock file
+    changes.
+    """
+
+    def __init__(self, interpreter: list[str], modules: list[str]) -> None:
+        """
+        `interpreter` is the python executable along with its options, `modules` are the names of
+        the modules to preload.
+        """
+        self.command = interpreter + [str(WORKER_PATH), *modules]
+        self.modules = modules
+        self.files: set[str] = set()
+        self.process: subprocess.Popen | None = None
+        self.__control: socket.socket | None = None
+        self.__child_end: socket.socket | None = None
+        self.__ready = Event()
+        self.__spawned: Queue[dict] = Queue()
+        self.__children: dict[int, ForkedProcess] = {}
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def prepare(self) -> tuple[int, dict[str, str]]:
+        """
+        Creates the control socket for a new zygote process. Returns the file descriptor to pass to
+        the process, and the environment to start it with.
+        """
+        self.__control, self.__child_end = socket.socketpair()
+        os.set_inheritable(self.__child_end.fileno(), True)
+        self.__ready = Event()
+        self.files = set()
+        return self.__child_end.fileno(), dict(
+            os.environ, **{FD_ENV: str(self.__child_end.fileno())}
+        )
+
+    def attach(self, process: subprocess.Popen) -> None:
+        """
+        Takes over the zygote process started with the arguments returned by `prepare`.
+        """
+        self.process = process
+        if self.__child_end:
+            self.__child_end.close()
+            self.__child_end = None
+        Thread(
+            target=self.__read_events, args=(self.__control, self.__ready), daemon=True
+        ).start()
+
+    def wait_ready(self) -> bool:
+        """
+        Blocks until the zygote has imported the preloaded modules. Returns `False` if it didn't
+        make it.
+        """
+        return self.__ready.wait(READY_TIMEOUT) and self.alive
+
+    def fork(self, argv: list[str], env: dict[str, str]) -> ForkedProcess | None:
+        """
+        Forks a child running `argv` (a script path or `-m module` along with its arguments) with
+        `env` as its environment. Returns `None` if the zygote couldn't fork.
+        """
+        if not self.__control or not self.alive:
+            return None
+        request = {"argv": argv, "env": env}
+        try:
+            self.__control.sendall(json.dumps(request).encode() + b"\n")
+            reply = self.__spawned.get(timeout=FORK_TIMEOUT)
+        except (OSError, Empty):
+            return None
+        if reply["event"] != "spawned":
+            log("error", f"the zygote couldn't fork: {reply.get('reason')}")
+            return None
+        return self.__children.setdefault(reply["pid"], ForkedProcess(reply["pid"]))
+
+    def is_stale(self, paths: list[str], directories: list[str] | None = None) -> bool:
+        """
+        Returns `True` if any of the changed `paths` was imported by the zygote, or is a lock file,
+        or if any of the `directories` in which unknown files changed contains an imported module.
+        """
+        for directory in directories or ():
+            prefix = os.path.join(os.path.abspath(directory), "")
+            if any(file.startswith(prefix) for file in self.files):
+                return True
+        for path in paths:
+            if os.path.abspath(path) in self.files:
+                return True
+            name = os.path.basename(path)
+            if any(fnmatch(name, pattern) for pattern in LOCK_FILE_PATTERNS):
+                return True
+        return False
+
+    def close(self) -> None:
+        """
+        Stops the zygote. The children it has forked are not affected.
+        """
+        if self.__control:
+            # the zygote exits once the control socket is closed
+            try:
+                self.__control.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.__control.close()
+            self.__control = None
+        if self.process:
+            try:
+                self.process.wait(STOP_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+            self.process = None
+
+    def __read_events(self, control: socket.socket, ready: Event) -> None:
+        try:
+            with control.makefile("rb") as stream:
+                for line in stream:
+                    self.__handle_event(json.loads(line))
+        except (OSError, ValueError):
+            pass
+        finally:
+            # unblock anyone waiting for a zygote which has died
+            ready.set()
+
+    def __handle_event(self, event: dict) -> None:
+        match event["event"]:
+            case "ready":
+                self.files = set(event["files"])
+                for failure in event["failed"]:
+                    log("error", f"the zygote couldn't preload {failure}")
+                log(
+                    "stella",
+                    f"zygote ready, preloaded {len(self.modules)} module(s) in {event['seconds'] * 1000:.0f} ms",
+                )
+                self.__ready.set()
+            case "spawned" | "error":
+                self.__spawned.put(event)
+            case "exited":
+                child = self.__children.pop(event["pid"], None)
+                if child is None:
+                    child = self.__children[event["pid"]] = ForkedProcess(event["pid"])
+                child.set_exited(event["code"])
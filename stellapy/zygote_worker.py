@@ -0,0 +1,131 @@
+"""
+The zygote process of stella's fork server mode.
+
+It imports the modules given as arguments (`zygote_worker.py pandas sqlalchemy ...`) once, and then
+forks a fresh child running the app for every request stella sends over the control socket, so the
+children start with the heavy modules already imported.
+
+This file is executed by path with the app's own interpreter, so it must only use the standard
+library and must not import anything from stellapy. It also mustn't start any threads, since only
+the forking thread survives in the children.
+"""
+
+import importlib
+import json
+import os
+import runpy
+import select
+import socket
+import sys
+import time
+
+FD_ENV = "STELLA_ZYGOTE_FD"
+REAP_INTERVAL = 0.05  # seconds
+
+
+def _send(control, message):
+    control.sendall(json.dumps(message).encode() + b"\n")
+
+
+def _project_files(root):
+    """
+    Returns the files of the imported modules which live in the project, changes to which make the
+    zygote stale.
+    """
+    files = set()
+    for module in list(sys.modules.values()):
+        path = getattr(module, "__file__", None)
+        if path:
+            path = os.path.abspath(path)
+            if path.startswith(root + os.sep) and "site-packages" not in path:
+                files.add(path)
+    return sorted(files)
+
+
+def _reap(control):
+    while True:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+        if pid == 0:
+            return
+        code = os.waitstatus_to_exitcode(status)
+        _send(control, {"event": "exited", "pid": pid, "code": code})
+
+
+def _run_child(request):
+    """
+    Runs the app in a freshly forked child, the same way `python` would.
+    """
+    os.setsid()
+    os.environ.clear()
+    os.environ.update(request["env"])
+    if "LISTEN_FDS" in os.environ:
+        # socket activation, the passed socket is meant for this process
+        os.environ["LISTEN_PID"] = str(os.getpid())
+    args = request["argv"]
+    if args[0] == "-m":
+        sys.argv = args[1:]
+        sys.path[0] = os.getcwd()
+        runpy.run_module(args[1], run_name="__main__", alter_sys=True)
+    else:
+        sys.argv = list(args)
+        sys.path[0] = os.path.dirname(os.path.abspath(args[0]))
+        runpy.run_path(args[0], run_name="__main__")
+
+
+def main():
+    control = socket.socket(fileno=int(os.environ.pop(FD_ENV)))
+    root = os.path.abspath(os.getcwd())
+    # so that project modules can be preloaded as well
+    sys.path[0] = root
+    started = time.perf_counter()
+    failed = []
+    for name in sys.argv[1:]:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            failed.append(f"{name}: {e!r}")
+    _send(
+        control,
+        {
+            "event": "ready",
+            "seconds": time.perf_counter() - started,
+            "failed": failed,
+            "files": _project_files(root),
+        },
+    )
+
+    buffer = b""
+    while True:
+        readable, _, _ = select.select([control], [], [], REAP_INTERVAL)
+        try:
+            _reap(control)
+            data = control.recv(65536) if readable else None
+        except OSError:
+            data = b""
+        if data is None:
+            continue
+        if not data:
+            # stella went away
+            return
+        buffer += data
+        while b"\n" in buffer:
+            line, buffer = buffer.split(b"\n", 1)
+            request = json.loads(line)
+            try:
+                pid = os.fork()
+            except OSError as e:
+                _send(control, {"event": "error", "reason": str(e)})
+                continue
+            if pid == 0:
+                control.close()
+                # exits through the interpreter once the app is done, like a regular process
+                _run_child(request)
+                return
+            _send(control, {"event": "spawned", "pid": pid})
+
+
+if __name__ == "__main__":
+    main()